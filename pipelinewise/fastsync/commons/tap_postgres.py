@@ -9,7 +9,8 @@ import psycopg2
 import psycopg2.extras
 
 from argparse import Namespace
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 
 from . import utils, split_gzip
@@ -472,6 +473,115 @@ class FastSyncTapPostgres:
             'primary_key': self.get_primary_keys(table_name),
         }
 
+    def get_table_slices(self, table_name: str, slices: int) -> List[str]:
+        """
+        Split a table into ranges of about the same size that can be exported concurrently
+
+        Tables with a single integer primary key column are split by primary key ranges, every other
+        table by ranges of physical blocks (ctid). The first and last ranges are open-ended to include
+        the rows added since the boundaries were calculated. Ranges of blocks are scanned without reading
+        the whole table only from PostgreSQL 14, these tables are not split on older servers.
+        Args:
+            table_name: Fully qualified table name to split
+            slices: Max number of ranges
+
+        Returns: List of sql conditions, one per range. Single empty condition if the table can't be split
+        """
+        schema_name, table_name = table_name.split('.')
+
+        primary_key = self.query(
+            f"""SELECT pg_attribute.attname, format_type(pg_attribute.atttypid, pg_attribute.atttypmod)
+                    FROM pg_index
+                    JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid
+                        AND pg_attribute.attnum = any(pg_index.indkey)
+                    WHERE pg_index.indrelid = '{schema_name}."{table_name}"'::regclass
+                    AND pg_index.indisprimary"""
+        )
+
+        if len(primary_key) == 1 and primary_key[0][1] in ('smallint', 'integer', 'bigint'):
+            column = f'"{primary_key[0][0]}"'
+            min_value, max_value = self.query(
+                f'SELECT MIN({column}), MAX({column}) FROM {schema_name}."{table_name}"'
+            )[0]
+            boundary_to_sql = str
+        else:
+            if self.query("SELECT current_setting('server_version_num')::int")[0][0] < 140000:
+                LOGGER.warning('Not splitting %s.%s, ctid ranges are scanned by reading the whole table '
+                            'before PostgreSQL 14', schema_name, table_name)
+                return ['']
+
+            column = 'ctid'
+            min_value = 0
+            max_value = self.query(
+                f"SELECT pg_relation_size('{schema_name}.\"{table_name}\"'::regclass) "
+                f"/ current_setting('block_size')::int - 1"
+            )[0][0]
+            boundary_to_sql = "'({},0)'::tid".format
+
+        if min_value is None or max_value is None or max_value <= min_value:
+            return ['']
+
+        range_size = max_value - min_value + 1
+        boundaries = sorted({min_value + range_size * i // slices for i in range(1, slices)} - {min_value})
+
+        conditions = []
+        for lower, upper in zip([None] + boundaries, boundaries + [None]):
+            condition = []
+            if lower is not None:
+                condition.append(f'{column} >= {boundary_to_sql(lower)}')
+            if upper is not None:
+                condition.append(f'{column} < {boundary_to_sql(upper)}')
+            conditions.append(' AND '.join(condition))
+
+        return conditions
+
+    def export_snapshot(self):
+        """
+        Open a connection with a repeatable read transaction and export its snapshot. Transactions
+        of other connections see the same data after importing the snapshot, while the returned
+        connection is open
+
+        Returns: tuple of the connection and the snapshot id
+        """
+        conn = self.get_connection(self.connection_config, prioritize_primary=False)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+                cur.execute('SELECT pg_export_snapshot()')
+                snapshot_id = cur.fetchone()[0]
+        except Exception:
+            conn.close()
+            raise
+
+        LOGGER.info('Exported snapshot: %s', snapshot_id)
+        return conn, snapshot_id
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def copy_slice(self, sql, path, snapshot_id, chunk_size_mb, max_chunks, compress):
+        """
+        Export one slice of a table on a new connection, in the transaction snapshot of snapshot_id
+        """
+        conn = self.get_connection(self.connection_config, prioritize_primary=False)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+                cur.execute('SET TRANSACTION SNAPSHOT %s', (snapshot_id,))
+
+                gzip_splitter = split_gzip.open(
+                    path,
+                    mode='wb',
+                    chunk_size_mb=chunk_size_mb,
+                    max_chunks=max_chunks,
+                    compress=compress,
+                )
+
+                with gzip_splitter as split_gzip_files:
+                    cur.copy_expert(sql, split_gzip_files, size=131072)
+
+                cur.execute('COMMIT')
+        finally:
+            conn.close()
+
     # pylint: disable=too-many-arguments, too-many-locals, too-many-positional-arguments
     def copy_table(
         self,
@@ -484,6 +594,7 @@ class FastSyncTapPostgres:
         split_file_max_chunks=20,
         compress=True,
         where_clause_sql='',
+        slices=1,
     ):
         """
         Export data from table to a zipped csv
@@ -494,6 +605,8 @@ class FastSyncTapPostgres:
                                with -partXYZ postfix in the filename. (Default: False)
             split_file_chunk_size_mb: File chunk sizes if `split_large_files` enabled. (Default: 1000)
             split_file_max_chunks: Max number of chunks if `split_large_files` enabled. (Default: 20)
+            slices: Split the table to this many ranges and export them concurrently into separate zip files
+                    with .sliceXYZ postfix in the filename, in the same snapshot. (Default: 1)
         """
         table_columns = self.get_table_columns(table_name, max_num, date_type)
         column_safe_sql_values = [c.get('safe_sql_value') for c in table_columns]
@@ -502,6 +615,8 @@ class FastSyncTapPostgres:
         if len(column_safe_sql_values) == 0:
             raise Exception(f'{table_name} table not found.')
 
+        slice_conditions = self.get_table_slices(table_name, slices) if slices > 1 else ['']
+
         schema_name, table_name = table_name.split('.')
 
         column_safe_sql_values = column_safe_sql_values + [
@@ -510,17 +625,51 @@ class FastSyncTapPostgres:
             'null _SDC_DELETED_AT'
         ]
 
-        sql = f"""COPY (SELECT {','.join(column_safe_sql_values)}
-        FROM {schema_name}."{table_name}"{where_clause_sql}) TO STDOUT with CSV DELIMITER ','
+        def copy_sql(slice_condition=''):
+            slice_where_clause_sql = where_clause_sql
+            if slice_condition:
+                slice_where_clause_sql = (
+                    f'{where_clause_sql} AND ({slice_condition})'
+                    if where_clause_sql
+                    else f' WHERE {slice_condition}'
+                )
+
+            return f"""COPY (SELECT {','.join(column_safe_sql_values)}
+        FROM {schema_name}."{table_name}"{slice_where_clause_sql}) TO STDOUT with CSV DELIMITER ','
         """
 
+        max_chunks = split_file_max_chunks if split_large_files else 0
+
+        if len(slice_conditions) > 1:
+            snapshot_conn, snapshot_id = self.export_snapshot()
+            try:
+                with ThreadPoolExecutor(max_workers=len(slice_conditions)) as executor:
+                    futures = []
+                    for slice_num, slice_condition in enumerate(slice_conditions, start=1):
+                        sql = copy_sql(slice_condition)
+                        LOGGER.info('Exporting data: %s', sql)
+                        futures.append(
+                            executor.submit(self.copy_slice, sql, f'{path}.slice{slice_num:05d}', snapshot_id,
+                                            split_file_chunk_size_mb, max_chunks, compress)
+                        )
+
+                    # Raise the first error of the slices
+                    for future in futures:
+                        future.result()
+            finally:
+                snapshot_conn.close()
+
+            return
+
+        sql = copy_sql()
+
         LOGGER.info('Exporting data: %s', sql)
 
         gzip_splitter = split_gzip.open(
             path,
             mode='wb',
             chunk_size_mb=split_file_chunk_size_mb,
-            max_chunks=split_file_max_chunks if split_large_files else 0,
+            max_chunks=max_chunks,
             compress=compress,
         )
 
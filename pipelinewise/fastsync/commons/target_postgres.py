@@ -223,7 +223,7 @@ class FastSyncTargetPostgres:
             table_dict.get('schema_name'), table_dict.get('table_name')
         )
 
-        trans_cols = TransformationHelper.get_trans_in_sql_flavor(
+        trans_cols = TransformationHelper.get_column_trans_in_sql_flavor(
             tap_stream_name_by_table_name, transformations, SQLFlavor('postgres')
         )
 
@@ -246,47 +246,18 @@ class FastSyncTargetPostgres:
 
     def __apply_transformations(self, transformations, target_schema, table_name):
         """
-        Generate and execute the SQL queries based on the given transformations.
+        Generate and execute the SQL query based on the given transformations.
+
+        Every column is transformed by one UPDATE statement, conditional transformations are
+        CASE WHEN expressions, to rewrite the table only once.
         Args:
-            transformations: List of dictionaries in the form {"trans": "", conditions: "... AND ..."}
+            transformations: Dictionary of safe column names and their transformed sql expression
             target_schema: name of the target schema where the table lives
             table_name: the table name on which we want to apply the transformations
         """
         full_qual_table_name = f'"{target_schema.lower()}"."{table_name.lower()}"'
 
         if transformations:
-            all_cols_update_sql = ''
-
-            # Conditional transformations will have to be executed one at time separately
-
-            for trans_item in transformations:
-
-                # If we have conditions, then we need to construct the query and execute it to transform the
-                # single column conditionally
-                if trans_item['conditions']:
-                    sql = (
-                        f'UPDATE {full_qual_table_name} '
-                        f'SET {trans_item["trans"]} WHERE {trans_item["conditions"]};'
-                    )
-
-                    self.query(sql)
-
-                # Otherwise, we can add this column to a general UPDATE query with no predicates
-                else:
-
-                    # if the variable is empty, then initialize it otherwise append the
-                    # current transformation to it
-                    if not all_cols_update_sql:
-                        all_cols_update_sql = trans_item['trans']
-                    else:
-                        all_cols_update_sql = (
-                            f'{all_cols_update_sql}, {trans_item["trans"]}'
-                        )
-
-            # If we have some non-conditional transformations then construct and execute a query
-            if all_cols_update_sql:
-                all_cols_update_sql = (
-                    f'UPDATE {full_qual_table_name} SET {all_cols_update_sql};'
-                )
+            set_sql = ', '.join(f'{column} = {trans}' for column, trans in transformations.items())
 
-                self.query(all_cols_update_sql)
+            self.query(f'UPDATE {full_qual_table_name} SET {set_sql};')
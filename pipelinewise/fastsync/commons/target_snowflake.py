@@ -1,6 +1,7 @@
 import logging
 import os
 import json
+import re
 import boto3
 import snowflake.connector
 
@@ -28,6 +29,8 @@ class FastSyncTargetSnowflake:
     def __init__(self, connection_config, transformation_config=None):
         self.connection_config = connection_config
         self.transformation_config = transformation_config
+        # Temp tables that got the transformations applied by COPY at load time
+        self.transformed_tables = set()
 
         # Get the required parameters from config file and/or environment variables
         aws_profile = self.connection_config.get('aws_profile') or os.environ.get(
@@ -323,8 +326,16 @@ class FastSyncTargetSnowflake:
         inserts = 0
 
         stage = self.connection_config['stage']
+        source = f'\'@{stage}/{s3_key}\''
+
+        # Obfuscate the columns of temp tables in a single pass while loading the file
+        column_trans = self.__get_column_transformations(table_name) if is_temporary else {}
+        if column_trans:
+            columns = self.__get_table_columns(target_schema, target_table)
+            source = f'(SELECT {self.__column_trans_to_copy_select(columns, column_trans)} FROM {source} t)'
+
         sql = (
-            f'COPY INTO {target_schema}."{target_table.upper()}" FROM \'@{stage}/{s3_key}\''
+            f'COPY INTO {target_schema}."{target_table.upper()}" FROM {source}'
             f' FILE_FORMAT = (type=CSV escape=NONE escape_unenclosed_field=\'\\x1e\''
             f' field_optionally_enclosed_by=\'\"\' skip_header={int(skip_csv_header)}'
             f' compression=GZIP binary_format=HEX)'
@@ -337,6 +348,9 @@ class FastSyncTargetSnowflake:
         if len(results) > 0:
             inserts = sum([file_part.get('rows_loaded', 0) for file_part in results])
 
+        if column_trans:
+            self.transformed_tables.add((target_schema.upper(), target_table.upper()))
+
         LOGGER.info(
             'Loading into %s."%s": %s',
             target_schema,
@@ -400,26 +414,16 @@ class FastSyncTargetSnowflake:
 
         table_dict = utils.tablename_to_dict(table_name)
         temp_table = table_dict.get('temp_table_name')
-        transformations = self.transformation_config.get('transformations', [])
 
-        # Input table_name is formatted as {{schema}}.{{table}}
-        # Stream name in taps transformation.json is formatted as {{schema}}-{{table}}
-        #
-        # We need to convert to the same format to find the transformation
-        # has that has to be applied
-        tap_stream_name_by_table_name = (
-            '{}-{}'.format(table_dict['schema_name'], table_dict['table_name'])
-            if table_dict['schema_name'] is not None
-            else table_dict['table_name']
-        )
+        # Transformations are applied by copy_to_table if the columns were transformed at load time
+        if (target_schema.upper(), temp_table.upper()) in self.transformed_tables:
+            LOGGER.info('Obfuscation rules applied at load time.')
+            return
 
         # Find obfuscation rules for the current table
-        # trans_map = self.__get_stream_transformation_map(tap_stream_name_by_table_name, transformations)
-        trans_map = TransformationHelper.get_trans_in_sql_flavor(
-            tap_stream_name_by_table_name, transformations, SQLFlavor('snowflake')
-        )
+        column_trans = self.__get_column_transformations(table_name)
 
-        self.__apply_transformations(trans_map, target_schema, temp_table)
+        self.__apply_transformations(column_trans, target_schema, temp_table)
 
         LOGGER.info('Obfuscation rules applied.')
 
@@ -475,57 +479,92 @@ class FastSyncTargetSnowflake:
             query = f'ALTER TABLE {schema}."{table_name.upper()}" ADD {add_clause}'
             self.query(query)
 
-    def __apply_transformations(
-        self, transformations: List[Dict], target_schema: str, table_name: str
-    ) -> None:
+    def __get_column_transformations(self, table_name: str) -> Dict[str, str]:
+        """
+        Find the transformations of the given table as one sql expression per column
+        Args:
+            table_name: table name
+
+        Returns: Dictionary of safe column names and their transformed sql expression
+        """
+        table_dict = utils.tablename_to_dict(table_name)
+        transformations = (self.transformation_config or {}).get('transformations', [])
+
+        # Input table_name is formatted as {{schema}}.{{table}}
+        # Stream name in taps transformation.json is formatted as {{schema}}-{{table}}
+        #
+        # We need to convert to the same format to find the transformation
+        # has that has to be applied
+        tap_stream_name_by_table_name = (
+            '{}-{}'.format(table_dict['schema_name'], table_dict['table_name'])
+            if table_dict['schema_name'] is not None
+            else table_dict['table_name']
+        )
+
+        return TransformationHelper.get_column_trans_in_sql_flavor(
+            tap_stream_name_by_table_name, transformations, SQLFlavor('snowflake')
+        )
+
+    def __get_table_columns(self, target_schema: str, table_name: str) -> Dict[str, str]:
+        """
+        Get the column names and data types of a table in the order of the columns in the table
         """
-        Generate and execute the SQL queries based on the given transformations.
+        results = self.query(
+            f'DESC TABLE {target_schema}."{table_name.upper()}"',
+            query_tag_props={'schema': target_schema, 'table': table_name},
+        )
+
+        return {column['name']: column['type'] for column in results}
+
+    @staticmethod
+    def __column_trans_to_copy_select(columns: Dict[str, str], column_trans: Dict[str, str]) -> str:
+        """
+        Generate the select list of a COPY transformation that loads the columns of the CSV file
+        by position, replacing the column names in the transformed expressions with the column positions.
+        Columns of the CSV file are strings, they are cast to the data type of the column in the
+        transformed expressions to evaluate them the same way as on the loaded table.
         Args:
-            transformations: List of dictionaries in the form {"trans": "", conditions: "... AND ..."}
+            columns: column names and data types of the table in the order of the columns in the CSV file
+            column_trans: Dictionary of safe column names and their transformed sql expression
+
+        Returns: comma separated list of the column values or their transformed expression
+        """
+        positions = {f'"{column}"': f't.${position}' for position, column in enumerate(columns, start=1)}
+        typed_values = {
+            column: f'PARSE_JSON({value})::{data_type}'
+            if data_type in ('VARIANT', 'OBJECT', 'ARRAY')
+            else f'{value}::{data_type}'
+            for (column, value), data_type in zip(positions.items(), columns.values())
+        }
+
+        def column_to_typed_value(match):
+            # String literals are matched as well to leave double quoted text in them untouched
+            return typed_values.get(match.group(0), match.group(0))
+
+        return ', '.join(
+            re.sub(r"'(?:[^']|'')*'|\"[^\"]+\"", column_to_typed_value, column_trans[column])
+            if column in column_trans
+            else value
+            for column, value in positions.items()
+        )
+
+    def __apply_transformations(self, transformations: Dict[str, str], target_schema: str, table_name: str) -> None:
+        """
+        Generate and execute the SQL query based on the given transformations.
+
+        Every column is transformed by one UPDATE statement, conditional transformations are
+        CASE WHEN expressions, to rewrite the table only once.
+        Args:
+            transformations: Dictionary of safe column names and their transformed sql expression
             target_schema: name of the target schema where the table lives
             table_name: the table name on which we want to apply the transformations
         """
         full_qual_table_name = f'"{target_schema.upper()}"."{table_name.upper()}"'
 
         if transformations:
-            all_cols_update_sql = ''
-
-            # Conditional transformations will have to be executed one at time separately
-
-            for trans_item in transformations:
-
-                # If we have conditions, then we need to construct the query and execute it to transform the
-                # single column conditionally
-                if trans_item['conditions']:
-                    sql = (
-                        f'UPDATE {full_qual_table_name} '
-                        f'SET {trans_item["trans"]} WHERE {trans_item["conditions"]};'
-                    )
-
-                    self.query(
-                        sql,
-                        query_tag_props={'schema': target_schema, 'table': table_name},
-                    )
-
-                # Otherwise, we can add this column to a general UPDATE query with no predicates
-                else:
-
-                    # if the variable is empty, then initialize it otherwise append the
-                    # current transformation to it
-                    if not all_cols_update_sql:
-                        all_cols_update_sql = trans_item['trans']
-                    else:
-                        all_cols_update_sql = (
-                            f'{all_cols_update_sql}, {trans_item["trans"]}'
-                        )
-
-            # If we have some non-conditional transformations then construct and execute a query
-            if all_cols_update_sql:
-                all_cols_update_sql = (
-                    f'UPDATE {full_qual_table_name} SET {all_cols_update_sql};'
-                )
-
-                self.query(
-                    all_cols_update_sql,
-                    query_tag_props={'schema': target_schema, 'table': table_name},
-                )
+            set_sql = ', '.join(f'{column} = {trans}' for column, trans in transformations.items())
+
+            self.query(
+                f'UPDATE {full_qual_table_name} SET {set_sql};',
+                query_tag_props={'schema': target_schema, 'table': table_name},
+            )
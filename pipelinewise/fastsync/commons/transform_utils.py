@@ -86,67 +86,123 @@ class TransformationHelper:
                 # get the conditions in "when" and convert them to their SF sql equivalent
                 conditions = cls.__conditions_to_sql(transform_conditions, sql_flavor)
 
-                if transform_type == TransformationType.SET_NULL:
-                    trans_map.append(
-                        {'trans': f'{column} = NULL', 'conditions': conditions}
-                    )
+                trans_map.append(
+                    {
+                        'trans': f'{column} = {cls.__trans_to_sql(transform_type, column, sql_flavor)}',
+                        'conditions': conditions,
+                    }
+                )
 
-                elif transform_type == TransformationType.HASH:
+        return trans_map
 
-                    trans_map.append(
-                        {
-                            'trans': cls.__hash_to_sql(column, sql_flavor),
-                            'conditions': conditions,
-                        }
-                    )
+    @classmethod
+    def get_column_trans_in_sql_flavor(
+        cls, stream_name: str, transformations: List[Dict], sql_flavor: SQLFlavor
+    ) -> Dict[str, str]:
 
-                elif transform_type.value.startswith('HASH-SKIP-FIRST-'):
+        """
+        Find the transformations to apply to the given stream and merge them into one sql expression
+        per column, to transform every column of a table in a single pass.
 
-                    trans_map.append(
-                        {
-                            'trans': cls.__hash_skip_first_to_sql(
-                                transform_type, column, sql_flavor
-                            ),
-                            'conditions': conditions,
-                        }
-                    )
+        Conditional transformations are expressed as CASE WHEN <conditions> THEN <transformed> ELSE <column> END.
+        Transformations of the same column are nested in the order they used to be applied by separate
+        UPDATE statements: conditional ones first, then the ones without conditions. Conditions are
+        evaluated on the values transformed by the conditional transformations before them, the same
+        way as the separate UPDATE statements saw the result of the previous ones.
 
-                elif transform_type == TransformationType.MASK_DATE:
+        Args:
+            sql_flavor: sql flavor to use when converting the transformations into sql
+            stream_name: the full stream name in the format {schema}-{table}
+            transformations: List of transformations
 
-                    trans_map.append(
-                        {
-                            'trans': cls.__mask_date_to_sql(column, sql_flavor),
-                            'conditions': conditions,
-                        }
-                    )
+        Returns: dictionary of safe column names and their sql expression in the form
+                {
+                    '"COLUMN"': 'CASE WHEN ... AND ... THEN ... ELSE "COLUMN" END',
+                }
+        """
+        stream_transformations = [
+            trans_item
+            for trans_item in transformations
+            if trans_item.get('tap_stream_name').lower() == stream_name.lower()
+        ]
+
+        # Conditional transformations first, sorted() is stable and keeps the order of the config
+        stream_transformations = sorted(
+            stream_transformations,
+            key=lambda trans_item: not cls.__conditions_to_sql(trans_item.get('when'), sql_flavor),
+        )
+
+        column_trans = {}
+
+        for trans_item in stream_transformations:
+            transform_type = TransformationType(trans_item['type'])
+
+            # Make the field id safe in case it's a reserved word
+            column = cls.__safe_column(trans_item['field_id'], sql_flavor)
+            conditions = cls.__conditions_to_sql(trans_item.get('when'), sql_flavor, column_trans)
+
+            # Transform the result of the previous transformations of the same column
+            value = column_trans.get(column, column)
+            trans = cls.__trans_to_sql(
+                transform_type, value if value == column else f'({value})', sql_flavor
+            )
 
-                elif transform_type == TransformationType.MASK_NUMBER:
-                    trans_map.append(
-                        {'trans': f'{column} = 0', 'conditions': conditions}
-                    )
+            if conditions:
+                trans = f'CASE WHEN {conditions} THEN {trans} ELSE {value} END'
 
-                elif transform_type.value.startswith('MASK-STRING-SKIP-ENDS-'):
+            column_trans[column] = trans
 
-                    trans_map.append(
-                        {
-                            'trans': cls.__mask_string_skip_ends_to_sql(
-                                transform_type, column, sql_flavor
-                            ),
-                            'conditions': conditions,
-                        }
-                    )
+        return column_trans
 
-                elif transform_type == TransformationType.MASK_HIDDEN:
-                    trans_map.append(
-                        {'trans': f"{column} = 'hidden'", 'conditions': conditions}
-                    )
+    @classmethod
+    # pylint: disable=W0238  # False positive when it is used by another classmethod
+    def __trans_to_sql(
+        cls, transform_type: TransformationType, column: str, sql_flavor: SQLFlavor
+    ) -> str:
+        """
+        convert a transformation into the sql expression of the transformed column value
+        Args:
+            transform_type: the transformation to apply
+            column: column, or sql expression, to apply the transformation to
+            sql_flavor: the sql flavor to use
 
-        return trans_map
+        Returns: sql string of the transformed value
+        """
+        if transform_type == TransformationType.SET_NULL:
+            trans = 'NULL'
+
+        elif transform_type == TransformationType.HASH:
+            trans = cls.__hash_to_sql(column, sql_flavor)
+
+        elif transform_type.value.startswith('HASH-SKIP-FIRST-'):
+            trans = cls.__hash_skip_first_to_sql(transform_type, column, sql_flavor)
+
+        elif transform_type == TransformationType.MASK_DATE:
+            trans = cls.__mask_date_to_sql(column, sql_flavor)
+
+        elif transform_type == TransformationType.MASK_NUMBER:
+            trans = '0'
+
+        elif transform_type.value.startswith('MASK-STRING-SKIP-ENDS-'):
+            trans = cls.__mask_string_skip_ends_to_sql(transform_type, column, sql_flavor)
+
+        elif transform_type == TransformationType.MASK_HIDDEN:
+            trans = "'hidden'"
+
+        else:
+            raise NotImplementedError(
+                f'{transform_type.value} transformation in {sql_flavor.value} SQL flavor not implemented!'
+            )
+
+        return trans
 
     @classmethod
     # pylint: disable=W0238  # False positive when it is used by another classmethod
     def __conditions_to_sql(
-        cls, transform_conditions: List[Dict], sql_flavor: SQLFlavor
+        cls,
+        transform_conditions: List[Dict],
+        sql_flavor: SQLFlavor,
+        column_values: Optional[Dict[str, str]] = None,
     ) -> Optional[str]:
         """
         Convert the conditional transformations into equivalent form in SF SQL.
@@ -165,6 +221,9 @@ class TransformationHelper:
                 }
 
                 if no regex_match or equals keys are found, the transformation condition is skipped
+            sql_flavor: the sql flavor to use
+            column_values: optional dictionary of safe column names and the sql expression to test
+                           instead of the column
 
         Returns: None if no transformations, otherwise a concatenated string of AND conditions
         """
@@ -174,6 +233,10 @@ class TransformationHelper:
         conditions = []
 
         for condition in transform_conditions:
+            # Test the transformed value of the column if there is one
+            column = cls.__safe_column(condition['column'], sql_flavor)
+            column = f'({column_values[column]})' if column in (column_values or {}) else column
+
             # for each condition create the sql equivalent of it
             if 'equals' in condition:
                 if condition['equals'] is None:
@@ -202,7 +265,7 @@ class TransformationHelper:
 
                 elif sql_flavor == SQLFlavor.BIGQUERY:
                     conditions.append(
-                        f"REGEXP_CONTAINS({cls.__safe_column(condition['column'], sql_flavor)}, {value})"
+                        f'REGEXP_CONTAINS({column}, {value})'
                     )
                     continue
 
@@ -215,9 +278,7 @@ class TransformationHelper:
             else:
                 continue
 
-            conditions.append(
-                f"({cls.__safe_column(condition['column'], sql_flavor)} {operator} {value})"
-            )
+            conditions.append(f'({column} {operator} {value})')
 
         return ' AND '.join(conditions)
 
@@ -253,13 +314,13 @@ class TransformationHelper:
         Returns: sql string equivalent of the hash
         """
         if sql_flavor == SQLFlavor.SNOWFLAKE:
-            trans = f'{column} = SHA2({column}, 256)'
+            trans = f'SHA2({column}, 256)'
 
         elif sql_flavor == SQLFlavor.POSTGRES:
-            trans = f'{column} = ENCODE(DIGEST({column}, \'sha256\'), \'hex\')'
+            trans = f'ENCODE(DIGEST({column}, \'sha256\'), \'hex\')'
 
         elif sql_flavor == SQLFlavor.BIGQUERY:
-            trans = f'{column} = TO_BASE64(SHA256({column}))'
+            trans = f'TO_BASE64(SHA256({column}))'
 
         else:
             raise NotImplementedError(
@@ -287,16 +348,16 @@ class TransformationHelper:
         skip_first_n = transform_type.value[-1]
 
         if sql_flavor == SQLFlavor.SNOWFLAKE:
-            trans = '{0} = CONCAT(SUBSTRING({0}, 1, {1}), SHA2(SUBSTRING({0}, {1} + 1), 256))'.format(
+            trans = 'CONCAT(SUBSTRING({0}, 1, {1}), SHA2(SUBSTRING({0}, {1} + 1), 256))'.format(
                 column, skip_first_n
             )
         elif sql_flavor == SQLFlavor.POSTGRES:
             trans = (
-                '{0} = CONCAT(SUBSTRING({0}, 1, {1}), ENCODE(DIGEST(SUBSTRING({0}, {1} + 1), '
+                'CONCAT(SUBSTRING({0}, 1, {1}), ENCODE(DIGEST(SUBSTRING({0}, {1} + 1), '
                 '\'sha256\'), \'hex\'))'.format(column, skip_first_n)
             )
         elif sql_flavor == SQLFlavor.BIGQUERY:
-            trans = '{0} = CONCAT(SUBSTRING({0}, 1, {1}), TO_BASE64(SHA256(SUBSTRING({0}, {1} + 1))))'.format(
+            trans = 'CONCAT(SUBSTRING({0}, 1, {1}), TO_BASE64(SHA256(SUBSTRING({0}, {1} + 1))))'.format(
                 column, skip_first_n
             )
         else:
@@ -322,14 +383,14 @@ class TransformationHelper:
         """
         if sql_flavor == SQLFlavor.SNOWFLAKE:
             trans = (
-                f'{column} = TIMESTAMP_NTZ_FROM_PARTS('
+                f'TIMESTAMP_NTZ_FROM_PARTS('
                 f'DATE_FROM_PARTS(YEAR({column}), 1, 1),'
                 f'TO_TIME({column}))'
             )
 
         elif sql_flavor == SQLFlavor.POSTGRES:
             trans = (
-                '{0} = MAKE_TIMESTAMP('
+                'MAKE_TIMESTAMP('
                 'DATE_PART(\'year\', {0})::int, '
                 '1, '
                 '1, '
@@ -339,7 +400,7 @@ class TransformationHelper:
             )
         elif sql_flavor == SQLFlavor.BIGQUERY:
             trans = (
-                f'{column} = TIMESTAMP(DATETIME('
+                f'TIMESTAMP(DATETIME('
                 f'DATE(EXTRACT(YEAR FROM {column}), 1, 1),'
                 f'TIME({column})))'
             )
@@ -369,17 +430,17 @@ class TransformationHelper:
         skip_ends_n = int(transform_type.value[-1])
 
         if sql_flavor == SQLFlavor.SNOWFLAKE:
-            trans = '{0} = CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
+            trans = 'CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
                     'CONCAT(SUBSTRING({0}, 1, {1}), REPEAT(\'*\', LENGTH({0})-(2 * {1})), ' \
                     'SUBSTRING({0}, LENGTH({0})-{1}+1, {1})) ' \
                     'ELSE REPEAT(\'*\', LENGTH({0})) END'.format(column, skip_ends_n)
         elif sql_flavor == SQLFlavor.POSTGRES:
-            trans = '{0} = CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
+            trans = 'CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
                     'CONCAT(SUBSTRING({0}, 1, {1}), REPEAT(\'*\', LENGTH({0})-(2 * {1})), ' \
                     'SUBSTRING({0}, LENGTH({0})-{1}+1, {1})) ' \
                     'ELSE REPEAT(\'*\', LENGTH({0})) END'.format(column, skip_ends_n)
         elif sql_flavor == SQLFlavor.BIGQUERY:
-            trans = '{0} = CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
+            trans = 'CASE WHEN LENGTH({0}) > 2 * {1} THEN ' \
                     'CONCAT(SUBSTRING({0}, 1, {1}), REPEAT(\'*\', LENGTH({0})-(2 * {1})), ' \
                     'SUBSTRING({0}, LENGTH({0})-{1}+1, {1})) ' \
                     'ELSE REPEAT(\'*\', LENGTH({0})) END'.format(column, skip_ends_n)
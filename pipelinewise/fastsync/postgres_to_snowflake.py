@@ -6,6 +6,7 @@ import re
 import multiprocessing
 
 from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 from functools import partial
 from datetime import datetime
@@ -89,6 +90,7 @@ def sync_table(table: str, args: Namespace) -> Union[bool, str]:
     snowflake = FastSyncTargetSnowflake(args.target, args.transform)
     tap_id = args.target.get('tap_id')
     archive_load_files = args.target.get('archive_load_files', False)
+    table_slices = args.tap.get('fastsync_table_slices', 1)
 
     try:
         dbname = args.tap.get('dbname')
@@ -111,6 +113,7 @@ def sync_table(table: str, args: Namespace) -> Union[bool, str]:
             split_large_files=args.target.get('split_large_files'),
             split_file_chunk_size_mb=args.target.get('split_file_chunk_size_mb'),
             split_file_max_chunks=args.target.get('split_file_max_chunks'),
+            slices=table_slices,
         )
         file_exist = os.path.exists(filepath)
         file_parts = glob.glob(f'{filepath}*')
@@ -123,15 +126,18 @@ def sync_table(table: str, args: Namespace) -> Union[bool, str]:
         primary_key = snowflake_types.get('primary_key')
         postgres.close_connection()
 
-        # Uploading to S3
-        s3_keys = []
-        for file_part in file_parts:
-            s3_keys.append(snowflake.upload_to_s3(file_part, tmp_dir=args.temp_dir))
+        # Uploading to S3, the files of the table slices in parallel
+        def upload_file_part(file_part):
+            s3_key = snowflake.upload_to_s3(file_part, tmp_dir=args.temp_dir)
             os.remove(file_part)
+            return s3_key
 
-        # Create a pattern that match all file parts by removing multipart suffix
+        with ThreadPoolExecutor(max_workers=table_slices) as executor:
+            s3_keys = list(executor.map(upload_file_part, file_parts))
+
+        # Create a pattern that match all file parts by removing slice and multipart suffixes
         s3_key_pattern = (
-            re.sub(r'\.part\d*$', '', s3_keys[0])
+            re.sub(r'(\.slice\d*)?(\.part\d*)?$', '', s3_keys[0])
             if len(s3_keys) > 0
             else 'NO_FILES_TO_LOAD'
         )
@@ -14,7 +14,9 @@ from joblib import Parallel, delayed, parallel_backend
 from jsonschema import Draft7Validator, FormatChecker
 from singer import get_logger
 
+from target_postgres.connection_pool import close_connection_pools
 from target_postgres.db_sync import DbSync
+from target_postgres.table_cache import TableCache
 
 LOGGER = get_logger('target_postgres')
 
@@ -81,8 +83,37 @@ def emit_state(state):
         sys.stdout.flush()
 
 
+def get_schema_names_from_config(config):
+    """Get list of target schema names from config"""
+    default_target_schema = config.get('default_target_schema')
+    schema_mapping = config.get('schema_mapping', {})
+    schema_names = []
+
+    if default_target_schema:
+        schema_names.append(default_target_schema)
+
+    if schema_mapping:
+        for target in schema_mapping.values():
+            # Streams without target_schema in the mapping use the default target schema
+            if target.get('target_schema'):
+                schema_names.append(target['target_schema'])
+
+    return schema_names
+
+
+def get_table_cache(config):
+    """Load the schemas, tables and columns of every target schema by one catalog query.
+    Returns None if the table cache is disabled"""
+    if config.get('disable_table_cache'):
+        return None
+
+    LOGGER.info('Getting catalog objects from Postgres table cache...')
+    db = DbSync(config)  # pylint: disable=invalid-name
+    return TableCache(db.get_catalog(get_schema_names_from_config(config)))
+
+
 # pylint: disable=too-many-locals,too-many-branches,too-many-statements,invalid-name,consider-iterating-dictionary
-def persist_lines(config, lines) -> None:
+def persist_lines(config, lines, table_cache=None) -> None:
     """Read singer messages and process them line by line"""
     state = None
     flushed_state = None
@@ -93,6 +124,8 @@ def persist_lines(config, lines) -> None:
     row_count = {}
     stream_to_sync = {}
     total_row_count = {}
+    # Created indices and ON CONFLICT support of the tables, kept when a stream gets a new SCHEMA message
+    table_state = {}
     batch_size_rows = config.get('batch_size_rows', DEFAULT_BATCH_SIZE_ROWS)
 
     # Loop over lines from stdin
@@ -211,9 +244,9 @@ def persist_lines(config, lines) -> None:
             key_properties[stream] = o['key_properties']
 
             if config.get('add_metadata_columns') or config.get('hard_delete'):
-                stream_to_sync[stream] = DbSync(config, add_metadata_columns_to_schema(o))
+                stream_to_sync[stream] = DbSync(config, add_metadata_columns_to_schema(o), table_cache, table_state)
             else:
-                stream_to_sync[stream] = DbSync(config, o)
+                stream_to_sync[stream] = DbSync(config, o, table_cache, table_state)
 
             stream_to_sync[stream].create_schema_if_not_exists()
             stream_to_sync[stream].sync_table()
@@ -291,7 +324,8 @@ def flush_streams(
             row_count=row_count,
             db_sync=stream_to_sync[stream],
             delete_rows=config.get('hard_delete'),
-            temp_dir=config.get('temp_dir')
+            temp_dir=config.get('temp_dir'),
+            in_memory_copy=config.get('in_memory_copy')
         ) for stream in streams_to_flush)
 
     # reset flushed stream records to empty to avoid flushing same records
@@ -317,12 +351,13 @@ def flush_streams(
 
 
 # pylint: disable=too-many-arguments
-def load_stream_batch(stream, records_to_load, row_count, db_sync, delete_rows=False, temp_dir=None):
+def load_stream_batch(stream, records_to_load, row_count, db_sync, delete_rows=False, temp_dir=None,
+                      in_memory_copy=False):
     """Load a batch of records and do post load operations, like creating
     or deleting rows"""
     # Load into Postgres
     if row_count[stream] > 0:
-        flush_records(stream, records_to_load, row_count[stream], db_sync, temp_dir)
+        flush_records(stream, records_to_load, row_count[stream], db_sync, temp_dir, in_memory_copy)
 
     # Load finished, create indices if required
     db_sync.create_indices(stream)
@@ -336,8 +371,13 @@ def load_stream_batch(stream, records_to_load, row_count, db_sync, delete_rows=F
 
 
 # pylint: disable=unused-argument
-def flush_records(stream, records_to_load, row_count, db_sync, temp_dir=None):
-    """Take a list of records and load into database"""
+def flush_records(stream, records_to_load, row_count, db_sync, temp_dir=None, in_memory_copy=False):
+    """Take a list of records and load into database. Records are encoded directly into
+    the COPY command without a temporary CSV file if in_memory_copy is enabled"""
+    if in_memory_copy:
+        db_sync.load_records(records_to_load.values(), row_count)
+        return
+
     if temp_dir:
         temp_dir = os.path.expanduser(temp_dir)
         os.makedirs(temp_dir, exist_ok=True)
@@ -370,7 +410,11 @@ def main():
 
     # Consume singer messages
     singer_messages = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-    persist_lines(config, singer_messages)
+    try:
+        table_cache = get_table_cache(config)
+        persist_lines(config, singer_messages, table_cache)
+    finally:
+        close_connection_pools()
 
     LOGGER.debug("Exiting normally")
 
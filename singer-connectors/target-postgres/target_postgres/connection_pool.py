@@ -0,0 +1,100 @@
+"""Pool of Postgres connections shared by every DbSync instance of the process"""
+import threading
+
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+
+from singer import get_logger
+
+LOGGER = get_logger('target_postgres')
+
+DEFAULT_POOL_SIZE = 16  # Max number of open connections, sized from max_parallelism
+
+# One pool per distinct connection configuration
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def connection_kwargs(connection_config):
+    """Keyword arguments of psycopg2.connect from the connection configuration"""
+    kwargs = {
+        'host': connection_config['host'],
+        'dbname': connection_config['dbname'],
+        'user': connection_config['user'],
+        'password': connection_config['password'],
+        'port': connection_config['port'],
+        # Detect dead connections of the pool at TCP level
+        'keepalives': 1
+    }
+
+    if 'ssl' in connection_config and connection_config['ssl'] == 'true':
+        kwargs['sslmode'] = 'require'
+
+    for key in ['keepalives_idle', 'keepalives_interval', 'keepalives_count']:
+        if connection_config.get(key) is not None:
+            kwargs[key] = connection_config[key]
+
+    if connection_config.get('statement_timeout_seconds') is not None:
+        kwargs['options'] = '-c statement_timeout={}s'.format(connection_config['statement_timeout_seconds'])
+
+    return kwargs
+
+
+def get_connection_pool(connection_config):
+    """Get the shared connection pool of a connection configuration. The pool is created at the first call"""
+    key = tuple(connection_config.get(k) for k in ('host', 'port', 'dbname', 'user'))
+
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(connection_config,
+                                         size=connection_config.get('max_parallelism', DEFAULT_POOL_SIZE))
+        return _POOLS[key]
+
+
+def close_connection_pools():
+    """Close every connection in every connection pool"""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of Postgres connections on top of psycopg2 ThreadedConnectionPool.
+
+    Connections are opened on demand and kept open once they are returned. At most `size`
+    connections are open at the same time, threads wait for a free connection instead of
+    failing when the pool is exhausted.
+    """
+
+    def __init__(self, connection_config, size=DEFAULT_POOL_SIZE):
+        self.size = size
+        self._pool = psycopg2.pool.ThreadedConnectionPool(0, size, **connection_kwargs(connection_config))
+        # Returned connections are kept only up to minconn. Raise it after creating the pool
+        # to keep every returned connection without opening them upfront
+        self._pool.minconn = size
+        self._available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection. The transaction is committed when the context exits
+        or rolled back if an exception was raised, the same way as `with connection`.
+        """
+        with self._available:
+            connection = self._pool.getconn()
+            try:
+                with connection:
+                    yield connection
+            finally:
+                # Connections closed by the server or by a network error can't be reused
+                self._pool.putconn(connection, close=bool(connection.closed))
+
+    def close(self):
+        """Close every connection of the pool"""
+        self._pool.closeall()
@@ -1,3 +1,4 @@
+import io
 import json
 import sys
 import psycopg2
@@ -7,9 +8,13 @@ import re
 import uuid
 import itertools
 import time
+import hashlib
+import weakref
 from collections.abc import MutableMapping
 from singer import get_logger
 
+from target_postgres.connection_pool import get_connection_pool
+
 
 # pylint: disable=missing-function-docstring,missing-class-docstring
 def validate_config(config):
@@ -183,9 +188,43 @@ def stream_name_to_dict(stream_name, separator='-'):
     }
 
 
+class RecordsCsvReader(io.RawIOBase):
+    """
+    Read-only file-like object that encodes records to CSV lines on demand. It can be passed
+    directly to COPY FROM STDIN so the records of a batch never have to be written to disk.
+    """
+
+    def __init__(self, records, record_to_csv_line):
+        super().__init__()
+        self._records = iter(records)
+        self._record_to_csv_line = record_to_csv_line
+        self._buffer = b''
+        self._size_bytes = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            record = next(self._records, None)
+            if record is None:
+                break
+            self._buffer += bytes(self._record_to_csv_line(record) + '\n', 'UTF-8')
+
+        if size < 0:
+            size = len(self._buffer)
+
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._size_bytes += len(chunk)
+        return chunk
+
+    def tell(self):
+        return self._size_bytes
+
+
 # pylint: disable=too-many-public-methods,too-many-instance-attributes
 class DbSync:
-    def __init__(self, connection_config, stream_schema_message=None):
+    def __init__(self, connection_config, stream_schema_message=None, table_cache=None, table_state=None):
         """
             connection_config:      Postgres connection details
 
@@ -203,9 +242,19 @@ class DbSync:
                                     Postgres and can run individual queries. For example
                                     collecting catalog information from Postgres for caching
                                     purposes.
+
+            table_cache:            Optional TableCache with the pre-collected schemas, tables and
+                                    columns of the target schemas. The catalog is queried realtime
+                                    if not defined.
+
+            table_state:            Optional dictionary shared by every DbSync instance of the run to
+                                    track the created indices and the ON CONFLICT support of the
+                                    target tables. Every instance checks them again if not defined.
         """
         self.connection_config = connection_config
         self.stream_schema_message = stream_schema_message
+        self.table_cache = table_cache
+        self.table_state = table_state if table_state is not None else {}
 
         # logger to be used across the class's methods
         self.logger = get_logger('target_postgres')
@@ -221,6 +270,10 @@ class DbSync:
         self.schema_name = None
         self.grantees = None
 
+        # The staging table is created once in every pooled connection that loads the stream
+        self.staging_table_connections = weakref.WeakSet()
+        self.hard_delete = False
+
         # Init stream schema
         if stream_schema_message is not None:
             # Define initial list of indices to created
@@ -293,18 +346,8 @@ class DbSync:
                                                  max_level=self.data_flattening_max_level)
 
     def open_connection(self):
-        conn_string = "host='{}' dbname='{}' user='{}' password='{}' port='{}'".format(
-            self.connection_config['host'],
-            self.connection_config['dbname'],
-            self.connection_config['user'],
-            self.connection_config['password'],
-            self.connection_config['port']
-        )
-
-        if 'ssl' in self.connection_config and self.connection_config['ssl'] == 'true':
-            conn_string += " sslmode='require'"
-
-        return psycopg2.connect(conn_string)
+        """Check out a connection from the pool shared by every DbSync instance"""
+        return get_connection_pool(self.connection_config).connection()
 
     def query(self, query, params=None):
         self.logger.debug("Running query: %s", query)
@@ -357,6 +400,16 @@ class DbSync:
         )
 
     def load_csv(self, file, count, size_bytes):
+        with open(file, "rb") as f:
+            self.load_file_object(f, count, size_bytes)
+
+    def load_records(self, records, count):
+        """Load records by encoding them to CSV lines while they are sent to COPY FROM STDIN"""
+        self.load_file_object(RecordsCsvReader(records, self.record_to_csv_line), count)
+
+    def load_file_object(self, f, count, size_bytes=None):
+        """Load CSV lines from a file-like object. If size_bytes is not defined then the number
+        of bytes read from the file object is reported"""
         stream_schema_message = self.stream_schema_message
         stream = stream_schema_message['stream']
         self.logger.info("Loading %d rows into '%s'", count, self.table_name(stream, False))
@@ -366,26 +419,135 @@ class DbSync:
                 inserts = 0
                 updates = 0
 
-                temp_table = self.table_name(stream_schema_message['stream'], is_temporary=True)
-                cur.execute(self.create_table_query(table_name=temp_table, is_temporary=True))
+                upsert_on_conflict = self.can_upsert_on_conflict(cur)
+                if upsert_on_conflict:
+                    temp_table = self.staging_table_name()
+                    self.create_staging_table(connection, cur)
+                else:
+                    temp_table = self.table_name(stream_schema_message['stream'], is_temporary=True)
+                    cur.execute(self.create_table_query(table_name=temp_table, is_temporary=True))
 
                 copy_sql = "COPY {} ({}) FROM STDIN WITH (FORMAT CSV, ESCAPE '\\')".format(
                     temp_table,
                     ', '.join(self.column_names())
                 )
                 self.logger.debug(copy_sql)
-                with open(file, "rb") as f:
-                    cur.copy_expert(copy_sql, f)
-                if len(self.stream_schema_message['key_properties']) > 0:
-                    cur.execute(self.update_from_temp_table(temp_table))
-                    updates = cur.rowcount
-                cur.execute(self.insert_from_temp_table(temp_table))
-                inserts = cur.rowcount
+                cur.copy_expert(copy_sql, f)
+
+                if upsert_on_conflict:
+                    cur.execute(self.upsert_from_temp_table(temp_table))
+                    inserts, updates = cur.fetchone()
+                else:
+                    if len(self.stream_schema_message['key_properties']) > 0:
+                        cur.execute(self.update_from_temp_table(temp_table))
+                        updates = cur.rowcount
+                    cur.execute(self.insert_from_temp_table(temp_table))
+                    inserts = cur.rowcount
+
+                if size_bytes is None:
+                    size_bytes = f.tell()
 
                 self.logger.info('Loading into %s: %s',
                                  self.table_name(stream, False),
                                  json.dumps({'inserts': inserts, 'updates': updates, 'size_bytes': size_bytes}))
 
+                # Delete the rows flagged as deleted in this batch, in the same transaction as the load
+                if self.hard_delete and len(self.stream_schema_message['key_properties']) > 0:
+                    query = self.delete_from_temp_table(temp_table, last_rows_only=upsert_on_conflict)
+                    self.logger.info("Deleting rows from '%s' table... %s", self.table_name(stream), query)
+                    cur.execute(query)
+                    self.logger.info("DELETE %s", cur.rowcount)
+
+    def get_table_state(self):
+        """State of the target table shared by every DbSync instance of the run, by (schema, table)"""
+        table_name = self.table_name(self.stream_schema_message['stream'], without_schema=True).strip('"')
+        return self.table_state.setdefault((self.schema_name.lower(), table_name),
+                                           {'created_indices': set(), 'upsert_on_conflict': {}})
+
+    def can_upsert_on_conflict(self, cur):
+        """Check once per table and primary key if batches can be merged by INSERT ... ON CONFLICT. It requires
+        the upsert_on_conflict option, primary key and a unique index on exactly the primary key columns"""
+        checked_primary_keys = self.get_table_state()['upsert_on_conflict']
+        primary_key = tuple(primary_column_names(self.stream_schema_message))
+
+        if primary_key not in checked_primary_keys:
+            checked_primary_keys[primary_key] = False
+
+            if self.connection_config.get('upsert_on_conflict') and \
+                    len(self.stream_schema_message['key_properties']) > 0:
+                cur.execute("""SELECT 1
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indrelid
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+      WHERE lower(n.nspname) = %s AND c.relname = %s
+        AND i.indisunique AND i.indpred IS NULL AND i.indexprs IS NULL
+        AND (SELECT array_agg(a.attname::text ORDER BY a.attname::text)
+               FROM pg_attribute a
+              WHERE a.attrelid = c.oid AND a.attnum = ANY(i.indkey)) = %s::text[]""",
+                            (self.schema_name.lower(),
+                             self.table_name(self.stream_schema_message['stream'], without_schema=True).strip('"'),
+                             sorted(name.strip('"') for name in primary_key)))
+                checked_primary_keys[primary_key] = cur.rowcount > 0
+
+                if not checked_primary_keys[primary_key]:
+                    self.logger.info("No unique index on the primary key of '%s' table. "
+                                     "Merging with UPDATE and INSERT instead of ON CONFLICT",
+                                     self.table_name(self.stream_schema_message['stream']))
+
+        return checked_primary_keys[primary_key]
+
+    def staging_table_name(self):
+        """Name of the temporary table where the batches of the stream are copied before merging"""
+        table_name = self.table_name(self.stream_schema_message['stream'], without_schema=True).strip('"')
+        staging_table_name = f'_sdc_staging_{self.schema_name.lower()}_{table_name}'
+
+        # Keep the name unique if it's longer than the max identifier length of Postgres
+        if len(staging_table_name) > 63:
+            table_hash = hashlib.md5(staging_table_name.encode('UTF-8')).hexdigest()[:8]
+            staging_table_name = f'{staging_table_name[:54]}_{table_hash}'
+
+        return f'pg_temp."{staging_table_name}"'
+
+    def create_staging_table(self, connection, cur):
+        """Create the staging table once in every pooled connection. It's a temporary table of the
+        connection that is emptied at every commit and dropped when the connection is closed"""
+        if connection in self.staging_table_connections:
+            return
+
+        staging_table = self.staging_table_name()
+        # Table of an earlier schema of the stream can exist in the connection
+        cur.execute(f'DROP TABLE IF EXISTS {staging_table}')
+        cur.execute(self.create_table_query(table_name=staging_table, is_staging=True))
+        # Commit the table, a rolled back load would drop it from the connection
+        connection.commit()
+        self.staging_table_connections.add(connection)
+
+    def upsert_from_temp_table(self, temp_table):
+        stream_schema_message = self.stream_schema_message
+        columns = self.column_names()
+        table = self.table_name(stream_schema_message['stream'])
+
+        # xmax is zero only for the inserted rows
+        return """WITH upserted AS (
+        INSERT INTO {} ({}) ({})
+        ON CONFLICT ({}) DO UPDATE SET {}
+        RETURNING (xmax = 0) AS inserted)
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted
+        """.format(table,
+                   ', '.join(columns),
+                   self.last_rows_query(temp_table),
+                   ', '.join(primary_column_names(stream_schema_message)),
+                   ', '.join(['{}=EXCLUDED.{}'.format(c, c) for c in columns]))
+
+    def last_rows_query(self, temp_table):
+        """Select only the last copied row of every primary key from the temporary table. ON CONFLICT
+        cannot update a row twice and primary keys that are different in the batch but equal in the
+        column type, like 1 and 1.0, are copied twice into tables without primary key index"""
+        return 'SELECT DISTINCT ON ({0}) {1} FROM {2} ORDER BY {0}, ctid DESC'.format(
+            ', '.join(primary_column_names(self.stream_schema_message)),
+            ', '.join(self.column_names()),
+            temp_table)
+
     # pylint: disable=duplicate-string-formatting-argument
     def insert_from_temp_table(self, temp_table):
         stream_schema_message = self.stream_schema_message
@@ -420,6 +582,18 @@ class DbSync:
                    temp_table,
                    self.primary_key_condition(table))
 
+    def delete_from_temp_table(self, temp_table, last_rows_only=False):
+        """Delete the rows flagged as deleted in the temporary table. If last_rows_only is set then
+        only the last copied row of every primary key is checked, the same rows as merged by ON CONFLICT"""
+        stream_schema_message = self.stream_schema_message
+        table = self.table_name(stream_schema_message['stream'])
+
+        return """DELETE FROM {} USING {} s
+        WHERE {} AND s._sdc_deleted_at IS NOT NULL
+        """.format(table,
+                   '({})'.format(self.last_rows_query(temp_table)) if last_rows_only else temp_table,
+                   self.primary_key_condition(table))
+
     def primary_key_condition(self, right_table):
         stream_schema_message = self.stream_schema_message
         names = primary_column_names(stream_schema_message)
@@ -433,7 +607,7 @@ class DbSync:
     def column_names(self):
         return [safe_column_name(name) for name in self.flatten_schema]
 
-    def create_table_query(self, table_name=None, is_temporary=False):
+    def create_table_query(self, table_name=None, is_temporary=False, is_staging=False):
         stream_schema_message = self.stream_schema_message
         columns = [
             column_clause(
@@ -443,16 +617,20 @@ class DbSync:
             for (name, schema) in self.flatten_schema.items()
         ]
 
+        # Duplicates of the staging tables are removed by the ON CONFLICT merge, no primary key index needed
         primary_key = ["PRIMARY KEY ({})".format(', '.join(primary_column_names(stream_schema_message)))] \
-            if len(stream_schema_message['key_properties']) > 0 else []
+            if len(stream_schema_message['key_properties']) > 0 and not is_staging else []
 
         if not table_name:
             gen_table_name = self.table_name(stream_schema_message['stream'], is_temporary=is_temporary)
 
-        return 'CREATE {}TABLE IF NOT EXISTS {} ({})'.format(
-            'TEMP ' if is_temporary else '',
+        # Pooled connections are reused, temporary tables are dropped at the end of the load transaction
+        # and staging tables are emptied
+        return 'CREATE {}TABLE IF NOT EXISTS {} ({}){}'.format(
+            'TEMP ' if is_temporary or is_staging else '',
             table_name if table_name else gen_table_name,
-            ', '.join(columns + primary_key)
+            ', '.join(columns + primary_key),
+            ' ON COMMIT DELETE ROWS' if is_staging else ' ON COMMIT DROP' if is_temporary else ''
         )
 
     def grant_usage_on_schema(self, schema_name, grantee):
@@ -486,37 +664,61 @@ class DbSync:
         self.query(query)
 
     def create_indices(self, stream):
+        """Create the indices of the table once per run, they are tracked in the shared table state"""
         if isinstance(self.indices, list):
+            created_indices = self.get_table_state()['created_indices']
             for index in self.indices:
-                self.create_index(stream, index)
+                if index not in created_indices:
+                    self.create_index(stream, index)
+                    created_indices.add(index)
 
     def delete_rows(self, stream):
+        """Delete the rows flagged as deleted from tables without primary key. Tables with primary
+        key are cleaned up at load time by deleting only the flagged rows of the loaded batch"""
+        if len(self.stream_schema_message['key_properties']) > 0:
+            return
+
         table = self.table_name(stream)
-        query = "DELETE FROM {} WHERE _sdc_deleted_at IS NOT NULL RETURNING _sdc_deleted_at".format(table)
+        query = "DELETE FROM {} WHERE _sdc_deleted_at IS NOT NULL".format(table)
         self.logger.info("Deleting rows from '%s' table... %s", table, query)
-        self.logger.info("DELETE %s", len(self.query(query)))
+        with self.open_connection() as connection:
+            with connection.cursor() as cur:
+                cur.execute(query)
+                self.logger.info("DELETE %s", cur.rowcount)
 
-    def create_schema_if_not_exists(self, table_columns_cache=None):
+    def create_schema_if_not_exists(self):
         schema_name = self.schema_name
-        schema_rows = 0
 
-        # table_columns_cache is an optional pre-collected list of available objects in postgres
-        if table_columns_cache:
-            schema_rows = list(filter(lambda x: x['TABLE_SCHEMA'] == schema_name, table_columns_cache))
+        # table_cache is an optional pre-collected index of available objects in postgres
+        if self.table_cache is not None:
+            schema_exists = self.table_cache.has_schema(schema_name)
         # Query realtime if not pre-collected
         else:
-            schema_rows = self.query(
+            schema_exists = len(self.query(
                 'SELECT LOWER(schema_name) schema_name FROM information_schema.schemata WHERE LOWER(schema_name) = %s',
                 (schema_name.lower(),)
-            )
+            )) > 0
 
-        if len(schema_rows) == 0:
+        if not schema_exists:
             query = "CREATE SCHEMA IF NOT EXISTS {}".format(schema_name)
             self.logger.info("Schema '%s' does not exist. Creating... %s", schema_name, query)
             self.query(query)
 
             self.grant_privilege(schema_name, self.grantees, self.grant_usage_on_schema)
 
+            if self.table_cache is not None:
+                self.table_cache.add_schema(schema_name)
+
+    def get_catalog(self, schema_names):
+        """Get every table and column of the schemas by one query. Schemas without tables are returned
+        with NULL table_name and tables without columns with NULL column_name"""
+        return self.query("""SELECT n.nspname AS schema_name, c.relname AS table_name,
+             a.attname AS column_name, format_type(a.atttypid, NULL) AS data_type
+      FROM pg_catalog.pg_namespace n
+      LEFT JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relkind IN ('r', 'p', 'v', 'f')
+      LEFT JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+      WHERE lower(n.nspname) = ANY(%s)""", ([schema_name.lower() for schema_name in schema_names],))
+
     def get_tables(self):
         return self.query(
             'SELECT table_name FROM information_schema.tables WHERE table_schema = %s',
@@ -529,11 +731,20 @@ class DbSync:
       WHERE lower(table_name) = %s AND lower(table_schema) = %s""", (table_name.replace("\"", "").lower(),
                                                                      self.schema_name.lower()))
 
+    def refresh_table_cache(self):
+        """Reload the columns of the table into the table cache after DDL"""
+        if self.table_cache is not None:
+            table_name = self.table_name(self.stream_schema_message['stream'], without_schema=True)
+            self.table_cache.set_table_columns(self.schema_name, table_name, self.get_table_columns(table_name))
+
     def update_columns(self):
         stream_schema_message = self.stream_schema_message
         stream = stream_schema_message['stream']
         table_name = self.table_name(stream, without_schema=True)
-        columns = self.get_table_columns(table_name)
+        if self.table_cache is not None:
+            columns = self.table_cache.get_table_columns(self.schema_name, table_name)
+        else:
+            columns = self.get_table_columns(table_name)
         columns_dict = {column['column_name'].lower(): column for column in columns}
 
         columns_to_add = [
@@ -562,6 +773,9 @@ class DbSync:
             self.version_column(column_name, stream)
             self.add_column(column, stream)
 
+        if columns_to_add or columns_to_replace:
+            self.refresh_table_cache()
+
     def drop_column(self, column_name, stream):
         drop_column = "ALTER TABLE {} DROP COLUMN {}".format(self.table_name(stream), column_name)
         self.logger.info('Dropping column: %s', drop_column)
@@ -584,13 +798,19 @@ class DbSync:
         stream_schema_message = self.stream_schema_message
         stream = stream_schema_message['stream']
         table_name = self.table_name(stream, without_schema=True)
-        found_tables = [table for table in (self.get_tables()) if f'"{table["table_name"].lower()}"' == table_name]
-        if len(found_tables) == 0:
+        if self.table_cache is not None:
+            table_exists = self.table_cache.has_table(self.schema_name, table_name)
+        else:
+            table_exists = len([table for table in (self.get_tables())
+                                if f'"{table["table_name"].lower()}"' == table_name]) > 0
+
+        if not table_exists:
             query = self.create_table_query()
             self.logger.info("Table '%s' does not exist. Creating... %s", table_name, query)
             self.query(query)
 
             self.grant_privilege(self.schema_name, self.grantees, self.grant_select_on_all_tables_in_schema)
+            self.refresh_table_cache()
         else:
             self.logger.info("Table '%s' exists", table_name)
             self.update_columns()
@@ -0,0 +1,50 @@
+"""Indexed cache of the Postgres schemas, tables and columns"""
+
+
+class TableCache:
+    """
+    Columns of the Postgres tables indexed by (schema_name, table_name).
+
+    The cache is created from the rows returned by DbSync.get_catalog and it's shared by every
+    DbSync instance of the process. Rows with only schema_name define an empty schema and rows
+    without column_name define a table without columns. Schema and table names are case insensitive
+    and the cache is updated after every DDL executed by the target.
+    """
+
+    def __init__(self, rows=None):
+        self._schemas = set()
+        self._tables = {}
+
+        for row in rows or []:
+            self._schemas.add(row['schema_name'].lower())
+            if row['table_name'] is not None:
+                columns = self._tables.setdefault(self._key(row['schema_name'], row['table_name']), [])
+                if row['column_name'] is not None:
+                    columns.append({'column_name': row['column_name'], 'data_type': row['data_type']})
+
+    def has_schema(self, schema_name):
+        """Check if the schema is known to exist"""
+        return schema_name.lower() in self._schemas
+
+    def add_schema(self, schema_name):
+        """Register a new schema without any table"""
+        self._schemas.add(schema_name.lower())
+
+    def has_table(self, schema_name, table_name):
+        """Check if the table is known to exist"""
+        return self._key(schema_name, table_name) in self._tables
+
+    def get_table_columns(self, schema_name, table_name):
+        """Get the columns of a table. Empty list if the table is not in the cache"""
+        return self._tables.get(self._key(schema_name, table_name), [])
+
+    def set_table_columns(self, schema_name, table_name, columns):
+        """Replace the columns of one table"""
+        self._schemas.add(schema_name.lower())
+        self._tables[self._key(schema_name, table_name)] = [
+            {'column_name': column['column_name'], 'data_type': column['data_type']} for column in columns
+        ]
+
+    @staticmethod
+    def _key(schema_name, table_name):
+        return schema_name.lower(), table_name.replace('"', '').lower()
@@ -0,0 +1,86 @@
+import threading
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import psycopg2.extensions
+
+import target_postgres.connection_pool as connection_pool
+
+
+CONFIG = {
+    'host': 'dummy-host',
+    'port': 5432,
+    'user': 'dummy-user',
+    'password': 'dummy-password',
+    'dbname': 'dummy-db'
+}
+
+
+def _connection_mock(**kwargs):
+    connection = MagicMock()
+    connection.closed = 0
+    connection.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return connection
+
+
+@patch('psycopg2.connect')
+class TestConnectionPool(unittest.TestCase):
+
+    def tearDown(self):
+        connection_pool.close_connection_pools()
+
+    def test_connection_is_reused(self, connect_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(connect_mock.call_count, 1)
+
+    def test_closed_connection_is_discarded(self, connect_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.connection() as first:
+                first.closed = 2
+                raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+        with pool.connection() as second:
+            pass
+
+        self.assertIsNot(first, second)
+        self.assertEqual(connect_mock.call_count, 2)
+
+    def test_pool_waits_for_free_connection(self, connect_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG, size=1)
+        checked_out = []
+
+        with pool.connection() as first:
+            thread = threading.Thread(target=lambda: checked_out.append(pool.connection().__enter__()))
+            thread.start()
+            thread.join(0.1)
+            self.assertEqual(checked_out, [])
+
+        thread.join()
+        self.assertEqual(checked_out, [first])
+
+    def test_connection_kwargs(self, connect_mock):
+        self.assertEqual(connection_pool.connection_kwargs({**CONFIG,
+                                                            'ssl': 'true',
+                                                            'keepalives_idle': 30,
+                                                            'statement_timeout_seconds': 600}),
+                         {**CONFIG,
+                          'keepalives': 1,
+                          'keepalives_idle': 30,
+                          'sslmode': 'require',
+                          'options': '-c statement_timeout=600s'})
+
+    def test_pool_is_shared(self, connect_mock):
+        self.assertIs(connection_pool.get_connection_pool(CONFIG), connection_pool.get_connection_pool(dict(CONFIG)))
@@ -1,7 +1,11 @@
 import unittest
 
+from unittest.mock import MagicMock, patch
+
 import target_postgres
 
+from target_postgres.table_cache import TableCache
+
 
 class TestUnit(unittest.TestCase):
     """
@@ -324,3 +328,204 @@ class TestUnit(unittest.TestCase):
         for idx, (should_use_flatten_schema, record, expected_output) in enumerate(test_cases):
             output = flatten_record(record, flatten_schema if should_use_flatten_schema else None)
             assert output == expected_output
+
+    def test_records_csv_reader(self):
+        """Test reading records as CSV lines in chunks"""
+        records = [{'id': i, 'name': f'name-{i}'} for i in range(100)]
+        reader = target_postgres.db_sync.RecordsCsvReader(records,
+                                                          lambda record: '{},"{}"'.format(record['id'],
+                                                                                          record['name']))
+        chunks = []
+        while True:
+            chunk = reader.read(64)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 64)
+            chunks.append(chunk)
+
+        expected = ''.join('{},"name-{}"\n'.format(i, i) for i in range(100)).encode('UTF-8')
+        self.assertEqual(b''.join(chunks), expected)
+        self.assertEqual(reader.tell(), len(expected))
+
+    @patch('target_postgres.db_sync.DbSync.open_connection')
+    def test_load_with_upsert_on_conflict(self, open_connection_mock):
+        """Test merging batches by INSERT ... ON CONFLICT from a reused staging table"""
+        config = {
+            'host': 'dummy-value',
+            'port': 5432,
+            'user': 'dummy-value',
+            'password': 'dummy-value',
+            'dbname': 'dummy-value',
+            'default_target_schema': 'dummy_schema',
+            'upsert_on_conflict': True
+        }
+        stream_schema_message = {
+            'stream': 'public-my_table',
+            'schema': {'properties': {'id': {'type': ['integer']}, 'name': {'type': ['null', 'string']}}},
+            'key_properties': ['id']
+        }
+        cur = open_connection_mock.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.rowcount = 1
+        cur.fetchone.return_value = (2, 1)
+
+        db_sync = target_postgres.db_sync.DbSync(config, stream_schema_message)
+        db_sync.load_records([{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}], 3)
+        db_sync.load_records([{'id': 4, 'name': 'd'}], 1)
+
+        queries = [call[0][0] for call in cur.execute.call_args_list]
+        # Unique index is checked and the staging table is created in the pooled connection only once
+        self.assertEqual(len([query for query in queries if 'pg_index' in query]), 1)
+        staging_table = 'pg_temp."_sdc_staging_dummy_schema_my_table"'
+        self.assertEqual(queries[1:3], [f'DROP TABLE IF EXISTS {staging_table}',
+                                        f'CREATE TEMP TABLE IF NOT EXISTS {staging_table} '
+                                        '("id" numeric, "name" character varying) ON COMMIT DELETE ROWS'])
+        self.assertEqual(len([query for query in queries if query.startswith('CREATE')]), 1)
+        open_connection_mock.return_value.__enter__.return_value.commit.assert_called_once()
+        # Rows with equal primary keys in the column type are merged only once
+        upsert_queries = [query for query in queries if 'ON CONFLICT' in query]
+        self.assertEqual(len(upsert_queries), 2)
+        self.assertIn(f'SELECT DISTINCT ON ("id") "id", "name" FROM {staging_table} ORDER BY "id", ctid DESC)',
+                      upsert_queries[0])
+        self.assertIn('ON CONFLICT ("id") DO UPDATE SET "id"=EXCLUDED."id", "name"=EXCLUDED."name"',
+                      upsert_queries[0])
+        self.assertEqual(cur.copy_expert.call_count, 2)
+
+        # Staging table is created again in other connections
+        open_connection_mock.return_value.__enter__.return_value = MagicMock()
+        cur = open_connection_mock.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (1, 0)
+        db_sync.load_records([{'id': 5, 'name': 'e'}], 1)
+        self.assertEqual(cur.execute.call_args_list[0][0][0], f'DROP TABLE IF EXISTS {staging_table}')
+
+    def test_staging_table_name(self):
+        """Test staging table names are valid identifiers"""
+        config = {
+            'host': 'dummy-value',
+            'port': 5432,
+            'user': 'dummy-value',
+            'password': 'dummy-value',
+            'dbname': 'dummy-value',
+            'default_target_schema': 'dummy_schema'
+        }
+        long_table_name = 'a' * 60
+        db_sync = target_postgres.db_sync.DbSync(config, {'stream': f'public-{long_table_name}',
+                                                          'schema': {'properties': {}},
+                                                          'key_properties': []})
+
+        staging_table_name = db_sync.staging_table_name()
+        self.assertTrue(staging_table_name.startswith('pg_temp."_sdc_staging_dummy_schema_aaa'))
+        self.assertEqual(len(staging_table_name.split('.')[1].strip('"')), 63)
+
+    @patch('target_postgres.db_sync.DbSync.open_connection')
+    def test_hard_delete_and_indices(self, open_connection_mock):
+        """Test deleting only the flagged rows of the loaded batch and creating indices once"""
+        config = {
+            'host': 'dummy-value',
+            'port': 5432,
+            'user': 'dummy-value',
+            'password': 'dummy-value',
+            'dbname': 'dummy-value',
+            'default_target_schema': 'dummy_schema',
+            'hard_delete': True
+        }
+        stream_schema_message = {
+            'stream': 'public-my_table',
+            'schema': {'properties': {'id': {'type': ['integer']},
+                                      '_sdc_deleted_at': {'type': ['null', 'string']}}},
+            'key_properties': ['id']
+        }
+        cur = open_connection_mock.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.rowcount = 1
+
+        db_sync = target_postgres.db_sync.DbSync(config, stream_schema_message)
+        db_sync.load_records([{'id': 1, '_sdc_deleted_at': '2020-01-01T00:00:00'}], 1)
+
+        delete_query = cur.execute.call_args_list[-1][0][0]
+        self.assertTrue(delete_query.startswith('DELETE FROM dummy_schema."my_table" USING tmp_'))
+        self.assertIn('s."id" = dummy_schema."my_table"."id" AND s._sdc_deleted_at IS NOT NULL', delete_query)
+
+        # Rows are already deleted at load time, no full table scan required
+        cur.execute.reset_mock()
+        db_sync.delete_rows('public-my_table')
+        cur.execute.assert_not_called()
+
+        db_sync.create_indices('public-my_table')
+        db_sync.create_indices('public-my_table')
+        cur.execute.assert_called_once_with(
+            'CREATE INDEX IF NOT EXISTS i_my_table__sdc_deleted_at ON dummy_schema."my_table" (_sdc_deleted_at)', None)
+
+    @patch('target_postgres.db_sync.DbSync.open_connection')
+    def test_table_state_shared_by_instances(self, open_connection_mock):
+        """Test checking ON CONFLICT support and creating indices once per run if a stream gets new SCHEMA messages,
+        and deleting only the rows merged by ON CONFLICT"""
+        config = {
+            'host': 'dummy-value',
+            'port': 5432,
+            'user': 'dummy-value',
+            'password': 'dummy-value',
+            'dbname': 'dummy-value',
+            'default_target_schema': 'dummy_schema',
+            'hard_delete': True,
+            'upsert_on_conflict': True
+        }
+        stream_schema_message = {
+            'stream': 'public-my_table',
+            'schema': {'properties': {'id': {'type': ['integer']},
+                                      '_sdc_deleted_at': {'type': ['null', 'string']}}},
+            'key_properties': ['id']
+        }
+        cur = open_connection_mock.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.rowcount = 1
+        cur.fetchone.return_value = (1, 0)
+        table_state = {}
+
+        for _ in range(2):
+            db_sync = target_postgres.db_sync.DbSync(config, stream_schema_message, table_state=table_state)
+            db_sync.load_records([{'id': 1, '_sdc_deleted_at': '2020-01-01T00:00:00'}], 1)
+            db_sync.create_indices('public-my_table')
+
+        queries = [call[0][0] for call in cur.execute.call_args_list]
+        self.assertEqual(len([query for query in queries if 'pg_index' in query]), 1)
+        self.assertEqual(len([query for query in queries if query.startswith('CREATE INDEX')]), 1)
+
+        delete_query = [query for query in queries if query.startswith('DELETE')][0]
+        self.assertIn('USING (SELECT DISTINCT ON ("id") "_sdc_deleted_at", "id" '
+                      'FROM pg_temp."_sdc_staging_dummy_schema_my_table" ORDER BY "id", ctid DESC) s', delete_query)
+
+    @patch('target_postgres.db_sync.DbSync.query')
+    def test_sync_table_with_table_cache(self, query_mock):
+        """Test creating and altering tables without catalog queries if table cache is defined"""
+        config = {
+            'host': 'dummy-value',
+            'port': 5432,
+            'user': 'dummy-value',
+            'password': 'dummy-value',
+            'dbname': 'dummy-value',
+            'default_target_schema': 'dummy_schema'
+        }
+        stream_schema_message = {
+            'stream': 'public-my_table',
+            'schema': {'properties': {'id': {'type': ['integer']}, 'name': {'type': ['null', 'string']}}},
+            'key_properties': ['id']
+        }
+        table_cache = TableCache([
+            {'schema_name': 'dummy_schema', 'table_name': 'my_table', 'column_name': 'id', 'data_type': 'numeric'}
+        ])
+        query_mock.return_value = [{'column_name': 'id', 'data_type': 'numeric'},
+                                   {'column_name': 'name', 'data_type': 'character varying'}]
+
+        db_sync = target_postgres.db_sync.DbSync(config, stream_schema_message, table_cache)
+        db_sync.create_schema_if_not_exists()
+        db_sync.sync_table()
+
+        queries = [call[0][0] for call in query_mock.call_args_list]
+        self.assertEqual(queries[0], 'ALTER TABLE dummy_schema."my_table" ADD COLUMN "name" character varying')
+        # Only the columns of the altered table are reloaded
+        self.assertEqual(len(queries), 2)
+        self.assertIn('information_schema.columns', queries[1])
+        self.assertEqual(len(table_cache.get_table_columns('dummy_schema', 'my_table')), 2)
+
+        # Table is up to date, nothing to query
+        query_mock.reset_mock()
+        db_sync.sync_table()
+        query_mock.assert_not_called()
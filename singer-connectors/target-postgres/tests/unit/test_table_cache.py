@@ -0,0 +1,39 @@
+import unittest
+
+from target_postgres.table_cache import TableCache
+
+
+class TestTableCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'schema_name': 'schema1', 'table_name': 'table1', 'column_name': 'id', 'data_type': 'numeric'},
+            {'schema_name': 'schema1', 'table_name': 'table1', 'column_name': 'name',
+             'data_type': 'character varying'},
+            {'schema_name': 'schema1', 'table_name': 'empty_table', 'column_name': None, 'data_type': None},
+            {'schema_name': 'Schema2', 'table_name': None, 'column_name': None, 'data_type': None}
+        ]
+
+    def test_get_table_columns(self):
+        table_cache = TableCache(self.rows)
+
+        self.assertEqual(table_cache.get_table_columns('SCHEMA1', '"table1"'),
+                         [{'column_name': 'id', 'data_type': 'numeric'},
+                          {'column_name': 'name', 'data_type': 'character varying'}])
+        self.assertEqual(table_cache.get_table_columns('schema1', 'empty_table'), [])
+        self.assertEqual(table_cache.get_table_columns('schema1', 'table2'), [])
+
+    def test_schemas_and_tables(self):
+        table_cache = TableCache(self.rows)
+
+        self.assertTrue(table_cache.has_schema('schema2'))
+        self.assertFalse(table_cache.has_schema('schema3'))
+        self.assertTrue(table_cache.has_table('schema1', '"empty_table"'))
+        self.assertFalse(table_cache.has_table('schema2', 'table1'))
+
+        table_cache.add_schema('schema3')
+        table_cache.set_table_columns('schema3', '"table1"', [{'column_name': 'id', 'data_type': 'numeric'}])
+
+        self.assertTrue(table_cache.has_schema('schema3'))
+        self.assertEqual(table_cache.get_table_columns('schema3', 'table1'),
+                         [{'column_name': 'id', 'data_type': 'numeric'}])
@@ -3,7 +3,7 @@ import os
 import gzip
 import tempfile
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import target_postgres
 
@@ -37,3 +37,27 @@ class TestTargetPostgres(unittest.TestCase):
         target_postgres.persist_lines(self.config, lines)
 
         flush_streams_mock.assert_called_once()
+
+    @patch('target_postgres.mkstemp')
+    def test_flush_records_with_in_memory_copy(self, mkstemp_mock):
+        records = {'1': {'id': 1}, '2': {'id': 2}}
+        db_sync = MagicMock()
+
+        target_postgres.flush_records('stream', records, 2, db_sync, in_memory_copy=True)
+
+        mkstemp_mock.assert_not_called()
+        db_sync.load_csv.assert_not_called()
+        self.assertEqual(list(db_sync.load_records.call_args[0][0]), [{'id': 1}, {'id': 2}])
+        self.assertEqual(db_sync.load_records.call_args[0][1], 2)
+
+    def test_get_schema_names_from_config(self):
+        config = {
+            'default_target_schema': 'default_schema',
+            'schema_mapping': {
+                'tap_schema_1': {'target_schema': 'target_schema_1'},
+                'tap_schema_2': {'target_schema_select_permissions': ['grp_stats']}
+            }
+        }
+
+        self.assertEqual(target_postgres.get_schema_names_from_config(config), ['default_schema', 'target_schema_1'])
+        self.assertEqual(target_postgres.get_schema_names_from_config({}), [])
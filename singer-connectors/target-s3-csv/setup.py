@@ -25,7 +25,11 @@ setup(name="pipelinewise-target-s3-csv",
           'boto3==1.17.39',
       ],
       extras_require={
+          "parquet": [
+              'pyarrow==18.1.0',
+          ],
           "test": [
+              'pyarrow==18.1.0',
               'pylint==4.0.5',
               'pytest==9.0.3',
               'pytest-cov==7.1.0',
@@ -1,24 +1,30 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
-import gzip
 import io
 import json
 import os
-import shutil
 import sys
 import tempfile
+import time
 import singer
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from jsonschema import Draft7Validator, FormatChecker
 
+from target_s3_csv import file_writer
 from target_s3_csv import s3
 from target_s3_csv import utils
+from target_s3_csv.file_writer import CsvFileWriter, ParquetFileWriter
 
 logger = singer.get_logger('target_s3_csv')
 
+DEFAULT_MAX_OPEN_FILES = 32  # Max number of files written at the same time in partitioned mode
+DEFAULT_PARTITION_NAME = 'dt'
+DEFAULT_MAX_PARALLEL_UPLOADS = 8
+DEFAULT_EAGER_UPLOAD_IDLE_SECONDS = 60
+
 
 def emit_state(state):
     if state is not None:
@@ -28,6 +34,20 @@ def emit_state(state):
         sys.stdout.flush()
 
 
+def get_part_key(key, part):
+    """Add the zero padded part number to a filename or s3 key, before the extension"""
+    root, ext = os.path.splitext(key)
+    return '{}-{:05d}{}'.format(root, part, ext)
+
+
+def is_rolling_file_full(writer, config):
+    """Check if the current file of a stream reached the rolling file limits"""
+    max_rows = config.get('rolling_file_max_rows')
+    max_bytes = config.get('rolling_file_max_bytes')
+
+    return bool((max_rows and writer.row_count >= max_rows) or (max_bytes and writer.size_bytes >= max_bytes))
+
+
 # pylint: disable=too-many-locals,too-many-branches,too-many-statements
 def persist_messages(messages, config, s3_client):
     state = None
@@ -35,9 +55,29 @@ def persist_messages(messages, config, s3_client):
     key_properties = {}
     headers = {}
     validators = {}
+    record_validators = {}
 
     delimiter = config.get('delimiter', ',')
     quotechar = config.get('quotechar', '"')
+    compression = config.get('compression')
+    file_format = config.get('file_format', 'csv')
+    file_writer.validate_file_format(file_format)
+    if file_format == 'csv':
+        file_writer.validate_compression(compression)
+    parquet_compression = config.get('parquet_compression', file_writer.DEFAULT_PARQUET_COMPRESSION)
+    extension = file_writer.get_file_extension(file_format)
+    naming_convention = config.get('naming_convention') or '{stream}-{timestamp}' + extension
+
+    rolling = bool(config.get('rolling_file_max_rows') or config.get('rolling_file_max_bytes'))
+    partition_by = config.get('partition_by')
+    max_open_files = config.get('max_open_files', DEFAULT_MAX_OPEN_FILES)
+    eager_upload = config.get('eager_upload', False)
+    eager_upload_idle_seconds = config.get('eager_upload_idle_seconds', DEFAULT_EAGER_UPLOAD_IDLE_SECONDS)
+    # Streams can have more than one file if they are rolled, partitioned or uploaded eagerly
+    numbered_parts = rolling or bool(partition_by) or eager_upload
+
+    max_parallel_uploads = config.get('max_parallel_uploads', DEFAULT_MAX_PARALLEL_UPLOADS)
+    transfer_config = s3.create_transfer_config(config)
 
     # Use the system specific temp directory if no custom temp_dir provided
     temp_dir = os.path.expanduser(config.get('temp_dir', tempfile.gettempdir()))
@@ -46,102 +86,185 @@ def persist_messages(messages, config, s3_client):
     if temp_dir:
         os.makedirs(temp_dir, exist_ok=True)
 
-    # dictionary to hold csv filename per stream
+    # open file writer, filename and target key per stream and partition, least recently written first
+    writers = OrderedDict()
     filenames = {}
+    parts = {}
+    file_counts = {}
+    closed_files = []
+
+    # Closed files of the rolling file, partitioned and eager upload modes are uploaded in the background
+    # while the next files are written
+    upload_executor = ThreadPoolExecutor(max_workers=max_parallel_uploads) if numbered_parts else None
+    uploads = []
+    # monotonic time of the last record per stream and of the last check for idle streams
+    last_written = {}
+    last_idle_check = time.monotonic()
+
+    def upload_files(files, max_workers=1):
+        # Files are compressed while written, they don't need to be compressed again before uploading
+        s3.upload_files(iter(files), s3_client, config['s3_bucket'], None,
+                        config.get('encryption_type'), config.get('encryption_key'),
+                        max_workers=max_workers, transfer_config=transfer_config)
+
+    def close_writer(writer_key):
+        writers.pop(writer_key).close()
+        file = filenames.pop(writer_key)
+        if upload_executor:
+            uploads.append(upload_executor.submit(upload_files, [file]))
+        else:
+            closed_files.append(file)
 
     now = datetime.now().strftime('%Y%m%dT%H%M%S')
 
-    for message in messages:
-        try:
-            o = singer.parse_message(message).asdict()
-        except json.decoder.JSONDecodeError:
-            logger.error("Unable to parse:\n{}".format(message))
-            raise
-        message_type = o['type']
-        if message_type == 'RECORD':
-            stream_name = o['stream']
-
-            if stream_name not in schemas:
-                raise Exception("A record for stream {}"
-                                "was encountered before a corresponding schema".format(stream_name))
-
-            # Validate record
+    try:
+        for message in messages:
             try:
-                validators[stream_name].validate(utils.float_to_decimal(o['record']))
-            except Exception as ex:
-                if type(ex).__name__ == "InvalidOperation":
-                    logger.error("Data validation failed and cannot load to destination. \n"
-                                 "'multipleOf' validations that allows long precisions are not supported"
-                                 " (i.e. with 15 digits or more). Try removing 'multipleOf' methods from JSON schema.")
-                    raise ex
-
-            record_to_load = o['record']
-            if config.get('add_metadata_columns'):
-                record_to_load = utils.add_metadata_values_to_record(o, {})
+                o = singer.parse_message(message).asdict()
+            except json.decoder.JSONDecodeError:
+                logger.error("Unable to parse:\n{}".format(message))
+                raise
+            message_type = o['type']
+            if message_type == 'RECORD':
+                stream_name = o['stream']
+
+                if stream_name not in schemas:
+                    raise Exception("A record for stream {}"
+                                    "was encountered before a corresponding schema".format(stream_name))
+
+                # Validate record
+                if config.get('validate_records'):
+                    try:
+                        validators[stream_name](o['record'])
+                    except Exception as ex:
+                        if type(ex).__name__ == "InvalidOperation":
+                            logger.error("Data validation failed and cannot load to destination. \n"
+                                         "'multipleOf' validations that allows long precisions are not supported"
+                                         " (i.e. with 15 digits or more). Try removing 'multipleOf' methods from JSON "
+                                         "schema.")
+                        else:
+                            logger.error("Record does not pass schema validation. RECORD: {}".format(o['record']))
+                        raise ex
+
+                record_to_load = o['record']
+                if config.get('add_metadata_columns'):
+                    record_to_load = utils.add_metadata_values_to_record(o, {})
+                else:
+                    record_to_load = utils.remove_metadata_values_from_record(o)
+
+                # Taps send the records of one stream after the other, the files of a stream are complete
+                # when no records of the stream arrived for a while. Streams of interleaved records, like
+                # LOG_BASED ones, are kept open. More records of a closed stream are written to new parts
+                if eager_upload:
+                    now_seconds = time.monotonic()
+                    last_written[stream_name] = now_seconds
+                    if now_seconds - last_idle_check >= 1:
+                        last_idle_check = now_seconds
+                        for writer_key in [key for key in writers
+                                           if now_seconds - last_written[key[0]] >= eager_upload_idle_seconds]:
+                            close_writer(writer_key)
+
+                partition = None
+                if partition_by:
+                    partition = utils.get_partition_value(record_to_load.get(partition_by))
+                writer_key = (stream_name, partition)
+
+                if writer_key not in writers:
+                    # Bound the number of open files, close the least recently written one. Only files
+                    # with part numbers can be closed early, the next records go to a new part
+                    if numbered_parts and len(writers) >= max_open_files:
+                        close_writer(next(iter(writers)))
+
+                    filename = os.path.join(temp_dir, stream_name + '-' + now + extension)
+                    target_key = utils.get_target_key(message=o,
+                                                      prefix=config.get('s3_key_prefix', ''),
+                                                      timestamp=now,
+                                                      naming_convention=naming_convention)
+
+                    if partition_by:
+                        target_key = utils.add_partition_to_key(target_key,
+                                                                config.get('partition_name', DEFAULT_PARTITION_NAME),
+                                                                partition)
+
+                    if numbered_parts:
+                        file_counts[stream_name] = file_counts.get(stream_name, 0) + 1
+                        parts[writer_key] = parts.get(writer_key, 0) + 1
+                        filename = get_part_key(filename, file_counts[stream_name])
+                        target_key = get_part_key(target_key, parts[writer_key])
+
+                    if file_writer.is_gzip(compression) and file_format == 'csv':
+                        filename = f'{filename}.gz'
+                        target_key = f'{target_key}.gz'
+
+                    filenames[writer_key] = {
+                        'filename': os.path.expanduser(filename),
+                        'target_key': target_key
+                    }
+                    # Every file of a stream has the columns of the first file
+                    if file_format == 'parquet':
+                        writers[writer_key] = ParquetFileWriter(filenames[writer_key]['filename'],
+                                                                schemas[stream_name],
+                                                                compression=parquet_compression,
+                                                                headers=headers.get(stream_name))
+                    else:
+                        writers[writer_key] = CsvFileWriter(filenames[writer_key]['filename'],
+                                                            delimiter=delimiter,
+                                                            quotechar=quotechar,
+                                                            compression=compression,
+                                                            headers=headers.get(stream_name))
+
+                writer = writers[writer_key]
+                writer.write(utils.flatten_record(record_to_load))
+                headers[stream_name] = writer.headers
+
+                if rolling and is_rolling_file_full(writer, config):
+                    close_writer(writer_key)
+                elif partition_by:
+                    writers.move_to_end(writer_key)
+
+            elif message_type == 'STATE':
+                logger.debug('Setting state to {}'.format(o['value']))
+                state = o['value']
+
+            elif message_type == 'SCHEMA':
+                stream_name = o['stream']
+                schemas[stream_name] = o['schema']
+
+                if config.get('add_metadata_columns'):
+                    schemas[stream_name] = utils.add_metadata_columns_to_schema(o)['schema']
+
+                if config.get('validate_records'):
+                    # Taps send the same SCHEMA message many times, create one validator per distinct schema
+                    schema_key = json.dumps(o['schema'], sort_keys=True)
+                    if schema_key not in record_validators:
+                        record_validators[schema_key] = utils.create_record_validator(o['schema'])
+                    validators[stream_name] = record_validators[schema_key]
+                key_properties[stream_name] = o['key_properties']
+            elif message_type == 'ACTIVATE_VERSION':
+                logger.debug('ACTIVATE_VERSION message')
             else:
-                record_to_load = utils.remove_metadata_values_from_record(o)
-
-            if stream_name not in filenames:
-                filename = os.path.expanduser(os.path.join(temp_dir, stream_name + '-' + now + '.csv'))
-
-                filenames[stream_name] = {
-                    'filename': filename,
-                    'target_key': utils.get_target_key(message=o,
-                                                       prefix=config.get('s3_key_prefix', ''),
-                                                       timestamp=now,
-                                                       naming_convention=config.get('naming_convention'))
-
-                }
-            else:
-                filename = filenames[stream_name]['filename']
+                logger.warning("Unknown message type {} in message {}".format(o['type'], o))
+    finally:
+        # Close every file even if one of them cannot be closed, then raise the first error
+        close_errors = []
+        for writer in writers.values():
+            try:
+                writer.close()
+            except Exception as exc:
+                close_errors.append(exc)
 
-            file_is_empty = (not os.path.isfile(filename)) or os.stat(filename).st_size == 0
+        if upload_executor:
+            upload_executor.shutdown(wait=True)
 
-            flattened_record = utils.flatten_record(record_to_load)
+        if close_errors:
+            raise close_errors[0]
 
-            if stream_name not in headers and not file_is_empty:
-                with open(filename, 'r') as csvfile:
-                    reader = csv.reader(csvfile,
-                                        delimiter=delimiter,
-                                        quotechar=quotechar)
-                    first_line = next(reader)
-                    headers[stream_name] = first_line if first_line else flattened_record.keys()
-            else:
-                headers[stream_name] = flattened_record.keys()
-
-            with open(filename, 'a') as csvfile:
-                writer = csv.DictWriter(csvfile,
-                                        headers[stream_name],
-                                        extrasaction='ignore',
-                                        delimiter=delimiter,
-                                        quotechar=quotechar)
-                if file_is_empty:
-                    writer.writeheader()
-
-                writer.writerow(flattened_record)
-
-        elif message_type == 'STATE':
-            logger.debug('Setting state to {}'.format(o['value']))
-            state = o['value']
-
-        elif message_type == 'SCHEMA':
-            stream_name = o['stream']
-            schemas[stream_name] = o['schema']
-
-            if config.get('add_metadata_columns'):
-                schemas[stream_name] = utils.add_metadata_columns_to_schema(o)
-
-            schema = utils.float_to_decimal(o['schema'])
-            validators[stream_name] = Draft7Validator(schema, format_checker=FormatChecker())
-            key_properties[stream_name] = o['key_properties']
-        elif message_type == 'ACTIVATE_VERSION':
-            logger.debug('ACTIVATE_VERSION message')
-        else:
-            logger.warning("Unknown message type {} in message {}".format(o['type'], o))
+    # Raise the first error of the background uploads
+    for upload in uploads:
+        upload.result()
 
-    # Upload created CSV files to S3
-    s3.upload_files(iter(filenames.values()), s3_client, config['s3_bucket'], config.get("compression"),
-                    config.get('encryption_type'), config.get('encryption_key'))
+    # Upload created files to S3
+    upload_files(closed_files + list(filenames.values()), max_workers=max_parallel_uploads)
 
     return state
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+import csv
+import gzip
+import io
+import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+from target_s3_csv import utils
+
+FILE_FORMATS = ['csv', 'parquet']
+DEFAULT_PARQUET_COMPRESSION = 'zstd'
+DEFAULT_ROW_GROUP_SIZE = 10000  # Max number of records kept in memory and written as one parquet row group
+
+
+def validate_file_format(file_format):
+    """Raise if the file format is not supported"""
+    if file_format not in FILE_FORMATS:
+        raise NotImplementedError(
+            "File format '{}' is not supported. Expected: 'csv' or 'parquet'".format(file_format)
+        )
+
+
+def validate_compression(compression):
+    """Raise if the compression type is not supported"""
+    if compression is not None and compression.lower() not in ['none', 'gzip']:
+        raise NotImplementedError(
+            "Compression type '{}' is not supported. Expected: 'none' or 'gzip'".format(compression)
+        )
+
+
+def is_gzip(compression):
+    return compression is not None and compression.lower() == 'gzip'
+
+
+def get_file_extension(file_format, compression=None):
+    """File extension of the files written in the file format"""
+    if file_format == 'parquet':
+        return '.parquet'
+    return '.csv.gz' if is_gzip(compression) else '.csv'
+
+
+def column_arrow_type(schema_property):
+    """
+    Arrow type of a flattened schema property. Date and time values and every other
+    not scalar value are stored as strings, the same way as in CSV files.
+    """
+    property_type = schema_property.get('type', [])
+    if isinstance(property_type, str):
+        property_type = [property_type]
+
+    if 'string' in property_type or 'format' in schema_property:
+        return pyarrow.string()
+    if 'number' in property_type:
+        return pyarrow.float64()
+    if 'integer' in property_type:
+        return pyarrow.int64()
+    if 'boolean' in property_type:
+        return pyarrow.bool_()
+    return pyarrow.string()
+
+
+def _to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class CsvFileWriter:
+    """
+    CSV file of one stream that is kept open while records are appended to it.
+
+    The header is taken from the keys of the first written record, or from the headers argument,
+    and it's written once when the file is opened. Keys of later records that are not in the
+    header are ignored. The file is gzip compressed while written if compression is gzip.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, filename, delimiter=',', quotechar='"', compression=None, headers=None):
+        validate_compression(compression)
+
+        self.filename = filename
+        self.headers = headers
+        self.row_count = 0
+
+        self._file = open(filename, 'wb')  # pylint: disable=consider-using-with
+        compressed_file = gzip.GzipFile(fileobj=self._file, mode='wb') if is_gzip(compression) else None
+        self._text_file = io.TextIOWrapper(compressed_file or self._file, encoding='utf-8', newline='')
+        self._csv_options = {'delimiter': delimiter, 'quotechar': quotechar}
+        self._writer = None
+
+    @property
+    def size_bytes(self):
+        """Approximate number of bytes written to the file, not counting the buffered data"""
+        return self._file.tell()
+
+    def write(self, record):
+        """Append one flattened record to the file"""
+        if self._writer is None:
+            if self.headers is None:
+                self.headers = list(record.keys())
+
+            self._writer = csv.DictWriter(self._text_file,
+                                          self.headers,
+                                          extrasaction='ignore',
+                                          **self._csv_options)
+            self._writer.writeheader()
+
+        self._writer.writerow(record)
+        self.row_count += 1
+
+    def close(self):
+        """Flush and close the file"""
+        # Closing the gzip file writes the gzip trailer but doesn't close the file under it
+        try:
+            self._text_file.close()
+        finally:
+            self._file.close()
+
+
+# The parquet writer needs the column types and the writer options until the first row group is written
+class ParquetFileWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Parquet file of one stream that is kept open while records are appended to it.
+
+    Columns are taken from the keys of the first written record, the same way as in CSV files, followed
+    by the columns of the flattened JSON schema that are not in the record. Column types are taken from
+    the schema, columns that are not in the schema, like the keys of objects without properties, are
+    string columns. Records are buffered and written as one row group every row_group_size records.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, filename, schema, compression=DEFAULT_PARQUET_COMPRESSION,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, headers=None):
+        if pyarrow is None:
+            raise ImportError("Parquet file format requires pyarrow. "
+                              "Install it with: pip install pipelinewise-target-s3-csv[parquet]")
+
+        self.filename = filename
+        self.row_count = 0
+
+        self._flattened_schema = utils.flatten_schema(schema)
+        self.headers = None
+        self._arrow_types = []
+        if headers:
+            self._set_headers(headers)
+
+        self._compression = None if compression is None or compression.lower() == 'none' else compression
+        self._row_group_size = row_group_size
+        self._rows = []
+        self._file = open(filename, 'wb')  # pylint: disable=consider-using-with
+        self._writer = None
+
+    @property
+    def size_bytes(self):
+        """Number of bytes written to the file, not counting the records of the next row group"""
+        return self._file.tell()
+
+    def write(self, record):
+        """Append one flattened record to the file"""
+        if self.headers is None:
+            # Objects flattened to more columns than the schema defines replace their schema column
+            self._set_headers(list(record.keys()) + [
+                column for column in self._flattened_schema
+                if column not in record and not any(key.startswith(column + '__') for key in record)
+            ])
+
+        self._rows.append([record.get(column) for column in self.headers])
+        self.row_count += 1
+
+        if len(self._rows) >= self._row_group_size:
+            self._write_row_group()
+
+    def close(self):
+        """Write the buffered records and close the file"""
+        try:
+            if self._rows or self._writer is None:
+                if self.headers is None:
+                    self._set_headers(list(self._flattened_schema))
+
+                self._write_row_group()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            self._file.close()
+
+    def _set_headers(self, headers):
+        self.headers = headers
+        self._arrow_types = [column_arrow_type(self._flattened_schema.get(column, {})) for column in headers]
+
+    def _write_row_group(self):
+        columns = zip(*self._rows) if self._rows else [[] for _ in self.headers]
+        arrays = [self._to_array(column, list(values), arrow_type)
+                  for column, values, arrow_type in zip(self.headers, columns, self._arrow_types)]
+        record_batch = pyarrow.RecordBatch.from_arrays(arrays, names=self.headers)
+
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self._file, record_batch.schema,
+                                                         compression=self._compression)
+
+        self._writer.write_batch(record_batch)
+        self._rows = []
+
+    @staticmethod
+    def _to_array(column, values, arrow_type):
+        if arrow_type == pyarrow.string():
+            return pyarrow.array([_to_string(value) for value in values], type=arrow_type)
+
+        try:
+            return pyarrow.array(values, type=arrow_type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, OverflowError) as exc:
+            raise ValueError(
+                "Unexpected value in column '{}', cannot convert to parquet type {}: {}".format(column, arrow_type, exc)
+            ) from exc
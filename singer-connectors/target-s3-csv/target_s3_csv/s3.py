@@ -6,7 +6,9 @@ import backoff
 import boto3
 import singer
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple, List, Dict, Iterator
+from boto3.s3.transfer import TransferConfig
 from botocore.client import BaseClient
 from botocore.exceptions import ClientError
 
@@ -53,10 +55,19 @@ def create_client(config):
     return s3
 
 
+def create_transfer_config(config):
+    """Multipart upload settings of boto3 from the optional s3_transfer_config dictionary"""
+    transfer_config = config.get('s3_transfer_config')
+    if not transfer_config:
+        return None
+
+    return TransferConfig(**transfer_config)
+
+
 # pylint: disable=too-many-arguments
 @retry_pattern()
 def upload_file(filename, s3_client, bucket, s3_key,
-                encryption_type=None, encryption_key=None):
+                encryption_type=None, encryption_key=None, transfer_config=None):
 
     if encryption_type is None or encryption_type.lower() == "none":
         # No encryption config (defaults to settings on the bucket):
@@ -83,20 +94,28 @@ def upload_file(filename, s3_client, bucket, s3_key,
         "Uploading {} to bucket {} at {}{}"
         .format(filename, bucket, s3_key, encryption_desc)
     )
-    s3_client.upload_file(filename, bucket, s3_key, ExtraArgs=encryption_args)
 
+    upload_args = {'ExtraArgs': encryption_args}
+    if transfer_config:
+        upload_args['Config'] = transfer_config
+
+    s3_client.upload_file(filename, bucket, s3_key, **upload_args)
 
+
+# pylint: disable=too-many-arguments
 def upload_files(filenames: Iterator[Dict],
                  s3_client: BaseClient,
                  s3_bucket: str,
                  compression: Optional[str],
                  encryption_type: Optional[str],
-                 encryption_key: Optional[str]):
+                 encryption_key: Optional[str],
+                 max_workers: int = 1,
+                 transfer_config: Optional[TransferConfig] = None):
     """
-    Uploads given local files to s3
+    Uploads given local files to s3, max_workers files at the same time
     Compress if necessary
     """
-    for file in filenames:
+    def upload(file):
         filename, target_key = file['filename'], file['target_key']
         compressed_file = None
 
@@ -107,7 +126,7 @@ def upload_files(filenames: Iterator[Dict],
 
                 with open(filename, 'rb') as f_in:
                     with gzip.open(compressed_file, 'wb') as f_out:
-                        LOGGER.info(f"Compressing file as '%s'", compressed_file)
+                        LOGGER.info("Compressing file as '%s'", compressed_file)
                         shutil.copyfileobj(f_in, f_out)
 
             else:
@@ -120,7 +139,8 @@ def upload_files(filenames: Iterator[Dict],
                     s3_bucket,
                     target_key,
                     encryption_type=encryption_type,
-                    encryption_key=encryption_key
+                    encryption_key=encryption_key,
+                    transfer_config=transfer_config
                     )
 
         # Remove the local file(s)
@@ -128,3 +148,8 @@ def upload_files(filenames: Iterator[Dict],
             os.remove(filename)
             if compressed_file:
                 os.remove(compressed_file)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Raise the first upload error
+        for _ in executor.map(upload, filenames):
+            pass
@@ -8,6 +8,8 @@ import inflection
 from decimal import Decimal
 from datetime import datetime
 from collections.abc import MutableMapping
+from urllib.parse import quote
+from jsonschema import Draft7Validator, FormatChecker
 
 logger = singer.get_logger('target_s3_csv')
 
@@ -39,6 +41,27 @@ def float_to_decimal(value):
     return value
 
 
+def has_multiple_of(schema):
+    """Check if the given JSON schema has multipleOf keyword at any level"""
+    if isinstance(schema, list):
+        return any(has_multiple_of(child) for child in schema)
+    if isinstance(schema, dict):
+        return 'multipleOf' in schema or any(has_multiple_of(child) for child in schema.values())
+    return False
+
+
+def create_record_validator(schema):
+    """Create a function that validates a record against the JSON schema.
+
+    Floats are converted to Decimal only if the schema has multipleOf validation, to avoid
+    float precision errors. Records of other schemas are validated as they are without copying."""
+    if has_multiple_of(schema):
+        validator = Draft7Validator(float_to_decimal(schema), format_checker=FormatChecker())
+        return lambda record: validator.validate(float_to_decimal(record))
+
+    return Draft7Validator(schema, format_checker=FormatChecker()).validate
+
+
 def add_metadata_columns_to_schema(schema_message):
     """Metadata _sdc columns according to the stitch documentation at
     https://www.stitchdata.com/docs/data-structure/integration-schemas#sdc-columns
@@ -122,6 +145,43 @@ def flatten_record(d, parent_key=None, sep='__'):
     return dict(items)
 
 
+def flatten_schema(schema, parent_key=None, sep='__'):
+    """Flatten the properties of a JSON schema the same way as flatten_record flattens the records.
+    Returns a dictionary of the flattened column names and their JSON schema property"""
+    if parent_key is None:
+        parent_key = []
+
+    items = []
+    properties = schema.get('properties', {})
+    for k in sorted(properties.keys()):
+        v = properties[k]
+        new_key = flatten_key(k, parent_key, sep)
+        if 'properties' in v:
+            items.extend(flatten_schema(v, parent_key + [k], sep=sep).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+
+def get_partition_value(value):
+    """Hive style partition value of a record value. Date and date-time values are partitioned by their
+    date part. Missing values go to the default partition of Hive"""
+    if value is None:
+        return '__HIVE_DEFAULT_PARTITION__'
+
+    value = str(value)
+    if re.match(r'^\d{4}-\d{2}-\d{2}', value):
+        return value[:10]
+    return quote(value, safe='')
+
+
+def add_partition_to_key(key, partition_name, partition_value):
+    """Insert the Hive style partition folder before the filename of the s3 key"""
+    folder, _, filename = key.rpartition('/')
+    partition = '{}={}'.format(partition_name, partition_value)
+    return '/'.join(filter(None, [folder, partition, filename]))
+
+
 def get_target_key(message, prefix=None, timestamp=None, naming_convention=None):
     """Creates and returns an S3 key for the message"""
     if not naming_convention:
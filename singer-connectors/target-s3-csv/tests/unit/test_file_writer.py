@@ -0,0 +1,97 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet
+
+from target_s3_csv.file_writer import CsvFileWriter, ParquetFileWriter
+
+
+class TestCsvFileWriter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_write_header_once(self):
+        filename = os.path.join(self.temp_dir.name, 'my_stream.csv')
+        writer = CsvFileWriter(filename)
+        writer.write({'id': 1, 'name': 'Steve'})
+        writer.write({'id': 2, 'name': 'Peter', 'age': 33})
+        writer.close()
+
+        with open(filename, 'r', newline='') as f:
+            self.assertEqual('id,name\r\n1,Steve\r\n2,Peter\r\n', f.read())
+
+        self.assertEqual(2, writer.row_count)
+        self.assertListEqual(['id', 'name'], writer.headers)
+
+    def test_write_with_given_headers_and_gzip(self):
+        filename = os.path.join(self.temp_dir.name, 'my_stream.csv.gz')
+        writer = CsvFileWriter(filename, delimiter=';', compression='gzip', headers=['name', 'id'])
+        writer.write({'id': 1, 'name': 'Steve'})
+        writer.close()
+
+        with gzip.open(filename, 'rt', newline='') as f:
+            self.assertEqual('name;id\r\nSteve;1\r\n', f.read())
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(NotImplementedError):
+            CsvFileWriter(os.path.join(self.temp_dir.name, 'my_stream.csv'), compression='zip')
+
+    def test_parquet_file_writer(self):
+        filename = os.path.join(self.temp_dir.name, 'my_stream.parquet')
+        schema = {'properties': {'id': {'type': 'integer'},
+                                 'price': {'type': ['null', 'number']},
+                                 'created_at': {'type': ['null', 'string'], 'format': 'date-time'},
+                                 'address': {'type': 'object', 'properties': {'city': {'type': 'string'}}}}}
+        writer = ParquetFileWriter(filename, schema, row_group_size=2)
+        for i in range(3):
+            writer.write({'address__city': 'London', 'created_at': '2021-01-01T00:00:00Z', 'id': i, 'price': 1.5})
+        writer.close()
+
+        parquet_file = pyarrow.parquet.ParquetFile(filename)
+        self.assertEqual(2, parquet_file.num_row_groups)
+        self.assertEqual('ZSTD', parquet_file.metadata.row_group(0).column(0).compression)
+
+        table = parquet_file.read()
+        self.assertListEqual(['address__city', 'created_at', 'id', 'price'], table.column_names)
+        self.assertEqual('int64', str(table.schema.field('id').type))
+        self.assertEqual('double', str(table.schema.field('price').type))
+        self.assertListEqual([0, 1, 2], table.column('id').to_pylist())
+        self.assertListEqual(['London'] * 3, table.column('address__city').to_pylist())
+
+    def test_parquet_file_writer_with_invalid_value(self):
+        writer = ParquetFileWriter(os.path.join(self.temp_dir.name, 'my_stream.parquet'),
+                                   {'properties': {'id': {'type': 'integer'}}})
+        writer.write({'id': 'one'})
+
+        with self.assertRaises(ValueError):
+            writer.close()
+
+    def test_parquet_file_writer_with_object_without_properties(self):
+        filename = os.path.join(self.temp_dir.name, 'my_stream.parquet')
+        schema = {'properties': {'id': {'type': 'integer'},
+                                 'amount': {'type': ['null', 'number']},
+                                 'payload': {'type': ['null', 'object']}}}
+        writer = ParquetFileWriter(filename, schema)
+        writer.write({'id': 1, 'payload__x': 1, 'payload__y': 'a', 'not_in_schema': True})
+        writer.close()
+
+        # Keys of the flattened record are kept the same way as in CSV files, missing schema columns are added
+        table = pyarrow.parquet.read_table(filename)
+        self.assertListEqual([{'id': 1, 'not_in_schema': 'true', 'payload__x': '1', 'payload__y': 'a', 'amount': None}],
+                             table.to_pylist())
+        self.assertEqual('double', str(table.schema.field('amount').type))
+
+    def test_parquet_file_writer_closes_file_on_error(self):
+        writer = ParquetFileWriter(os.path.join(self.temp_dir.name, 'my_stream.parquet'),
+                                   {'properties': {'id': {'type': 'integer'}}})
+        writer.write({'id': 'one'})
+
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertTrue(writer._file.closed)
@@ -1,12 +1,16 @@
 import contextlib
+import gzip
 import io
 import json
+import tempfile
 import unittest
 
 from unittest.mock import patch, Mock
 
+import pyarrow.parquet
 import pytest
 from botocore.client import BaseClient
+from jsonschema import ValidationError
 
 from target_s3_csv import emit_state, persist_messages
 
@@ -30,11 +34,10 @@ class TestMain(unittest.TestCase):
             emit_state({'a': 1, 'b': 2, 'c': 'lool'})
             self.assertEqual('{"a": 1, "b": 2, "c": "lool"}\n', f.getvalue())
 
-    @patch('target_s3_csv.open')
-    @patch('target_s3_csv.csv')
+    @patch('target_s3_csv.CsvFileWriter')
     @patch('target_s3_csv.s3')
     @patch('target_s3_csv.os')
-    def test_persist_messages(self, os, s3, csv, open):
+    def test_persist_messages(self, os, s3, csv_file_writer):
         messages = [
             json.dumps({"type": "SCHEMA", "stream": "my_stream",
                         "schema": {
@@ -60,3 +63,183 @@ class TestMain(unittest.TestCase):
 
         self.assertDictEqual({"bookmarks": {"my_stream": 1}}, state)
         s3.upload_files.assert_called_once()
+        csv_file_writer.assert_called_once()
+        self.assertEqual(4, csv_file_writer.return_value.write.call_count)
+        csv_file_writer.return_value.close.assert_called_once()
+
+    @patch('target_s3_csv.CsvFileWriter')
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_validate_records(self, s3, csv_file_writer):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": "my_stream",
+                        "schema": {"properties": {"id": {"type": "integer"}}},
+                        "key_properties": ["id"]}),
+            json.dumps({"type": "RECORD", "stream": "my_stream", "record": {"id": "not-an-integer"}}),
+        ]
+
+        # Records are not validated by default
+        persist_messages(messages, self.config, Mock(spec_set=BaseClient))
+
+        with self.assertRaises(ValidationError):
+            persist_messages(messages, {**self.config, 'validate_records': True}, Mock(spec_set=BaseClient))
+
+    @patch('target_s3_csv.CsvFileWriter')
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_closes_every_writer_on_error(self, s3, csv_file_writer):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": stream, "schema": {"properties": {"id": {"type": "integer"}}},
+                        "key_properties": ["id"]})
+            for stream in ["stream_1", "stream_2"]
+        ] + [
+            json.dumps({"type": "RECORD", "stream": stream, "record": {"id": 1}})
+            for stream in ["stream_1", "stream_2"]
+        ]
+        writers = [Mock(), Mock()]
+        writers[0].close.side_effect = ValueError('cannot write the file')
+        csv_file_writer.side_effect = writers
+
+        with self.assertRaises(ValueError):
+            persist_messages(messages, self.config, Mock(spec_set=BaseClient))
+
+        writers[1].close.assert_called_once()
+        s3.upload_files.assert_not_called()
+
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_with_rolling_files(self, s3):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": "my_stream",
+                        "schema": {"properties": {"id": {"type": "integer"}, "name": {"type": ["string", "null"]}}},
+                        "key_properties": ["id"]}),
+        ] + [
+            json.dumps({"type": "RECORD", "stream": "my_stream", "record": {"id": i, "name": f"name-{i}"}})
+            for i in range(5)
+        ]
+
+        uploaded = []
+        s3.upload_files.side_effect = lambda files, *args, **kwargs: uploaded.extend(files)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {**self.config, 'temp_dir': temp_dir, 'rolling_file_max_rows': 2, 'compression': 'gzip'}
+            persist_messages(messages, config, Mock(spec_set=BaseClient))
+
+            # Two full parts uploaded in the background and the last part at the end of the input
+            self.assertEqual(3, s3.upload_files.call_count)
+            uploaded.sort(key=lambda f: f['target_key'])
+            self.assertListEqual([1, 2, 3], [int(f['target_key'].split('-')[-1].split('.')[0]) for f in uploaded])
+            self.assertTrue(all(f['target_key'].endswith('.csv.gz') for f in uploaded))
+
+            # Compression is done by the writers, not by the upload
+            self.assertTrue(all(call[0][3] is None for call in s3.upload_files.call_args_list))
+
+            with gzip.open(uploaded[-1]['filename'], 'rt', newline='') as f:
+                self.assertEqual('id,name\r\n4,name-4\r\n', f.read())
+
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_with_partitions(self, s3):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": "my_stream",
+                        "schema": {"properties": {"id": {"type": "integer"},
+                                                  "updated_at": {"type": "string", "format": "date-time"}}},
+                        "key_properties": ["id"]}),
+        ] + [
+            json.dumps({"type": "RECORD", "stream": "my_stream",
+                        "record": {"id": i, "updated_at": f"2021-01-0{i % 3 + 1}T10:00:00Z"}})
+            for i in range(6)
+        ]
+
+        uploaded = []
+        s3.upload_files.side_effect = lambda files, *args, **kwargs: uploaded.extend(files)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {**self.config, 'temp_dir': temp_dir, 'file_format': 'parquet', 'partition_by': 'updated_at',
+                      'max_open_files': 2, 'naming_convention': 'my_stream/{timestamp}.parquet'}
+            persist_messages(messages, config, Mock(spec_set=BaseClient))
+
+            # Every record opens a new partition after the first two, the least recently written one is closed
+            self.assertEqual(6, len(uploaded))
+            self.assertListEqual([(f'my_stream/dt=2021-01-0{day}', f'{part:05d}.parquet')
+                                  for day in [1, 2, 3] for part in [1, 2]],
+                                 sorted(tuple(f['target_key'].rsplit('/', 1)[0:1] + f['target_key'].rsplit('-', 1)[1:])
+                                        for f in uploaded))
+
+            rows = sum(pyarrow.parquet.read_table(f['filename']).num_rows for f in uploaded)
+            self.assertEqual(6, rows)
+
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_with_more_streams_than_max_open_files(self, s3):
+        streams = ["stream_1", "stream_2", "stream_3"]
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": stream, "schema": {"properties": {"id": {"type": "integer"}}},
+                        "key_properties": ["id"]})
+            for stream in streams
+        ] + [
+            json.dumps({"type": "RECORD", "stream": stream, "record": {"id": i}})
+            for i in range(3) for stream in streams
+        ]
+
+        uploaded = {}
+
+        def upload_files(files, *args, **kwargs):
+            for file in files:
+                with open(file['filename']) as f:
+                    uploaded[file['target_key'].split('-')[0]] = f.read()
+
+        s3.upload_files.side_effect = upload_files
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {**self.config, 'temp_dir': temp_dir, 'max_open_files': 2}
+            persist_messages(messages, config, Mock(spec_set=BaseClient))
+
+        # Files without part numbers are kept open, every record of every stream is uploaded once
+        self.assertEqual(1, s3.upload_files.call_count)
+        self.assertDictEqual({stream: 'id\n0\n1\n2\n' for stream in streams}, uploaded)
+
+    @patch('target_s3_csv.time.monotonic')
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_with_eager_upload(self, s3, monotonic):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": stream, "schema": {"properties": {"id": {"type": "integer"}}},
+                        "key_properties": ["id"]})
+            for stream in ["stream_1", "stream_2"]
+        ] + [
+            json.dumps({"type": "RECORD", "stream": stream, "record": {"id": 1}})
+            for stream in ["stream_1", "stream_1", "stream_2", "stream_1"]
+        ]
+        # Time of the start and of every record, stream_1 is idle for 100 seconds when stream_2 starts
+        monotonic.side_effect = [0, 0, 1, 101, 102]
+
+        uploaded = []
+        s3.upload_files.side_effect = lambda files, *args, **kwargs: uploaded.extend(files)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {**self.config, 'temp_dir': temp_dir, 'eager_upload': True, 'max_parallel_uploads': 4}
+            persist_messages(messages, config, Mock(spec_set=BaseClient))
+
+        # The first stream_1 file is uploaded as soon as stream_1 is idle
+        self.assertTrue(uploaded[0]['target_key'].startswith('stream_1-'))
+        self.assertListEqual(['stream_1', 'stream_1', 'stream_2'],
+                             sorted(f['target_key'].split('-')[0] for f in uploaded))
+        self.assertEqual(4, s3.upload_files.call_args_list[-1][1]['max_workers'])
+
+    @patch('target_s3_csv.time.monotonic')
+    @patch('target_s3_csv.s3')
+    def test_persist_messages_with_eager_upload_of_interleaved_streams(self, s3, monotonic):
+        messages = [
+            json.dumps({"type": "SCHEMA", "stream": stream, "schema": {"properties": {"id": {"type": "integer"}}},
+                        "key_properties": ["id"]})
+            for stream in ["stream_1", "stream_2"]
+        ] + [
+            json.dumps({"type": "RECORD", "stream": stream, "record": {"id": i}})
+            for i in range(10) for stream in ["stream_1", "stream_2"]
+        ]
+        monotonic.side_effect = range(0, 1000, 2)
+
+        uploaded = []
+        s3.upload_files.side_effect = lambda files, *args, **kwargs: uploaded.extend(files)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = {**self.config, 'temp_dir': temp_dir, 'eager_upload': True, 'eager_upload_idle_seconds': 10}
+            persist_messages(messages, config, Mock(spec_set=BaseClient))
+
+        # Streams that get records regularly are not closed, one file per stream
+        self.assertListEqual(['stream_1', 'stream_2'], sorted(f['target_key'].split('-')[0] for f in uploaded))
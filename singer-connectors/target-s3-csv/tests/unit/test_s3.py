@@ -134,3 +134,34 @@ class TestS3(unittest.TestCase):
         self.assertFalse(os.path.exists(file1.name))
         self.assertFalse(os.path.exists(file2.name))
         self.assertFalse(os.path.exists(file3.name))
+
+    def test_upload_files_in_parallel_with_transfer_config(self):
+        files = [tempfile.NamedTemporaryFile(suffix='.csv') for _ in range(10)]
+        filenames = [{'filename': f.name, 'target_key': f'folder{i}/file.csv'} for i, f in enumerate(files)]
+        transfer_config = s3.create_transfer_config({'s3_transfer_config': {'multipart_chunksize': 16777216,
+                                                                            'max_concurrency': 4}})
+
+        s3_client = Mock(**{
+            'upload_file.return_value': None
+        })
+
+        s3.upload_files(filenames, s3_client, 'my_bucket', None, None, None,
+                        max_workers=4, transfer_config=transfer_config)
+
+        s3_client.upload_file.assert_has_calls(
+            [call(f.name, 'my_bucket', f'folder{i}/file.csv', ExtraArgs=None, Config=transfer_config)
+             for i, f in enumerate(files)],
+            any_order=True
+        )
+        self.assertEqual(16777216, transfer_config.multipart_chunksize)
+        self.assertTrue(all(not os.path.exists(f.name) for f in files))
+
+    def test_upload_files_raises_upload_errors(self):
+        file1 = tempfile.NamedTemporaryFile(suffix='.csv')
+        s3_client = Mock(**{
+            'upload_file.side_effect': ValueError('upload failed')
+        })
+
+        with self.assertRaises(ValueError):
+            s3.upload_files([{'filename': file1.name, 'target_key': 'file.csv'}], s3_client, 'my_bucket',
+                            None, None, None, max_workers=2)
@@ -1,6 +1,8 @@
 import unittest
 from unittest.mock import patch
 
+from jsonschema import ValidationError
+
 from target_s3_csv import utils
 
 
@@ -59,3 +61,39 @@ class TestUtils(unittest.TestCase):
                                       naming_convention='folder1/test_{stream}_test.csv')
 
         self.assertEqual('folder1/the_prefix__test_the_stream_test.csv', s3_key)
+
+    def test_has_multiple_of(self):
+        """Test detecting multipleOf at any level of the schema"""
+        self.assertFalse(utils.has_multiple_of({'properties': {'id': {'type': 'integer'}}}))
+        self.assertTrue(utils.has_multiple_of(
+            {'properties': {'amount': {'anyOf': [{'type': 'number', 'multipleOf': 0.01}, {'type': 'null'}]}}}))
+
+    def test_create_record_validator(self):
+        """Test validating records with and without multipleOf in the schema"""
+        validate = utils.create_record_validator({'properties': {'id': {'type': 'integer'}}})
+        validate({'id': 1})
+        with self.assertRaises(ValidationError):
+            validate({'id': 'one'})
+
+        validate = utils.create_record_validator({'properties': {'amount': {'type': 'number', 'multipleOf': 0.01}}})
+        validate({'amount': 1.23})
+        with self.assertRaises(ValidationError):
+            validate({'amount': 1.234})
+
+    def test_flatten_schema(self):
+        """Test flattening the schema the same way as the records"""
+        schema = {'properties': {'id': {'type': 'integer'},
+                                 'address': {'type': 'object', 'properties': {'city': {'type': 'string'}}}}}
+
+        self.assertDictEqual({'address__city': {'type': 'string'}, 'id': {'type': 'integer'}},
+                             utils.flatten_schema(schema))
+
+    def test_partitioned_key(self):
+        """Test hive style partitioned keys"""
+        self.assertEqual('2021-01-02', utils.get_partition_value('2021-01-02T10:00:00Z'))
+        self.assertEqual('a%2Fb', utils.get_partition_value('a/b'))
+        self.assertEqual('__HIVE_DEFAULT_PARTITION__', utils.get_partition_value(None))
+
+        self.assertEqual('dt=2021-01-02/stream.csv', utils.add_partition_to_key('stream.csv', 'dt', '2021-01-02'))
+        self.assertEqual('folder/stream/dt=2021-01-02/file.csv',
+                         utils.add_partition_to_key('folder/stream/file.csv', 'dt', '2021-01-02'))
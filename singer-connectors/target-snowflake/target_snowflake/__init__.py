@@ -8,7 +8,9 @@ import os
 import sys
 import copy
 
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, List, Optional
 from joblib import Parallel, delayed, parallel_backend
 from jsonschema import Draft7Validator, FormatChecker
 from singer import get_logger
@@ -16,10 +18,15 @@ from datetime import datetime, timedelta
 
 from target_snowflake.file_formats import csv
 from target_snowflake.file_formats import parquet
+from target_snowflake.file_formats import WriteOptions
 from target_snowflake import stream_utils
 
+from target_snowflake.connection_pool import close_connection_pools
 from target_snowflake.db_sync import DbSync
 from target_snowflake.file_format import FileFormatTypes
+from target_snowflake.flush_pipeline import FlushPipeline
+from target_snowflake.stage_cleaner import StageCleaner
+from target_snowflake.table_cache import TableCache
 from target_snowflake.exceptions import (
     RecordValidationException,
     UnexpectedValueTypeException,
@@ -36,6 +43,9 @@ logging.getLogger('snowflake.connector').setLevel(logging.WARNING)
 DEFAULT_BATCH_SIZE_ROWS = 100000
 DEFAULT_PARALLELISM = 0  # 0 The number of threads used to flush tables
 DEFAULT_MAX_PARALLELISM = 16  # Don't use more than this number of threads by default when flushing streams in parallel
+DEFAULT_PIPELINED_FLUSH_QUEUE_DEPTH = 1  # Max number of flushes waiting in front of every stage of the flush pipeline
+DEFAULT_SPLIT_FILE_MAX_PARTS = 1  # Max number of files generated from one batch, 1 disables splitting
+DEFAULT_SPLIT_FILE_MIN_ROWS_PER_PART = 50000  # Don't split batches into files smaller than this number of rows
 
 
 def add_metadata_columns_to_schema(schema_message):
@@ -70,36 +80,43 @@ def get_snowflake_statics(config):
         config: configuration dictionary
 
     Returns:
-        tuple of retrieved items: table_cache, file_format_type
+        tuple of retrieved items: table_cache, file_format_type, table_metadata
     """
     table_cache = []
+    table_metadata = None
     if not ('disable_table_cache' in config and config['disable_table_cache']):
         LOGGER.info('Getting catalog objects from PipelineWise table cache...')
 
         db = DbSync(config)  # pylint: disable=invalid-name
-        table_cache = db.get_table_columns(
-            table_schemas=stream_utils.get_schema_names_from_config(config))
+        table_schemas = stream_utils.get_schema_names_from_config(config)
+        table_columns = db.get_table_columns(table_schemas=table_schemas)
+        table_metadata = db.get_table_metadata(table_schemas=table_schemas, table_columns=table_columns)
+        table_cache = TableCache(table_columns)
 
     # The file format is detected at DbSync init time
     file_format_type = db.file_format.file_format_type
 
-    return table_cache, file_format_type
+    return table_cache, file_format_type, table_metadata
 
 
 # pylint: disable=too-many-locals,too-many-branches,too-many-statements,invalid-name
-def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatTypes = None) -> None:
+def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatTypes = None,
+                  table_metadata: Dict = None) -> None:
     """Main loop to read and consume singer messages from stdin
 
     Params:
         config: configuration dictionary
         lines: iterable of singer messages
-        table_cache: Optional dictionary of Snowflake table structures. This is useful to run the less
-                     INFORMATION_SCHEMA and SHOW queries as possible.
+        table_cache: Optional TableCache of Snowflake table structures. This is useful to run the less
+                     INFORMATION_SCHEMA and SHOW queries as possible. It is shared by every stream.
                      If not provided then an SQL query will be generated at runtime to
                      get all the required information from Snowflake
         file_format_type: Optional FileFormatTypes value that defines which supported file format to use
                           to load data into Snowflake.
                           If not provided then it will be detected automatically
+        table_metadata: Optional dictionary of iceberg flags, primary keys and not nullable columns by table.
+                        If provided then the SHOW ICEBERG TABLES and SHOW PRIMARY KEYS queries and the
+                        ALTER queries of unchanged primary keys are skipped when syncing the tables.
 
     Returns:
         tuple of retrieved items: table_cache, file_format_type
@@ -118,6 +135,12 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
     flush_timestamp = datetime.utcnow()
     archive_load_files = config.get('archive_load_files', False)
     archive_load_files_data = {}
+    flush_pipeline = create_flush_pipeline(config)
+    stage_cleaner = StageCleaner() if config.get('background_stage_cleanup') else None
+    batch_size_bytes = config.get('batch_size_bytes', None)
+    spill_records_to_disk = config.get('spill_records_to_disk', False)
+    buffered_bytes = {}
+    total_buffered_bytes = 0
 
     # Loop over lines from stdin
     for line in lines:
@@ -161,19 +184,35 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
             if not primary_key_string:
                 primary_key_string = f'RID-{total_row_count[stream]}'
 
-            if stream not in records_to_load:
-                records_to_load[stream] = {}
-
-            # increment row count only when a new PK is encountered in the current batch
-            if primary_key_string not in records_to_load[stream]:
+            if config.get('add_metadata_columns') or config.get('hard_delete'):
+                record = stream_utils.add_metadata_values_to_record(o)
+            else:
+                record = o['record']
+
+            if spill_records_to_disk:
+                # append record to the file of the batch, duplicated PKs are removed by MERGE at load time
+                if not isinstance(records_to_load.get(stream), csv.RecordsFileWriter):
+                    records_to_load[stream] = csv.RecordsFileWriter(stream_to_sync[stream].record_serializer,
+                                                                    compression=not config.get('no_compression'),
+                                                                    dest_dir=config.get('temp_dir'))
+                records_to_load[stream].write(record)
                 row_count[stream] += 1
                 total_row_count[stream] += 1
-
-            # append record
-            if config.get('add_metadata_columns') or config.get('hard_delete'):
-                records_to_load[stream][primary_key_string] = stream_utils.add_metadata_values_to_record(o)
             else:
-                records_to_load[stream][primary_key_string] = o['record']
+                if stream not in records_to_load:
+                    records_to_load[stream] = {}
+
+                # increment row count only when a new PK is encountered in the current batch
+                if primary_key_string not in records_to_load[stream]:
+                    row_count[stream] += 1
+                    total_row_count[stream] += 1
+
+                # append record
+                records_to_load[stream][primary_key_string] = record
+
+                # Size of the message is a cheap estimation of the memory used by the record
+                buffered_bytes[stream] = buffered_bytes.get(stream, 0) + len(line)
+                total_buffered_bytes += len(line)
 
             if archive_load_files and stream in archive_load_files_data:
                 # Keep track of min and max of the designated column
@@ -191,6 +230,7 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
                         stream_archive_load_files_values['max'] = incremental_key_value
 
             flush = False
+            filter_streams = [stream]
             if row_count[stream] >= batch_size_rows:
                 flush = True
                 LOGGER.info("Flush triggered by batch_size_rows (%s) reached in %s",
@@ -200,13 +240,16 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
                 flush = True
                 LOGGER.info("Flush triggered by batch_wait_limit_seconds (%s)",
                             batch_wait_limit_seconds)
+            elif batch_size_bytes and total_buffered_bytes >= batch_size_bytes:
+                flush = True
+                filter_streams = select_largest_streams(buffered_bytes, batch_size_bytes)
+                LOGGER.info("Flush triggered by batch_size_bytes (%s) reached in %s",
+                            batch_size_bytes, filter_streams)
 
             if flush:
                 # flush all streams, delete records if needed, reset counts and then emit current state
                 if config.get('flush_all_streams'):
                     filter_streams = None
-                else:
-                    filter_streams = [stream]
 
                 # Flush and return a new state dict with new positions only for the flushed streams
                 flushed_state = flush_streams(
@@ -217,12 +260,17 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
                     state,
                     flushed_state,
                     archive_load_files_data,
-                    filter_streams=filter_streams)
+                    filter_streams=filter_streams,
+                    flush_pipeline=flush_pipeline,
+                    stage_cleaner=stage_cleaner)
 
                 flush_timestamp = datetime.utcnow()
+                buffered_bytes = {s: b for s, b in buffered_bytes.items() if row_count[s] > 0}
+                total_buffered_bytes = sum(buffered_bytes.values())
 
-                # emit last encountered state
-                emit_state(copy.deepcopy(flushed_state))
+                # emit last encountered state, the flush pipeline emits it once the flushed batches are loaded
+                if not flush_pipeline:
+                    emit_state(copy.deepcopy(flushed_state))
 
         elif t == 'SCHEMA':
             if 'stream' not in o:
@@ -254,10 +302,20 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
                                                   state,
                                                   flushed_state,
                                                   archive_load_files_data,
-                                                  filter_streams=filter_streams)
+                                                  filter_streams=filter_streams,
+                                                  flush_pipeline=flush_pipeline,
+                                                  stage_cleaner=stage_cleaner)
+                    buffered_bytes = {s: b for s, b in buffered_bytes.items() if row_count[s] > 0}
+                    total_buffered_bytes = sum(buffered_bytes.values())
 
                     # emit latest encountered state
-                    emit_state(flushed_state)
+                    if not flush_pipeline:
+                        emit_state(flushed_state)
+
+                # The target table can be altered by the new schema,
+                # batches of the previous schema have to be loaded before
+                if flush_pipeline:
+                    flush_pipeline.drain()
 
                 # key_properties key must be available in the SCHEMA message.
                 if 'key_properties' not in o:
@@ -281,9 +339,10 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
                     stream_to_sync[stream] = DbSync(config,
                                                     add_metadata_columns_to_schema(o),
                                                     table_cache,
-                                                    file_format_type)
+                                                    file_format_type,
+                                                    table_metadata)
                 else:
-                    stream_to_sync[stream] = DbSync(config, o, table_cache, file_format_type)
+                    stream_to_sync[stream] = DbSync(config, o, table_cache, file_format_type, table_metadata)
 
                 if archive_load_files:
                     archive_load_files_data[stream] = {
@@ -331,12 +390,40 @@ def persist_lines(config, lines, table_cache=None, file_format_type: FileFormatT
     if sum(row_count.values()) > 0:
         # flush all streams one last time, delete records if needed, reset counts and then emit current state
         flushed_state = flush_streams(records_to_load, row_count, stream_to_sync, config, state, flushed_state,
-                                      archive_load_files_data)
+                                      archive_load_files_data, flush_pipeline=flush_pipeline,
+                                      stage_cleaner=stage_cleaner)
+
+    # wait for the batches in the flush pipeline to be loaded
+    if flush_pipeline:
+        flush_pipeline.close()
+
+    # wait for the loaded files to be archived and deleted from the stage
+    if stage_cleaner:
+        stage_cleaner.close()
 
     # emit latest state
     emit_state(copy.deepcopy(flushed_state))
 
 
+def select_largest_streams(buffered_bytes: Dict[str, int], batch_size_bytes: int) -> List[str]:
+    """
+    Select the streams to flush when the buffered records of every stream reached batch_size_bytes.
+    The largest buffers are selected first until the remaining buffers use less than half of
+    batch_size_bytes, so the next flushes are not triggered again after a few records.
+    """
+    streams = []
+    remaining_bytes = sum(buffered_bytes.values())
+
+    for stream in sorted(buffered_bytes, key=buffered_bytes.get, reverse=True):
+        if remaining_bytes < batch_size_bytes / 2:
+            break
+
+        streams.append(stream)
+        remaining_bytes -= buffered_bytes[stream]
+
+    return streams
+
+
 # pylint: disable=too-many-arguments
 def flush_streams(
         streams,
@@ -346,7 +433,9 @@ def flush_streams(
         state,
         flushed_state,
         archive_load_files_data,
-        filter_streams=None):
+        filter_streams=None,
+        flush_pipeline=None,
+        stage_cleaner=None):
     """
     Flushes all buckets and resets records count to 0 as well as empties records to load list
     :param streams: dictionary with records to load per stream
@@ -357,6 +446,9 @@ def flush_streams(
     :param flushed_state: dictionary containing updated states only when streams got flushed
     :param filter_streams: Keys of streams to flush from the streams dict. Default is every stream
     :param archive_load_files_data: dictionary of dictionaries containing archive load files data
+    :param flush_pipeline: Optional FlushPipeline to load the batches in the background. The returned state
+                           is emitted by the pipeline once the batches are loaded
+    :param stage_cleaner: Optional StageCleaner to archive and delete the loaded files in the background
     :return: State dict with flushed positions
     """
     parallelism = config.get("parallelism", DEFAULT_PARALLELISM)
@@ -380,18 +472,38 @@ def flush_streams(
     else:
         streams_to_flush = streams.keys()
 
-    # Single-host, thread-based parallelism
-    with parallel_backend('threading', n_jobs=parallelism):
-        Parallel()(delayed(load_stream_batch)(
-            stream=stream,
-            records=streams[stream],
-            row_count=row_count,
-            db_sync=stream_to_sync[stream],
-            no_compression=config.get('no_compression'),
-            delete_rows=config.get('hard_delete'),
-            temp_dir=config.get('temp_dir'),
-            archive_load_files=copy.copy(archive_load_files_data.get(stream, None))
-        ) for stream in streams_to_flush)
+    if flush_pipeline:
+        # Hand over the batches to the flush pipeline, it takes the ownership of the records
+        batches = [
+            new_batch(stream,
+                      streams[stream],
+                      stream_to_sync[stream],
+                      temp_dir=config.get('temp_dir'),
+                      no_compression=config.get('no_compression'),
+                      delete_rows=config.get('hard_delete'),
+                      archive_load_files=copy.copy(archive_load_files_data.get(stream, None)),
+                      stage_cleaner=stage_cleaner,
+                      file_parts=split_file_parts(row_count[stream], config))
+            for stream in streams_to_flush if row_count[stream] > 0
+        ]
+
+        for stream in streams_to_flush:
+            row_count[stream] = 0
+    else:
+        # Single-host, thread-based parallelism
+        with parallel_backend('threading', n_jobs=parallelism):
+            Parallel()(delayed(load_stream_batch)(
+                stream=stream,
+                records=streams[stream],
+                row_count=row_count,
+                db_sync=stream_to_sync[stream],
+                no_compression=config.get('no_compression'),
+                delete_rows=config.get('hard_delete'),
+                temp_dir=config.get('temp_dir'),
+                archive_load_files=copy.copy(archive_load_files_data.get(stream, None)),
+                stage_cleaner=stage_cleaner,
+                file_parts=split_file_parts(row_count[stream], config)
+            ) for stream in streams_to_flush)
 
     # reset flushed stream records to empty to avoid flushing same records
     for stream in streams_to_flush:
@@ -415,16 +527,24 @@ def flush_streams(
             archive_load_files_data[stream]['min'] = None
             archive_load_files_data[stream]['max'] = None
 
+    if flush_pipeline:
+        flush_pipeline.submit({
+            'batches': batches,
+            'parallelism': parallelism,
+            'state': copy.deepcopy(flushed_state)
+        })
+
     # Return with state message with flushed positions
     return flushed_state
 
 
 def load_stream_batch(stream, records, row_count, db_sync, no_compression=False, delete_rows=False,
-                      temp_dir=None, archive_load_files=None):
+                      temp_dir=None, archive_load_files=None, stage_cleaner=None, file_parts=1):
     """Load one batch of the stream into target table"""
     # Load into snowflake
     if row_count[stream] > 0:
-        flush_records(stream, records, db_sync, temp_dir, no_compression, archive_load_files)
+        flush_records(stream, records, db_sync, temp_dir, no_compression, archive_load_files, stage_cleaner,
+                      file_parts)
 
         # Delete soft-deleted, flagged rows - where _sdc_deleted at is not null
         if delete_rows:
@@ -439,7 +559,9 @@ def flush_records(stream: str,
                   db_sync: DbSync,
                   temp_dir: str = None,
                   no_compression: bool = False,
-                  archive_load_files: Dict = None) -> None:
+                  archive_load_files: Dict = None,
+                  stage_cleaner: StageCleaner = None,
+                  file_parts: int = 1) -> None:
     """
     Takes a list of record messages and loads it into the snowflake target table
 
@@ -452,28 +574,148 @@ def flush_records(stream: str,
         temp_dir: Directory where intermediate temporary files will be created. (Default: OS specific temp directory)
         no_compression: Disable to use compressed files. (Default: False)
         archive_load_files: Data needed for archive load files. (Default: None)
+        stage_cleaner: Archive and delete the loaded file in the background if defined. (Default: None)
+        file_parts: Number of files to split the records into. (Default: 1)
 
     Returns:
         None
     """
-    # Generate file on disk in the required format
-    filepath = db_sync.file_format.formatter.records_to_file(records,
+    batch = new_batch(stream, records, db_sync, temp_dir, no_compression, archive_load_files=archive_load_files,
+                      stage_cleaner=stage_cleaner, file_parts=file_parts)
+
+    write_batch_file(batch)
+    upload_batch_file(batch)
+    load_batch_file(batch)
+
+
+def new_batch(stream: str,
+              records: Dict,
+              db_sync: DbSync,
+              temp_dir: str = None,
+              no_compression: bool = False,
+              delete_rows: bool = False,
+              archive_load_files: Dict = None,
+              stage_cleaner: StageCleaner = None,
+              file_parts: int = 1) -> Dict:
+    """
+    Create the dictionary that holds everything required to load one batch of a stream.
+    The records are either a dictionary of records by primary key or a csv.RecordsFileWriter
+    if the records are spilled to disk. The file related keys are populated by write_batch_file
+    and upload_batch_file. Large batches can be written to multiple part files that are loaded
+    by one command, in that case s3_key is the common key prefix of the parts and pattern matches
+    the part files.
+    """
+    return {
+        'stream': stream,
+        'records': records,
+        'row_count': len(records),
+        'db_sync': db_sync,
+        'temp_dir': temp_dir,
+        'no_compression': no_compression,
+        'delete_rows': delete_rows,
+        'archive_load_files': archive_load_files,
+        'stage_cleaner': stage_cleaner,
+        'file_parts': file_parts,
+        'filepaths': [],
+        'size_bytes': None,
+        's3_keys': [],
+        's3_key': None,
+        'pattern': None
+    }
+
+
+def split_file_parts(row_count: int, config: Dict) -> int:
+    """Number of files to generate from a batch of row_count records"""
+    max_parts = config.get('split_file_max_parts', DEFAULT_SPLIT_FILE_MAX_PARTS)
+    min_rows_per_part = config.get('split_file_min_rows_per_part', DEFAULT_SPLIT_FILE_MIN_ROWS_PER_PART)
+
+    return max(1, min(max_parts, row_count // min_rows_per_part))
+
+
+def split_records(records: Dict, parts: int) -> List[Dict]:
+    """Split the dictionary of records into parts of nearly equal size"""
+    items = iter(records.items())
+    part_size, remainder = divmod(len(records), parts)
+
+    return [dict(islice(items, part_size + (1 if i < remainder else 0))) for i in range(parts)]
+
+
+def write_batch_file(batch: Dict) -> None:
+    """Generate files on disk in the required format from the records of the batch. Large batches
+    are split into file_parts files generated in parallel"""
+    db_sync = batch['db_sync']
+
+    # Spilled records are already in the file, it only needs to be closed
+    if isinstance(batch['records'], csv.RecordsFileWriter):
+        batch['filepaths'] = [batch['records'].close()]
+        batch['size_bytes'] = os.path.getsize(batch['filepaths'][0])
+        batch['records'] = None
+        return
+
+    compression = not batch['no_compression']
+    if compression and db_sync.file_format.file_format_type == FileFormatTypes.PARQUET:
+        compression = db_sync.connection_config.get('parquet_compression', True)
+
+    options = WriteOptions(data_flattening_max_level=db_sync.data_flattening_max_level,
+                           record_serializer=db_sync.record_serializer)
+
+    def records_to_file(records: Dict) -> str:
+        return db_sync.file_format.formatter.records_to_file(records,
                                                              db_sync.flatten_schema,
-                                                             compression=not no_compression,
-                                                             dest_dir=temp_dir,
-                                                             data_flattening_max_level=
-                                                             db_sync.data_flattening_max_level)
-
-    # Get file stats
-    row_count = len(records)
-    size_bytes = os.path.getsize(filepath)
-
-    # Upload to s3 and load into Snowflake
-    s3_key = db_sync.put_to_stage(filepath, stream, row_count, temp_dir=temp_dir)
-    db_sync.load_file(s3_key, row_count, size_bytes)
-
-    # Delete file from local disk
-    os.remove(filepath)
+                                                             compression=compression,
+                                                             dest_dir=batch['temp_dir'],
+                                                             options=options)
+
+    parts = batch['file_parts']
+    if parts > 1:
+        with ThreadPoolExecutor(max_workers=parts) as executor:
+            batch['filepaths'] = list(executor.map(records_to_file, split_records(batch['records'], parts)))
+    else:
+        batch['filepaths'] = [records_to_file(batch['records'])]
+
+    batch['size_bytes'] = sum(os.path.getsize(filepath) for filepath in batch['filepaths'])
+
+    # Records are not needed anymore, release them as early as possible
+    batch['records'] = None
+
+
+def upload_batch_file(batch: Dict) -> None:
+    """Upload the files of the batch to s3 or to the snowflake table stage. Multiple part files are
+    uploaded concurrently under the same key prefix that is loaded with a file pattern"""
+    if len(batch['filepaths']) == 1:
+        batch['s3_key'] = batch['db_sync'].put_to_stage(batch['filepaths'][0],
+                                                        batch['stream'],
+                                                        batch['row_count'],
+                                                        temp_dir=batch['temp_dir'])
+        batch['s3_keys'] = [batch['s3_key']]
+        return
+
+    batch['s3_keys'] = batch['db_sync'].put_files_to_stage(batch['filepaths'],
+                                                           batch['stream'],
+                                                           batch['row_count'],
+                                                           temp_dir=batch['temp_dir'])
+    batch['s3_key'] = f"{os.path.dirname(batch['s3_keys'][0])}/"
+    part_names = '|'.join(os.path.basename(s3_key).replace('.', '[.]') for s3_key in batch['s3_keys'])
+    # PUT to the table stage compresses the not compressed files and adds the .gz extension to them
+    batch['pattern'] = f'.*/({part_names})([.]gz)?'
+
+
+def load_batch_file(batch: Dict) -> None:
+    """Load the staged file of the batch into Snowflake then clean up the local and the staged file.
+    The staged file is archived and deleted in the background if the batch has a stage cleaner"""
+    stream = batch['stream']
+    db_sync = batch['db_sync']
+    s3_keys = batch['s3_keys']
+    archive_load_files = batch['archive_load_files']
+    stage_cleaner = batch['stage_cleaner']
+    archive_keys = [None] * len(s3_keys)
+    archive_metadata = None
+
+    db_sync.load_file(batch['s3_key'], batch['row_count'], batch['size_bytes'], batch['pattern'])
+
+    # Delete files from local disk
+    for filepath in batch['filepaths']:
+        os.remove(filepath)
 
     if archive_load_files:
         stream_name_parts = stream_utils.stream_name_to_dict(stream)
@@ -499,13 +741,63 @@ def flush_records(stream: str,
             })
 
         # Use same file name as in import
-        archive_file = os.path.basename(s3_key)
-        archive_key = f"{archive_tap}/{archive_table}/{archive_file}"
+        archive_keys = [f"{archive_tap}/{archive_table}/{os.path.basename(s3_key)}" for s3_key in s3_keys]
+
+    if stage_cleaner:
+        for s3_key, archive_key in zip(s3_keys, archive_keys):
+            stage_cleaner.submit(db_sync, stream, s3_key, archive_key, archive_metadata)
+        return
+
+    for s3_key, archive_key in zip(s3_keys, archive_keys):
+        if archive_key:
+            db_sync.copy_to_archive(s3_key, archive_key, archive_metadata)
+
+    # Delete files from S3
+    if len(s3_keys) == 1:
+        db_sync.delete_from_stage(stream, s3_keys[0])
+    else:
+        db_sync.delete_batch_from_stage(stream, s3_keys)
 
-        db_sync.copy_to_archive(s3_key, archive_key, archive_metadata)
 
-    # Delete file from S3
-    db_sync.delete_from_stage(stream, s3_key)
+def load_and_delete_batch(batch: Dict) -> None:
+    """Load the batch and hard delete the flagged rows if required"""
+    load_batch_file(batch)
+
+    # Delete soft-deleted, flagged rows - where _sdc_deleted at is not null
+    if batch['delete_rows']:
+        batch['db_sync'].delete_rows(batch['stream'])
+
+
+def flush_pipeline_stage(batch_fn: Callable[[Dict], None]) -> Callable[[Dict], None]:
+    """Wrap a function that processes one batch into a flush pipeline stage that processes
+    every batch of a flush job in parallel"""
+    def run_stage(job: Dict) -> None:
+        # Single-host, thread-based parallelism
+        with parallel_backend('threading', n_jobs=job['parallelism']):
+            Parallel()(delayed(batch_fn)(batch) for batch in job['batches'])
+
+    return run_stage
+
+
+def create_flush_pipeline(config: Dict) -> Optional[FlushPipeline]:
+    """
+    Create the pipeline that loads the flushed batches in the background if pipelined_flush is enabled.
+
+    File generation, upload and load into Snowflake are separate stages, so the file of a batch can be
+    generated while the previous batch is uploaded and the one before is loaded. States are emitted
+    only when every batch flushed before the state was loaded into Snowflake.
+    """
+    if not config.get('pipelined_flush'):
+        return None
+
+    return FlushPipeline(
+        stages=[
+            flush_pipeline_stage(write_batch_file),
+            flush_pipeline_stage(upload_batch_file),
+            flush_pipeline_stage(load_and_delete_batch)
+        ],
+        queue_depth=config.get('pipelined_flush_queue_depth', DEFAULT_PIPELINED_FLUSH_QUEUE_DEPTH),
+        on_complete=lambda job: emit_state(job['state']))
 
 
 def main():
@@ -521,11 +813,13 @@ def main():
         config = {}
 
     # Init columns cache
-    table_cache, file_format_type = get_snowflake_statics(config)
+    table_cache, file_format_type, table_metadata = get_snowflake_statics(config)
 
     # Consume singer messages
     singer_messages = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-    persist_lines(config, singer_messages, table_cache, file_format_type)
+    persist_lines(config, singer_messages, table_cache, file_format_type, table_metadata)
+
+    close_connection_pools()
 
     LOGGER.debug("Exiting normally")
 
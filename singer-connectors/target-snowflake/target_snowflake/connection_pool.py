@@ -0,0 +1,204 @@
+"""Pool of Snowflake connections shared by every DbSync instance of the process"""
+import collections
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, Optional
+
+import snowflake.connector
+
+from cryptography.hazmat.primitives import serialization
+from singer import get_logger
+
+LOGGER = get_logger('target_snowflake')
+
+DEFAULT_POOL_SIZE = 16  # Max number of idle connections kept open
+DEFAULT_IDLE_TIMEOUT_SECONDS = 600  # Close connections that have not been used for this long
+HEALTH_CHECK_AFTER_SECONDS = 60  # Check if the session is still alive if the connection was idle for this long
+
+# One pool per distinct connection configuration
+_POOLS: Dict[tuple, 'ConnectionPool'] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def pem2der(pem_file: str, password: str = None) -> bytes:
+    """Convert Key PEM format to DER format. The key file is read and parsed only once per process"""
+    with open(pem_file, 'rb') as key_file:
+        p_key = serialization.load_pem_private_key(
+            key_file.read(),
+            password=password,
+        )
+    der_key = p_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption())
+
+    return der_key
+
+
+def get_connection_pool(connection_config: Dict) -> 'ConnectionPool':
+    """Get the shared connection pool of a connection configuration. The pool is created at the first call"""
+    key = tuple(connection_config.get(k) for k in ('account', 'user', 'private_key', 'dbname', 'warehouse', 'role'))
+
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(
+                connection_config,
+                size=connection_config.get('max_parallelism', DEFAULT_POOL_SIZE),
+                idle_timeout=connection_config.get('connection_pool_idle_timeout_seconds',
+                                                   DEFAULT_IDLE_TIMEOUT_SECONDS))
+        return _POOLS[key]
+
+
+def close_connection_pools() -> None:
+    """Close every open connection in every connection pool"""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of Snowflake connections.
+
+    Connections are checked out by the `connection` context manager and returned to the pool when the
+    context exits. If every pooled connection is in use then a new one is opened, but at most `size`
+    connections are kept open once they are returned. Connections idle for longer than `idle_timeout`
+    seconds are closed and connections idle for long enough are health checked before reuse.
+    """
+
+    def __init__(self, connection_config: Dict, size: int = DEFAULT_POOL_SIZE,
+                 idle_timeout: int = DEFAULT_IDLE_TIMEOUT_SECONDS):
+        self.connection_config = connection_config
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        # Idle connections, most recently used on the right
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, query_tag: Optional[str] = None) -> Iterator[snowflake.connector.SnowflakeConnection]:
+        """Check out a connection with the QUERY_TAG session parameter set to query_tag"""
+        pooled = self._checkout(query_tag)
+
+        try:
+            if pooled['query_tag'] != query_tag:
+                self._set_query_tag(pooled, query_tag)
+
+            yield pooled['connection']
+
+        except Exception:
+            # Roll back any open transaction, connection is reusable only if the rollback succeeds
+            try:
+                pooled['connection'].rollback()
+            except Exception:
+                self._close(pooled)
+                raise
+            self._checkin(pooled)
+            raise
+
+        self._checkin(pooled)
+
+    def close(self) -> None:
+        """Close every idle connection"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+
+        for pooled in idle:
+            self._close(pooled)
+
+    def _open(self, query_tag: Optional[str]) -> Dict:
+        LOGGER.debug('Opening new Snowflake connection')
+        connection = snowflake.connector.connect(
+            user=self.connection_config['user'],
+            authenticator='SNOWFLAKE_JWT',
+            private_key=pem2der(self.connection_config['private_key']),
+            account=self.connection_config['account'],
+            database=self.connection_config['dbname'],
+            warehouse=self.connection_config['warehouse'],
+            role=self.connection_config.get('role', None),
+            autocommit=True,
+            session_parameters={
+                # Quoted identifiers should be case sensitive
+                'QUOTED_IDENTIFIERS_IGNORE_CASE': 'FALSE',
+                'QUERY_TAG': query_tag
+            }
+        )
+
+        return {'connection': connection, 'query_tag': query_tag, 'last_used': time.monotonic()}
+
+    def _checkout(self, query_tag: Optional[str]) -> Dict:
+        stale = []
+        pooled = None
+
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if time.monotonic() - candidate['last_used'] > self.idle_timeout:
+                    stale.append(candidate)
+                else:
+                    pooled = candidate
+                    break
+
+        for candidate in stale:
+            self._close(candidate)
+
+        if pooled is not None and not self._is_healthy(pooled):
+            self._close(pooled)
+            pooled = None
+
+        return pooled or self._open(query_tag)
+
+    def _checkin(self, pooled: Dict) -> None:
+        pooled['last_used'] = time.monotonic()
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(pooled)
+                return
+
+        self._close(pooled)
+
+    @classmethod
+    def _is_healthy(cls, pooled: Dict) -> bool:
+        connection = pooled['connection']
+        if connection.is_closed():
+            return False
+
+        if time.monotonic() - pooled['last_used'] < HEALTH_CHECK_AFTER_SECONDS:
+            return True
+
+        try:
+            with connection.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        # pylint: disable=broad-except
+        except Exception as exc:
+            LOGGER.warning('Discarding broken Snowflake connection: %s', exc)
+            return False
+
+    @classmethod
+    def _set_query_tag(cls, pooled: Dict, query_tag: Optional[str]) -> None:
+        with pooled['connection'].cursor() as cur:
+            if query_tag is None:
+                cur.execute('ALTER SESSION UNSET QUERY_TAG')
+            else:
+                cur.execute('ALTER SESSION SET QUERY_TAG = %(query_tag)s', {'query_tag': query_tag})
+
+        pooled['query_tag'] = query_tag
+
+    @classmethod
+    def _close(cls, pooled: Dict) -> None:
+        try:
+            pooled['connection'].close()
+        # pylint: disable=broad-except
+        except Exception as exc:
+            LOGGER.debug('Failed to close Snowflake connection: %s', exc)
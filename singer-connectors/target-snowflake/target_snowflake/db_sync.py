@@ -1,3 +1,4 @@
+# pylint: disable=too-many-lines  # DbSync keeps every Snowflake operation of one stream in one class
 import json
 import sys
 import snowflake.connector
@@ -5,12 +6,14 @@ import re
 import time
 
 from typing import List, Dict, Union, Tuple, Set
-from cryptography.hazmat.primitives import serialization
 
 from singer import get_logger
 from target_snowflake import flattening
 from target_snowflake import stream_utils
+from target_snowflake.connection_pool import get_connection_pool
 from target_snowflake.file_format import FileFormat, FileFormatTypes
+from target_snowflake.file_formats import LoadOptions
+from target_snowflake.table_cache import TableCache, new_table_metadata, query_table_metadata
 
 from target_snowflake.exceptions import TooManyRecordsException, PrimaryKeyNotFoundException
 from target_snowflake.upload_clients.s3_upload_client import S3UploadClient
@@ -179,7 +182,8 @@ def create_query_tag(query_tag_pattern: str, database: str = None, schema: str =
 class DbSync:
     """DbSync class"""
 
-    def __init__(self, connection_config, stream_schema_message=None, table_cache=None, file_format_type=None):
+    def __init__(self, connection_config, stream_schema_message=None, table_cache=None, file_format_type=None,
+                 table_metadata=None):
         """
             connection_config:      Snowflake connection details
 
@@ -197,10 +201,21 @@ class DbSync:
                                     Snowflake and can run individual queries. For example
                                     collecting catalog informations from Snowflake for caching
                                     purposes.
+
+            table_cache:            Optional TableCache, or list of column rows as returned by
+                                    get_table_columns. The TableCache is updated in place when
+                                    tables are created or altered, so it can be shared by every
+                                    DbSync instance.
+
+            table_metadata:         Optional dictionary of iceberg flag, primary keys and not nullable
+                                    columns by (schema, table), as returned by get_table_metadata.
+                                    It is updated in place when the table is altered, so it can be
+                                    shared by every DbSync instance.
         """
         self.connection_config = connection_config
         self.stream_schema_message = stream_schema_message
-        self.table_cache = table_cache
+        self.table_cache = (TableCache(table_cache) or None) if isinstance(table_cache, list) else table_cache
+        self.table_metadata = table_metadata
 
         # logger to be used across the class's methods
         self.logger = get_logger('target_snowflake')
@@ -229,6 +244,11 @@ class DbSync:
                               "Use named stages with Parquet file format or table stages with CSV files format")
             sys.exit(1)
 
+        if self.connection_config.get('spill_records_to_disk') and \
+                self.file_format.file_format_type != FileFormatTypes.CSV:
+            self.logger.error("spill_records_to_disk is supported only with CSV file format")
+            sys.exit(1)
+
         # Init stream schema pylint: disable=line-too-long
         if self.stream_schema_message is not None:
             #  Define target schema name.
@@ -286,6 +306,17 @@ class DbSync:
             self.data_flattening_max_level = self.connection_config.get('data_flattening_max_level', 0)
             self.flatten_schema = flattening.flatten_schema(stream_schema_message['schema'],
                                                             max_level=self.data_flattening_max_level)
+            self.flatten_key_paths = flattening.flatten_schema_key_paths(stream_schema_message['schema'],
+                                                                         max_level=self.data_flattening_max_level)
+
+            # Record serializer compiled once per stream and reused for every record
+            self.record_serializer = self.file_format.formatter.create_record_serializer(
+                self.flatten_schema, self.flatten_key_paths, self.data_flattening_max_level)
+
+            # Reads only the primary key columns, records are flattened only once by the record serializer
+            self.primary_key_extractor = flattening.compile_record_flattener(
+                self.flatten_schema, self.flatten_key_paths, self.data_flattening_max_level,
+                columns=stream_schema_message['key_properties'])
 
         # Use external stage
         if connection_config.get('s3_bucket', None):
@@ -295,29 +326,18 @@ class DbSync:
             self.upload_client = SnowflakeUploadClient(connection_config, self)
 
     def open_connection(self):
-        """Open snowflake connection"""
+        """Check out a snowflake connection from the shared connection pool.
+        The connection is returned to the pool when the context manager exits"""
         stream = None
         if self.stream_schema_message:
             stream = self.stream_schema_message['stream']
 
-        return snowflake.connector.connect(
-            user=self.connection_config['user'],
-            authenticator='SNOWFLAKE_JWT',
-            private_key=self._pem2der(self.connection_config['private_key']),
-            account=self.connection_config['account'],
-            database=self.connection_config['dbname'],
-            warehouse=self.connection_config['warehouse'],
-            role=self.connection_config.get('role', None),
-            autocommit=True,
-            session_parameters={
-                # Quoted identifiers should be case sensitive
-                'QUOTED_IDENTIFIERS_IGNORE_CASE': 'FALSE',
-                'QUERY_TAG': create_query_tag(self.connection_config.get('query_tag'),
-                                              database=self.connection_config['dbname'],
-                                              schema=self.schema_name,
-                                              table=self.table_name(stream, False, True))
-            }
-        )
+        query_tag = create_query_tag(self.connection_config.get('query_tag'),
+                                     database=self.connection_config['dbname'],
+                                     schema=self.schema_name,
+                                     table=self.table_name(stream, False, True))
+
+        return get_connection_pool(self.connection_config).connection(query_tag=query_tag)
 
     def query(self, query: Union[str, List[str]], params: Dict = None, max_records=0) -> List[Dict]:
         """Run an SQL query in snowflake"""
@@ -361,6 +381,10 @@ class DbSync:
 
                     result = cur.fetchall()
 
+                # Connections are reused, don't leave the transaction open
+                if isinstance(query, list):
+                    cur.execute("COMMIT")
+
         return result
 
     def table_name(self, stream_name, is_temporary, without_schema=False):
@@ -384,17 +408,18 @@ class DbSync:
         """Generate a unique PK string in the record"""
         if len(self.stream_schema_message['key_properties']) == 0:
             return None
-        flatten = flattening.flatten_record(record, self.flatten_schema, max_level=self.data_flattening_max_level)
 
         key_props = []
-        for key_prop in self.stream_schema_message['key_properties']:
-            if key_prop not in flatten or flatten[key_prop] is None:
+        for key_prop, value in zip(self.stream_schema_message['key_properties'], self.primary_key_extractor(record)):
+            if value is None:
+                flatten = flattening.flatten_record(record, self.flatten_schema,
+                                                    max_level=self.data_flattening_max_level)
                 raise PrimaryKeyNotFoundException(
                     f"Primary key '{key_prop}' does not exist in record or is null. "
                     f"Available fields: {list(flatten.keys())}"
                 )
 
-            key_props.append(str(flatten[key_prop]))
+            key_props.append(str(value))
 
         return ','.join(key_props)
 
@@ -403,10 +428,19 @@ class DbSync:
         self.logger.info('Uploading %d rows to stage', count)
         return self.upload_client.upload_file(file, stream, temp_dir)
 
+    def put_files_to_stage(self, files, stream, count, temp_dir=None):
+        """Upload the part files of one batch concurrently to snowflake stage under the same key prefix"""
+        self.logger.info('Uploading %d rows to stage in %d files', count, len(files))
+        return self.upload_client.upload_files(files, stream, temp_dir)
+
     def delete_from_stage(self, stream, s3_key):
         """Delete file from snowflake stage"""
         self.upload_client.delete_object(stream, s3_key)
 
+    def delete_batch_from_stage(self, stream, s3_keys):
+        """Delete multiple files from snowflake stage"""
+        self.upload_client.delete_objects(stream, s3_keys)
+
     def copy_to_archive(self, s3_source_key, s3_archive_key, s3_archive_metadata):
         """
         Copy file from snowflake stage to archive.
@@ -446,8 +480,9 @@ class DbSync:
         table_name = self.table_name(stream, False, without_schema=True)
         return f"{self.schema_name}.%{table_name}"
 
-    def load_file(self, s3_key, count, size_bytes):
-        """Load a supported file type from snowflake stage into target table"""
+    def load_file(self, s3_key, count, size_bytes, pattern=None):
+        """Load a supported file type from snowflake stage into target table. If pattern is defined
+        then s3_key is a key prefix and every file under it that matches the pattern is loaded at once"""
         stream = self.stream_schema_message['stream']
         self.logger.info("Loading %d rows into '%s'", count, self.table_name(stream, False))
 
@@ -470,7 +505,8 @@ class DbSync:
                 inserts, updates = self._load_file_merge(
                     s3_key=s3_key,
                     stream=stream,
-                    columns_with_trans=columns_with_trans
+                    columns_with_trans=columns_with_trans,
+                    pattern=pattern
                 )
             except Exception as ex:
                 self.logger.error(
@@ -486,7 +522,8 @@ class DbSync:
                     self._load_file_copy(
                         s3_key=s3_key,
                         stream=stream,
-                        columns_with_trans=columns_with_trans
+                        columns_with_trans=columns_with_trans,
+                        pattern=pattern
                     ),
                     0,
                 )
@@ -503,7 +540,7 @@ class DbSync:
             json.dumps({'inserts': inserts, 'updates': updates, 'size_bytes': size_bytes})
         )
 
-    def _load_file_merge(self, s3_key, stream, columns_with_trans) -> Tuple[int, int]:
+    def _load_file_merge(self, s3_key, stream, columns_with_trans, pattern=None) -> Tuple[int, int]:
         # MERGE does insert and update
         inserts = 0
         updates = 0
@@ -515,7 +552,12 @@ class DbSync:
                     s3_key=s3_key,
                     file_format_name=self.connection_config['file_format'],
                     columns=columns_with_trans,
-                    pk_merge_condition=self.primary_key_merge_condition()
+                    pk_merge_condition=self.primary_key_merge_condition(),
+                    options=LoadOptions(
+                        # Spilled batches are not deduplicated before the load
+                        deduplicate_on=primary_column_names(self.stream_schema_message)
+                        if self.connection_config.get('spill_records_to_disk') else None,
+                        pattern=pattern)
                 )
                 self.logger.debug('Running query: %s', merge_sql)
                 cur.execute(merge_sql)
@@ -526,7 +568,7 @@ class DbSync:
                     updates = results[0].get('number of rows updated', 0)
         return inserts, updates
 
-    def _load_file_copy(self, s3_key, stream, columns_with_trans) -> int:
+    def _load_file_copy(self, s3_key, stream, columns_with_trans, pattern=None) -> int:
         # COPY does insert only
         inserts = 0
         with self.open_connection() as connection:
@@ -536,7 +578,8 @@ class DbSync:
                     stage_name=self.get_stage_name(stream),
                     s3_key=s3_key,
                     file_format_name=self.connection_config['file_format'],
-                    columns=columns_with_trans
+                    columns=columns_with_trans,
+                    options=LoadOptions(pattern=pattern)
                 )
                 self.logger.debug('Running query: %s', copy_sql)
                 cur.execute(copy_sql)
@@ -639,25 +682,24 @@ class DbSync:
     def create_schema_if_not_exists(self):
         """Create target schema if not exists"""
         schema_name = self.schema_name
-        schema_rows = 0
 
-        # table_cache is an optional pre-collected list of available objects in snowflake
+        # table_cache is an optional pre-collected index of available objects in snowflake
         if self.table_cache:
-            schema_rows = list(filter(lambda x: x['SCHEMA_NAME'] == schema_name.upper(), self.table_cache))
+            schema_exists = self.table_cache.has_schema(schema_name)
         # Query realtime if not pre-collected
         else:
-            schema_rows = self.query(f"SHOW SCHEMAS LIKE '{schema_name.upper()}'")
+            schema_exists = len(self.query(f"SHOW SCHEMAS LIKE '{schema_name.upper()}'")) > 0
 
-        if len(schema_rows) == 0:
+        if not schema_exists:
             query = f"CREATE SCHEMA IF NOT EXISTS {schema_name}"
             self.logger.info("Schema '%s' does not exist. Creating... %s", schema_name, query)
             self.query(query)
 
             self.grant_privilege(schema_name, self.grantees, self.grant_usage_on_schema)
 
-            # Refresh columns cache if required
-            if self.table_cache:
-                self.table_cache = self.get_table_columns(table_schemas=[self.schema_name])
+            # Register the new empty schema in the columns cache if required
+            if self.table_cache is not None:
+                self.table_cache.add_schema(schema_name)
 
     def get_tables(self, table_schemas=None):
         """Get list of tables of certain schema(s) from snowflake metadata"""
@@ -705,15 +747,19 @@ class DbSync:
         self.logger.info(f"{database_name}.{schema_name}.{table_name} is an Iceberg table: {is_iceberg_table}")
         return is_iceberg_table
 
-    def get_table_columns(self, table_schemas=None):
-        """Get list of columns and tables of certain schema(s) from snowflake metadata"""
+    def get_table_columns(self, table_schemas=None, table_name=None):
+        """Get list of columns and tables of certain schema(s) from snowflake metadata.
+        If table_name is defined then only the columns of this table are returned"""
         table_columns = []
         if table_schemas:
             for schema in table_schemas:
                 queries = []
 
                 # Get column data types by SHOW COLUMNS
-                show_columns = f"SHOW COLUMNS IN SCHEMA {self.connection_config['dbname']}.{schema}"
+                if table_name:
+                    show_columns = f"SHOW COLUMNS IN TABLE {self.connection_config['dbname']}.{schema}.{table_name}"
+                else:
+                    show_columns = f"SHOW COLUMNS IN SCHEMA {self.connection_config['dbname']}.{schema}"
 
                 # Convert output of SHOW COLUMNS to table and insert results into the cache COLUMNS table
                 #
@@ -732,6 +778,7 @@ class DbSync:
                              WHEN 'REAL'  THEN 'FLOAT'
                              ELSE PARSE_JSON("data_type"):type::varchar
                            END data_type
+                          ,PARSE_JSON("data_type"):nullable::boolean AS nullable
                       FROM TABLE(RESULT_SCAN(%(LAST_QID)s))
                 """
 
@@ -742,8 +789,9 @@ class DbSync:
                     columns = self.query(queries, max_records=99999)
 
                     if not columns:
-                        self.logger.warning('No columns discovered in the schema "%s"',
-                                            f"{self.connection_config['dbname']}.{schema}")
+                        self.logger.warning('No columns discovered in "%s"',
+                                            f"{self.connection_config['dbname']}.{schema}"
+                                            f"{'.' + table_name if table_name else ''}")
                     else:
                         table_columns.extend(columns)
 
@@ -760,26 +808,58 @@ class DbSync:
 
         return table_columns
 
+    def get_table_metadata(self, table_schemas=None, table_columns=None) -> Dict[Tuple[str, str], Dict]:
+        """
+        Get the iceberg flag, the primary keys and the not nullable columns of every table of certain
+        schema(s) from snowflake metadata, see table_cache.query_table_metadata.
+        Columns of the tables are queried by get_table_columns if not defined.
+        """
+        if not table_schemas:
+            raise Exception("Cannot get table metadata. List of table schemas empty")
+
+        if table_columns is None:
+            table_columns = self.get_table_columns(table_schemas)
+
+        return query_table_metadata(self.query, self.connection_config['dbname'], table_schemas, table_columns)
+
+    def cached_table_metadata(self) -> Union[Dict, None]:
+        """Get the metadata of the stream's table from the table metadata cache.
+        Returns None if the metadata is not cached"""
+        if self.table_metadata is None:
+            return None
+
+        return self.table_metadata.get(self._table_key())
+
+    def _table_key(self) -> Tuple[str, str]:
+        table_name = self.table_name(self.stream_schema_message['stream'], False, True)
+        return self.schema_name.upper(), table_name.strip('"')
+
+    def _update_table_metadata(self, **kwargs) -> None:
+        """Update the cached metadata of the stream's table if table metadata cache is used"""
+        if self.table_metadata is None:
+            return
+
+        self.table_metadata.setdefault(self._table_key(), new_table_metadata()).update(kwargs)
+
     def refresh_table_cache(self):
-        """Refreshes the internal table cache"""
-        self.table_cache = self.get_table_columns([self.schema_name])
+        """Refreshes the columns of the stream's table in the internal table cache"""
+        table_name = self.table_name(self.stream_schema_message['stream'], False, True)
+        columns = self.get_table_columns([self.schema_name], table_name=table_name)
+
+        if self.table_cache is None:
+            self.table_cache = TableCache()
+        self.table_cache.set_table_columns(*self._table_key(), columns)
 
     def update_columns(self, is_iceberg_table=False):
         """Adds required but not existing columns the target table according to the schema"""
         stream_schema_message = self.stream_schema_message
         stream = stream_schema_message['stream']
         table_name = self.table_name(stream, False, True)
-        all_table_columns = []
 
         if self.table_cache:
-            all_table_columns = self.table_cache
+            columns = self.table_cache.get_table_columns(self.schema_name, table_name)
         else:
-            all_table_columns = self.get_table_columns(table_schemas=[self.schema_name])
-
-        # Find the specific table
-        columns = list(filter(lambda x: x['SCHEMA_NAME'] == self.schema_name.upper() and
-                                        f'"{x["TABLE_NAME"].upper()}"' == table_name,
-                              all_table_columns))
+            columns = self.get_table_columns(table_schemas=[self.schema_name], table_name=table_name)
 
         columns_dict = {column['COLUMN_NAME'].upper(): column for column in columns}
 
@@ -837,8 +917,8 @@ class DbSync:
             self.add_column(column, stream, is_iceberg_table)
 
         # Refresh table cache if required
-        if self.table_cache and (columns_to_add or columns_to_replace):
-            self.table_cache = self.get_table_columns(table_schemas=[self.schema_name])
+        if self.table_cache is not None and (columns_to_add or columns_to_replace):
+            self.refresh_table_cache()
 
     def drop_column(self, column_name, stream):
         """Drops column from an existing table"""
@@ -880,12 +960,14 @@ class DbSync:
         iceberg_stream_dict = stream_utils.stream_name_to_dict(stream)
         iceberg_table_name = iceberg_stream_dict['table_name']
         iceberg_table_name = iceberg_table_name.replace('.', '_').replace('-', '_').upper()
-        is_iceberg_table = self.check_iceberg(self.schema_name, iceberg_table_name)
+        cached_metadata = self.cached_table_metadata()
+        if cached_metadata is not None:
+            is_iceberg_table = cached_metadata['is_iceberg']
+        else:
+            is_iceberg_table = self.check_iceberg(self.schema_name, iceberg_table_name)
 
         if self.table_cache:
-            found_tables = list(filter(lambda x: x['SCHEMA_NAME'] == self.schema_name.upper() and
-                                                f'"{x["TABLE_NAME"].upper()}"' == table_name,
-                                    self.table_cache))
+            found_tables = self.table_cache.get_table_columns(self.schema_name, table_name)
         else:
             found_tables = [table for table in (self.get_tables([self.schema_name.upper()]))
                             if f'"{table["TABLE_NAME"].upper()}"' == table_name]
@@ -903,14 +985,16 @@ class DbSync:
             self.grant_privilege(self.schema_name, self.grantees, self.grant_select_on_all_tables_in_schema)
 
             # Refresh columns cache if required
-            if self.table_cache:
-                self.table_cache = self.get_table_columns(table_schemas=[self.schema_name])
+            if self.table_cache is not None:
+                self.refresh_table_cache()
         else:
             self.logger.info('Table %s exists', table_name_with_schema)
             self.update_columns(is_iceberg_table)
 
         if not is_iceberg_table:
             self._refresh_table_pks()
+        else:
+            self._update_table_metadata(is_iceberg=True)
 
     def _refresh_table_pks(self):
         """
@@ -920,7 +1004,11 @@ class DbSync:
         """
         table_name = self.table_name(self.stream_schema_message['stream'], False)
         self.logger.info('Refreshing Table %s PK', table_name)
-        current_pks = self._get_current_pks()
+        cached_metadata = self.cached_table_metadata()
+        if cached_metadata is not None:
+            current_pks = cached_metadata['primary_keys']
+        else:
+            current_pks = self._get_current_pks()
         new_pks = set(pk.upper() for pk in self.stream_schema_message.get('key_properties', []))
 
         queries = []
@@ -945,11 +1033,27 @@ class DbSync:
             queries.append(f'alter table {table_name} add primary key({pk_list});')
 
         # For now, we don't wish to enforce non-nullability on the pk columns
-        for pk in current_pks.union(new_pks):
+        not_null_pks = current_pks.union(new_pks)
+
+        # Cached nullability is up to date only if the PK constraint is not altered
+        if cached_metadata is not None and not queries:
+            not_null_pks = not_null_pks.intersection(cached_metadata['not_null_columns'])
+
+        for pk in not_null_pks:
             queries.append(f'alter table {table_name} alter column {safe_column_name(pk)} drop not null;')
 
+        # Nothing to do if the cached PKs are up to date
+        if cached_metadata is not None and not queries:
+            self.logger.info('Table %s PK is up to date', table_name)
+            return
+
         self.query(queries)
 
+        self._update_table_metadata(
+            is_iceberg=False,
+            primary_keys=new_pks,
+            not_null_columns=(cached_metadata or {}).get('not_null_columns', set()) - not_null_pks)
+
     def _get_current_pks(self) -> Set[str]:
         """
         Finds the stream's current Pk in Snowflake.
@@ -971,17 +1075,3 @@ class DbSync:
                 raise exc
 
         return set(col['column_name'] for col in columns)
-
-    def _pem2der(self, pem_file: str, password: str = None) -> bytes:
-        """Convert Key PEM format to DER format"""
-        with open(pem_file, 'rb') as key_file:
-            p_key = serialization.load_pem_private_key(
-                key_file.read(),
-                password=password,
-            )
-        der_key = p_key.private_bytes(
-            encoding=serialization.Encoding.DER,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption())
-
-        return der_key
@@ -0,0 +1,30 @@
+"""File format specific functions to write batch files and to load them into Snowflake"""
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+
+@dataclass(frozen=True)
+class WriteOptions:
+    """
+    Options of records_to_file to convert the records of a batch to a file
+
+    data_flattening_max_level: Max level of auto flattening if a record message has nested objects
+    record_serializer:         Optional compiled function from create_record_serializer of the file format
+    row_group_size:            Max number of records in one row group, parquet files only
+    """
+    data_flattening_max_level: int = 0
+    record_serializer: Optional[Callable] = None
+    row_group_size: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class LoadOptions:
+    """
+    Options of the COPY and MERGE commands to load staged files
+
+    deduplicate_on: Primary key columns to merge only the last row of every primary key, MERGE only
+    pattern:        Regular expression of the files to load under the s3_key path. The single file
+                    at s3_key is loaded if not defined
+    """
+    deduplicate_on: Optional[List[str]] = None
+    pattern: Optional[str] = None
@@ -1,25 +1,32 @@
 """CSV file format functions"""
 import gzip
 import json
+import math
 import os
 
-from typing import Callable, Dict, List
+from json.encoder import encode_basestring
+from typing import Callable, Dict, List, Tuple
 from tempfile import mkstemp
 
 from target_snowflake import flattening
+from target_snowflake.file_formats import LoadOptions, WriteOptions
 
 
 def create_copy_sql(table_name: str,
                     stage_name: str,
                     s3_key: str,
                     file_format_name: str,
-                    columns: List):
-    """Generate a CSV compatible snowflake COPY INTO command"""
+                    columns: List,
+                    options: LoadOptions = None):
+    """Generate a CSV compatible snowflake COPY INTO command. If the pattern option is defined then every
+    file under the s3_key path that matches the pattern is loaded"""
+    options = options or LoadOptions()
     p_columns = ', '.join([c['name'] for c in columns])
+    p_pattern = f" PATTERN = '{options.pattern}'" if options.pattern else ''
 
     return f"COPY INTO {table_name} ({p_columns}) " \
            f"FROM '@{stage_name}/{s3_key}' " \
-           f"FILE_FORMAT = (format_name='{file_format_name}')"
+           f"FILE_FORMAT = (format_name='{file_format_name}'){p_pattern}"
 
 
 def create_merge_sql(table_name: str,
@@ -27,17 +34,26 @@ def create_merge_sql(table_name: str,
                      s3_key: str,
                      file_format_name: str,
                      columns: List,
-                     pk_merge_condition: str) -> str:
-    """Generate a CSV compatible snowflake MERGE INTO command"""
+                     pk_merge_condition: str,
+                     options: LoadOptions = None) -> str:
+    """Generate a CSV compatible snowflake MERGE INTO command. If deduplicate_on primary key columns
+    are defined in the options then only the last row of every primary key is merged from the file.
+    If the pattern option is defined then every file under the s3_key path that matches the pattern is merged"""
+    options = options or LoadOptions()
     p_source_columns = ', '.join([f"{c['trans']}(${i + 1}) {c['name']}" for i, c in enumerate(columns)])
     p_update = ', '.join([f"{c['name']}=s.{c['name']}" for c in columns])
     p_insert_cols = ', '.join([c['name'] for c in columns])
     p_insert_values = ', '.join([f"s.{c['name']}" for c in columns])
+    p_pattern = f", PATTERN => '{options.pattern}'" if options.pattern else ''
+    p_qualify = ''
+    if options.deduplicate_on:
+        p_qualify = f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(options.deduplicate_on)} " \
+                    "ORDER BY METADATA$FILE_ROW_NUMBER DESC) = 1"
 
     return f"MERGE INTO {table_name} t USING (" \
            f"SELECT {p_source_columns} " \
            f"FROM '@{stage_name}/{s3_key}' " \
-           f"(FILE_FORMAT => '{file_format_name}')) s " \
+           f"(FILE_FORMAT => '{file_format_name}'{p_pattern}){' ' if p_qualify else ''}{p_qualify}) s " \
            f"ON {pk_merge_condition} " \
            f"WHEN MATCHED THEN UPDATE SET {p_update} " \
            "WHEN NOT MATCHED THEN " \
@@ -70,6 +86,57 @@ def record_to_csv_line(record: dict,
     )
 
 
+def _encode_float(value: float) -> str:
+    """JSON encode a float the same way as json.dumps"""
+    if math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+
+# JSON encoders of the python types that can be found in flattened records
+_VALUE_ENCODERS = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false'
+}
+
+
+def _encode_value(value) -> str:
+    """JSON encode a value of any type the same way as json.dumps(value, ensure_ascii=False)"""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def create_record_serializer(schema: Dict,
+                             key_paths: Dict,
+                             data_flattening_max_level: int = 0) -> Callable:
+    """
+    Compile a function that transforms a record message to a CSV line. The produced CSV lines are
+    the same as the lines of record_to_csv_line but the column keys, the column order and the
+    encoder of every value type are resolved once per schema instead of once per record.
+
+    Args:
+        schema: Flattened JSONSchema of the records
+        key_paths: Original key paths of the flattened columns, as returned by flattening.flatten_schema_key_paths
+        data_flattening_max_level: Max level of auto flattening if a record message has nested objects. (Default: 0)
+
+    Returns:
+        Function with the same signature as record_to_csv_line. Only the record parameter is used,
+        the schema and the max level are compiled into the function.
+    """
+    flatten_record_values = flattening.compile_record_flattener(schema, key_paths, data_flattening_max_level)
+    get_encoder = _VALUE_ENCODERS.get
+
+    # pylint: disable=unused-argument
+    def compiled_record_to_csv_line(record: dict, *args, **kwargs) -> str:
+        return ','.join([
+            get_encoder(type(value), _encode_value)(value) if value == 0 or value else ''
+            for value in flatten_record_values(record)
+        ])
+
+    return compiled_record_to_csv_line
+
+
 def write_records_to_file(outfile,
                           records: Dict,
                           schema: Dict,
@@ -99,7 +166,7 @@ def records_to_file(records: Dict,
                     prefix: str = 'batch_',
                     compression: bool = False,
                     dest_dir: str = None,
-                    data_flattening_max_level: int = 0):
+                    options: WriteOptions = None):
     """
     Transforms a list of dictionaries with records messages to a CSV file
 
@@ -110,28 +177,88 @@ def records_to_file(records: Dict,
         prefix: Generated filename prefix
         compression: Gzip compression enabled or not (Default: False)
         dest_dir: Directory where the CSV file will be generated. (Default: OS specificy temp directory)
-        data_flattening_max_level: Max level of auto flattening if a record message has nested objects. (Default: 0)
+        options: Flattening max level and optional compiled record_serializer to transform records to CSV lines.
+                 (Default: no flattening with record_to_csv_line)
 
     Returns:
         Absolute path of the generated CSV file
     """
-    if dest_dir:
-        os.makedirs(dest_dir, exist_ok=True)
-
-    if compression:
-        file_suffix = f'.{suffix}.gz'
-    else:
-        file_suffix = f'.{suffix}'
+    options = options or WriteOptions()
+    record_to_csv_line_transformer = options.record_serializer or record_to_csv_line
 
-    filedesc, filename = mkstemp(suffix=file_suffix, prefix=prefix, dir=dest_dir)
+    filedesc, filename = _create_file(suffix, prefix, compression, dest_dir)
 
     # Using gzip or plain file object
     if compression:
         with open(filedesc, 'wb') as outfile:
             with gzip.GzipFile(filename=filename, mode='wb',fileobj=outfile) as gzipfile:
-                write_records_to_file(gzipfile, records, schema, record_to_csv_line, data_flattening_max_level)
+                write_records_to_file(gzipfile, records, schema, record_to_csv_line_transformer,
+                                      options.data_flattening_max_level)
     else:
         with open(filedesc, 'wb') as outfile:
-            write_records_to_file(outfile, records, schema, record_to_csv_line, data_flattening_max_level)
+            write_records_to_file(outfile, records, schema, record_to_csv_line_transformer,
+                                  options.data_flattening_max_level)
 
     return filename
+
+
+def _create_file(suffix: str, prefix: str, compression: bool, dest_dir: str = None) -> Tuple[int, str]:
+    """Create a new temporary file and return its file descriptor and absolute path"""
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+
+    if compression:
+        file_suffix = f'.{suffix}.gz'
+    else:
+        file_suffix = f'.{suffix}'
+
+    return mkstemp(suffix=file_suffix, prefix=prefix, dir=dest_dir)
+
+
+class RecordsFileWriter:
+    """
+    CSV file of one batch that records are appended to as they arrive, so the records of the batch
+    don't have to be kept in memory until the batch is flushed.
+
+    Records are not deduplicated by primary key, every record is written as a new line.
+    Duplicates have to be removed when the file is loaded into Snowflake.
+    """
+
+    def __init__(self,
+                 record_serializer: Callable,
+                 suffix: str = 'csv',
+                 prefix: str = 'batch_',
+                 compression: bool = False,
+                 dest_dir: str = None):
+        """
+        Args:
+            record_serializer: Compiled function from create_record_serializer to transform records to CSV lines
+            suffix: Generated filename suffix
+            prefix: Generated filename prefix
+            compression: Gzip compression enabled or not (Default: False)
+            dest_dir: Directory where the CSV file will be generated. (Default: OS specificy temp directory)
+        """
+        self.record_serializer = record_serializer
+        self.row_count = 0
+
+        filedesc, self.filename = _create_file(suffix, prefix, compression, dest_dir)
+        self._file = open(filedesc, 'wb')  # pylint: disable=consider-using-with
+        self._outfile = self._file
+        if compression:
+            self._outfile = gzip.GzipFile(filename=self.filename, mode='wb', fileobj=self._file)
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def write(self, record: Dict) -> None:
+        """Append one record to the file"""
+        self._outfile.write(bytes(self.record_serializer(record) + '\n', 'UTF-8'))
+        self.row_count += 1
+
+    def close(self) -> str:
+        """Close the file and return its absolute path"""
+        if self._outfile is not self._file:
+            self._outfile.close()
+        self._file.close()
+
+        return self.filename
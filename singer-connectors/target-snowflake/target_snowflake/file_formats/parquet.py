@@ -1,26 +1,46 @@
 """Parquet file format functions"""
+import json
 import os
-import pandas
+import pyarrow
+import pyarrow.parquet
 
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Set, Union
 from tempfile import mkstemp
 
 from target_snowflake import flattening
+from target_snowflake.file_formats import LoadOptions, WriteOptions
+from target_snowflake.exceptions import UnexpectedValueTypeException
+
+DEFAULT_ROW_GROUP_SIZE = 50000  # Max number of records converted to columns and written to the file at once
+DEFAULT_COMPRESSION = 'gzip'  # Compression codec of the parquet files if compression is enabled
+BIG_INTEGER_ARROW_TYPE = pyarrow.decimal128(38, 0)  # Integers out of the int64 range, as NUMBER(38,0)
+
+
+class _BigIntegerValues(Exception):
+    """Values of an integer column are out of the int64 range"""
+
+    def __init__(self, column: str):
+        super().__init__(column)
+        self.column = column
 
 
 def create_copy_sql(table_name: str,
                     stage_name: str,
                     s3_key: str,
                     file_format_name: str,
-                    columns: List):
-    """Generate a Parquet compatible snowflake COPY INTO command"""
+                    columns: List,
+                    options: LoadOptions = None):
+    """Generate a Parquet compatible snowflake COPY INTO command. If the pattern option is defined then every
+    file under the s3_key path that matches the pattern is loaded"""
+    options = options or LoadOptions()
     p_target_columns = ', '.join([c['name'] for c in columns])
     p_source_columns = ', '.join([f"{c['trans']}($1:{c['json_element_name']}) {c['name']}"
                                   for i, c in enumerate(columns)])
+    p_pattern = f" PATTERN = '{options.pattern}'" if options.pattern else ''
 
     return f"COPY INTO {table_name} ({p_target_columns}) " \
            f"FROM (SELECT {p_source_columns} FROM '@{stage_name}/{s3_key}') " \
-           f"FILE_FORMAT = (format_name='{file_format_name}')"
+           f"FILE_FORMAT = (format_name='{file_format_name}'){p_pattern}"
 
 
 def create_merge_sql(table_name: str,
@@ -28,18 +48,27 @@ def create_merge_sql(table_name: str,
                      s3_key: str,
                      file_format_name: str,
                      columns: List,
-                     pk_merge_condition: str) -> str:
-    """Generate a Parquet compatible snowflake MERGE INTO command"""
+                     pk_merge_condition: str,
+                     options: LoadOptions = None) -> str:
+    """Generate a Parquet compatible snowflake MERGE INTO command. If deduplicate_on primary key columns
+    are defined in the options then only the last row of every primary key is merged from the file.
+    If the pattern option is defined then every file under the s3_key path that matches the pattern is merged"""
+    options = options or LoadOptions()
     p_source_columns = ', '.join([f"{c['trans']}($1:{c['json_element_name']}) {c['name']}"
                                   for i, c in enumerate(columns)])
     p_update = ', '.join([f"{c['name']}=s.{c['name']}" for c in columns])
     p_insert_cols = ', '.join([c['name'] for c in columns])
     p_insert_values = ', '.join([f"s.{c['name']}" for c in columns])
+    p_pattern = f", PATTERN => '{options.pattern}'" if options.pattern else ''
+    p_qualify = ''
+    if options.deduplicate_on:
+        p_qualify = f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(options.deduplicate_on)} " \
+                    "ORDER BY METADATA$FILE_ROW_NUMBER DESC) = 1"
 
     return f"MERGE INTO {table_name} t USING (" \
            f"SELECT {p_source_columns} " \
            f"FROM '@{stage_name}/{s3_key}' " \
-           f"(FILE_FORMAT => '{file_format_name}')) s " \
+           f"(FILE_FORMAT => '{file_format_name}'{p_pattern}){' ' if p_qualify else ''}{p_qualify}) s " \
            f"ON {pk_merge_condition} " \
            f"WHEN MATCHED THEN UPDATE SET {p_update} " \
            "WHEN NOT MATCHED THEN " \
@@ -47,63 +76,202 @@ def create_merge_sql(table_name: str,
            f"VALUES ({p_insert_values})"
 
 
-def records_to_dataframe(records: Dict,
-                         schema: Dict,
-                         data_flattening_max_level: int = 0) -> pandas.DataFrame:
+def create_record_serializer(schema: Dict,
+                             key_paths: Dict,
+                             data_flattening_max_level: int = 0) -> Callable:
     """
-    Transforms a list of record messages into pandas dataframe with flattened records
+    Compile a function that flattens a record message into the list of column values in the order
+    of the flattened schema. The column keys are resolved once per schema instead of once per record.
+
+    Args:
+        schema: Flattened JSONSchema of the records
+        key_paths: Original key paths of the flattened columns, as returned by flattening.flatten_schema_key_paths
+        data_flattening_max_level: Max level of auto flattening if a record message has nested objects. (Default: 0)
+
+    Returns:
+        Function that takes a record and returns the list of flattened values
+    """
+    return flattening.compile_record_flattener(schema, key_paths, data_flattening_max_level)
+
+
+def column_arrow_type(schema_property: Dict) -> pyarrow.DataType:
+    """
+    Arrow type of a flattened schema property. Semi structured values are stored as JSON strings
+    and parsed by Snowflake at load time. Date and time values are stored as strings as well so
+    Snowflake converts them the same way as in CSV files. Integer columns are int64 and decimal
+    with 38 digits if they have values out of the int64 range.
+    """
+    property_type = schema_property.get('type', [])
+    arrow_type = pyarrow.string()
+
+    if 'object' in property_type or 'array' in property_type or 'format' in schema_property:
+        pass
+    elif 'number' in property_type and 'string' not in property_type:
+        arrow_type = pyarrow.float64()
+    elif 'integer' in property_type and 'string' not in property_type:
+        arrow_type = pyarrow.int64()
+    elif 'boolean' in property_type and 'string' not in property_type:
+        arrow_type = pyarrow.bool_()
+
+    return arrow_type
+
+
+def _json_dumps_value(value):
+    """JSON encode semi structured values, strings are already JSON encoded by the flattening"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _float_to_int(value):
+    """Integral floats like 1.0 are valid integers in JSON, other floats are not truncated silently"""
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'{value} is not an integral number')
+        return int(value)
+    return value
+
+
+def _column_to_array(column: str, values: List, arrow_type: pyarrow.DataType, is_variant: bool) -> pyarrow.Array:
+    """Convert the list of values of one column to an Arrow array of the column type"""
+    if is_variant:
+        return pyarrow.array([_json_dumps_value(value) for value in values], type=pyarrow.string())
+
+    try:
+        if pyarrow.types.is_integer(arrow_type) or arrow_type == BIG_INTEGER_ARROW_TYPE:
+            values = [_float_to_int(value) for value in values]
+
+        return pyarrow.array(values, type=arrow_type)
+    except OverflowError as exc:
+        if pyarrow.types.is_integer(arrow_type):
+            raise _BigIntegerValues(column) from exc
+
+        raise UnexpectedValueTypeException(
+            f"Unexpected value in column '{column}', cannot convert to parquet type {arrow_type}: {exc}") from exc
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, ValueError) as exc:
+        # Not string values of text columns are JSON encoded, the same way as in CSV files
+        if arrow_type == pyarrow.string():
+            return pyarrow.array([_json_dumps_value(value) for value in values], type=pyarrow.string())
+
+        raise UnexpectedValueTypeException(
+            f"Unexpected value in column '{column}', cannot convert to parquet type {arrow_type}: {exc}") from exc
+
+
+# pylint: disable-next=too-many-arguments
+def records_to_record_batches(records: Dict,
+                              schema: Dict,
+                              data_flattening_max_level: int = 0,
+                              record_serializer: Callable = None,
+                              row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                              big_integer_columns: Set[str] = None) -> Iterator[pyarrow.RecordBatch]:
+    """
+    Transforms record messages into Arrow record batches of at most row_group_size rows with one
+    typed column for every column of the flattened schema
 
     Args:
         records: List of dictionaries that represents a batch of singer record messages
+        schema: Flattened JSONSchema of the records
         data_flattening_max_level: Max level of auto flattening if a record message has nested objects. (Default: 0)
+        record_serializer: Optional compiled function from create_record_serializer to flatten the records
+        row_group_size: Max number of records in one record batch
+        big_integer_columns: Integer columns with values out of the int64 range, stored as decimal
 
     Returns:
-        Pandas dataframe
+        Iterator of Arrow record batches
     """
-    flattened_records = []
+    columns = list(schema)
+    arrow_types = arrow_schema(schema, big_integer_columns).types
+    variant_columns = ['object' in schema[column].get('type', []) or 'array' in schema[column].get('type', [])
+                       for column in columns]
+
+    if record_serializer is None:
+        def record_serializer(record):
+            flatten = flattening.flatten_record(record, schema, max_level=data_flattening_max_level)
+            return [flatten.get(column) for column in columns]
 
+    rows = []
     for record in records.values():
-        flatten_record = flattening.flatten_record(record, schema, max_level=data_flattening_max_level)
-        flattened_records.append(flatten_record)
+        rows.append(record_serializer(record))
 
-    return pandas.DataFrame(data=flattened_records)
+        if len(rows) >= row_group_size:
+            yield _rows_to_record_batch(rows, columns, arrow_types, variant_columns)
+            rows = []
+
+    if rows:
+        yield _rows_to_record_batch(rows, columns, arrow_types, variant_columns)
+
+
+def _rows_to_record_batch(rows: List[List], columns: List[str], arrow_types: List[pyarrow.DataType],
+                          variant_columns: List[bool]) -> pyarrow.RecordBatch:
+    arrays = [
+        _column_to_array(column, list(values), arrow_type, is_variant)
+        for column, values, arrow_type, is_variant in zip(columns, zip(*rows), arrow_types, variant_columns)
+    ]
+
+    return pyarrow.RecordBatch.from_arrays(arrays, names=columns)
 
 
 def records_to_file(records: Dict,
                     schema: Dict,
                     suffix: str = 'parquet',
                     prefix: str = 'batch_',
-                    compression: bool = False,
+                    compression: Union[bool, str] = False,
                     dest_dir: str = None,
-                    data_flattening_max_level: int = 0):
+                    options: WriteOptions = None):
     """
-    Transforms a list of dictionaries with records messages to a parquet file
+    Transforms a list of dictionaries with records messages to a parquet file. The records are
+    converted to typed columns and written to the file in row groups of row_group_size records.
 
     Args:
         records: List of dictionaries that represents a batch of singer record messages
-        schema: JSONSchema of the records
+        schema: Flattened JSONSchema of the records
         suffix: Generated filename suffix
         prefix: Generated filename prefix
-        compression: Gzip compression enabled or not (Default: False)
+        compression: Compression codec name like snappy, gzip or zstd. True means gzip. (Default: False)
         dest_dir: Directory where the parquet file will be generated. (Default: OS specificy temp directory)
-        data_flattening_max_level: Max level of auto flattening if a record message has nested objects. (Default: 0)
+        options: Flattening max level, optional compiled record_serializer to flatten the records
+                 and max number of records in one row group. (Default: DEFAULT_ROW_GROUP_SIZE)
 
     Returns:
         Absolute path of the generated parquet file
     """
+    options = options or WriteOptions()
+
     if dest_dir:
         os.makedirs(dest_dir, exist_ok=True)
 
-    if compression:
+    parquet_compression = DEFAULT_COMPRESSION if compression is True else (compression or None)
+
+    if parquet_compression == 'gzip':
         file_suffix = f'.{suffix}.gz'
-        parquet_compression='gzip'
     else:
         file_suffix = f'.{suffix}'
-        parquet_compression = None
 
-    filename = mkstemp(suffix=file_suffix, prefix=prefix, dir=dest_dir)[1]
+    filedesc, filename = mkstemp(suffix=file_suffix, prefix=prefix, dir=dest_dir)
+    os.close(filedesc)
+
+    # Row groups already written have int64 columns, the file is written again if an integer column
+    # has values out of the int64 range
+    big_integer_columns = set()
+    while True:
+        try:
+            with pyarrow.parquet.ParquetWriter(filename, arrow_schema(schema, big_integer_columns),
+                                               compression=parquet_compression) as writer:
+                for record_batch in records_to_record_batches(records, schema, options.data_flattening_max_level,
+                                                              options.record_serializer,
+                                                              options.row_group_size or DEFAULT_ROW_GROUP_SIZE,
+                                                              big_integer_columns):
+                    writer.write_batch(record_batch)
+
+            return filename
+        except _BigIntegerValues as exc:
+            big_integer_columns.add(exc.column)
 
-    dataframe = records_to_dataframe(records, schema, data_flattening_max_level)
-    dataframe.to_parquet(filename, compression=parquet_compression)
 
-    return filename
+def arrow_schema(schema: Dict, big_integer_columns: Set[str] = None) -> pyarrow.Schema:
+    """Arrow schema of the columns of a flattened schema"""
+    big_integer_columns = big_integer_columns or set()
+    return pyarrow.schema([
+        (column, BIG_INTEGER_ARROW_TYPE if column in big_integer_columns else column_arrow_type(schema[column]))
+        for column in schema
+    ])
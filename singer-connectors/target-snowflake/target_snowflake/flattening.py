@@ -52,20 +52,63 @@ def flatten_schema(d, parent_key=None, sep='__', level=0, max_level=0):
 
     Returns:
     """
+    sorted_items = sorted(((k, v) for k, _, v in _flatten_schema_items(d, parent_key, sep, level, max_level)),
+                          key=lambda item: item[0])
+    _raise_on_duplicate_keys(sorted_items)
+
+    return dict(sorted_items)
+
+
+def flatten_schema_key_paths(d, sep='__', max_level=0):
+    """
+    Get the path of keys in the original record for every column of the flattened schema
+
+    Params:
+        d: JSONSchema of the records
+        sep: Separator of the keys in the flattened column names
+        max_level: Max level of auto flattening
+
+    Returns:
+        Dictionary where the key is the flattened column name and the value is the tuple of keys
+        that lead to the value of the column in a non-flattened record
+    """
+    sorted_items = sorted(((k, path) for k, path, _ in _flatten_schema_items(d, None, sep, 0, max_level)),
+                          key=lambda item: item[0])
+    _raise_on_duplicate_keys(sorted_items)
+
+    return dict(sorted_items)
+
+
+def _raise_on_duplicate_keys(sorted_items):
+    key_func = lambda item: item[0]
+    for k, g in itertools.groupby(sorted_items, key=key_func):
+        if len(list(g)) > 1:
+            raise ValueError(f'Duplicate column name produced in schema: {k}')
+
+
+# pylint: disable=invalid-name,too-many-branches
+def _flatten_schema_items(d, parent_key, sep, level, max_level):
+    """
+    Flatten the properties of a JSONSchema
+
+    Returns:
+        List of (flattened column name, tuple of original keys, property schema) tuples
+    """
     if parent_key is None:
         parent_key = []
 
     items = []
     if 'properties' not in d:
-        return {}
+        return []
 
     for k, v in d['properties'].items():
         new_key = flatten_key(k, parent_key, sep)
+        key_path = tuple(parent_key + [k])
         if 'type' in v.keys():
             if preferred_type(v['type']) == 'object' and 'properties' in v and level < max_level:
-                items.extend(flatten_schema(v, parent_key + [k], sep=sep, level=level + 1, max_level=max_level).items())
+                items.extend(_flatten_schema_items(v, parent_key + [k], sep, level + 1, max_level))
             else:
-                items.append((new_key, v))
+                items.append((new_key, key_path, v))
         elif 'anyOf' in v:
             selected_schema = None
             selected_preferred_type = None
@@ -80,17 +123,9 @@ def flatten_schema(d, parent_key=None, sep='__', level=0, max_level=0):
 
             if selected_schema and selected_preferred_type == 'object' and \
                     'properties' in selected_schema and level < max_level:
-                items.extend(
-                    flatten_schema(
-                        selected_schema,
-                        parent_key + [k],
-                        sep=sep,
-                        level=level + 1,
-                        max_level=max_level
-                    ).items()
-                )
+                items.extend(_flatten_schema_items(selected_schema, parent_key + [k], sep, level + 1, max_level))
             else:
-                items.append((new_key, selected_schema or {'type': ['null', 'string']}))
+                items.append((new_key, key_path, selected_schema or {'type': ['null', 'string']}))
         elif len(v.values()) > 0:
             first_value = list(v.values())[0]
             selected_schema = None
@@ -101,18 +136,12 @@ def flatten_schema(d, parent_key=None, sep='__', level=0, max_level=0):
                     selected_schema = dict(first_value[0])
                     selected_schema['type'] = ['null', selected_preferred_type]
 
-            items.append((new_key, selected_schema or {'type': ['null', 'string']}))
+            items.append((new_key, key_path, selected_schema or {'type': ['null', 'string']}))
         else:
             # Preserve fields with no type declaration (e.g. Salesforce anyType) as text.
-            items.append((new_key, {'type': ['null', 'string']}))
+            items.append((new_key, key_path, {'type': ['null', 'string']}))
 
-    key_func = lambda item: item[0]
-    sorted_items = sorted(items, key=key_func)
-    for k, g in itertools.groupby(sorted_items, key=key_func):
-        if len(list(g)) > 1:
-            raise ValueError(f'Duplicate column name produced in schema: {k}')
-
-    return dict(sorted_items)
+    return items
 
 
 def _should_json_dump_value(key, value, schema=None):
@@ -159,3 +188,76 @@ def flatten_record(d, schema=None, parent_key=None, sep='__', level=0, max_level
             items.append((new_key, json.dumps(v) if _should_json_dump_value(k, v, schema) else v))
 
     return dict(items)
+
+
+def compile_record_flattener(schema, key_paths, max_level=0, columns=None):
+    """
+    Compile a function that flattens a record into the list of column values in the order of the
+    flattened schema. The values are the same as the values of flatten_record but the key of every
+    column is resolved only once per schema instead of once per record.
+
+    Params:
+        schema: Flattened JSONSchema of the records
+        key_paths: Original key paths of the flattened columns, as returned by flatten_schema_key_paths
+        max_level: Max level of auto flattening
+        columns: Optional list of flattened column names to get. (Default: every column of the schema)
+
+    Returns:
+        Function that takes a record and returns the list of flattened values, None for missing values
+    """
+    if columns is None:
+        columns = list(schema)
+
+    getters = []
+    for column in columns:
+        if column in key_paths:
+            key_path = key_paths[column]
+            getters.append(_compile_value_getter(key_path, _should_json_dump_value(key_path[-1], None, schema),
+                                                 max_level))
+        else:
+            # Column is not in the schema, it can be found only by flattening the whole record
+            getters.append(_compile_fallback_getter(column, schema, max_level))
+
+    def flatten_record_values(record):
+        return [get_value(record) for get_value in getters]
+
+    return flatten_record_values
+
+
+def _compile_value_getter(key_path, json_dump_by_schema, max_level):
+    """Compile a function that gets one flattened column value from a record"""
+    parent_keys = key_path[:-1]
+    last_key = key_path[-1]
+
+    # Objects at this level are flattened into other columns by flatten_record
+    flattens_objects = len(key_path) - 1 < max_level
+
+    def get_value(record):
+        for key in parent_keys:
+            record = record.get(key)
+            if not isinstance(record, collections.abc.MutableMapping):
+                return None
+
+        if last_key not in record:
+            return None
+
+        value = record[last_key]
+        if isinstance(value, (dict, list)):
+            if flattens_objects and isinstance(value, collections.abc.MutableMapping):
+                return None
+            return json.dumps(value)
+
+        if json_dump_by_schema:
+            return json.dumps(value)
+
+        return value
+
+    return get_value
+
+
+def _compile_fallback_getter(column, schema, max_level):
+    """Compile a function that gets one flattened column value by flattening the whole record"""
+    def get_value(record):
+        return flatten_record(record, schema, max_level=max_level).get(column)
+
+    return get_value
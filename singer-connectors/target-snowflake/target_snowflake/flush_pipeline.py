@@ -0,0 +1,114 @@
+"""Staged flush pipeline that overlaps the processing steps of consecutive batches"""
+import queue
+import threading
+
+from typing import Any, Callable, List
+
+from singer import get_logger
+
+LOGGER = get_logger('target_snowflake')
+
+DEFAULT_QUEUE_DEPTH = 1
+
+# Sentinel to shut down the stage workers
+_STOP = object()
+
+
+class FlushPipeline:
+    """
+    Runs every submitted job through an ordered list of stages. Each stage has its own worker
+    thread and the stages are connected by bounded queues, so while one job is processed by
+    the last stage the following jobs can already be processed by the earlier stages.
+
+    Jobs are processed in submission order by every stage and `on_complete` is called in the
+    same order once the last stage finished with a job. If any stage fails then every pending
+    and following job is dropped without calling `on_complete` and the exception is re-raised
+    in the thread that calls `submit`, `drain` or `close`.
+    """
+
+    def __init__(self, stages: List[Callable[[Any], None]], queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                 on_complete: Callable[[Any], None] = None):
+        """
+        Params:
+            stages: List of callables, each of them receives the job as the only argument
+            queue_depth: Max number of jobs waiting in front of every stage. Submitting more jobs blocks the caller
+            on_complete: Optional callable to run with the job when every stage finished with it
+        """
+        if queue_depth < 1:
+            raise ValueError(f'Flush pipeline queue depth has to be a positive integer, got {queue_depth}')
+
+        self.stages = stages
+        self.on_complete = on_complete
+        self.error = None
+
+        self._queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._run_stage, args=(index,), name=f'flush-pipeline-stage-{index}', daemon=True)
+            for index in range(len(stages))
+        ]
+
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, job: Any) -> None:
+        """Add a job to the pipeline. Blocks if the first stage queue is full"""
+        self._raise_if_failed()
+
+        with self._idle:
+            self._in_flight += 1
+
+        self._queues[0].put(job)
+
+    def drain(self) -> None:
+        """Wait until every submitted job went through every stage"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0)
+
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        """Wait for the submitted jobs then stop the stage workers"""
+        try:
+            self.drain()
+        finally:
+            self._queues[0].put(_STOP)
+            for worker in self._workers:
+                worker.join()
+
+    def _raise_if_failed(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def _run_stage(self, index: int) -> None:
+        is_last_stage = index == len(self.stages) - 1
+
+        while True:
+            job = self._queues[index].get()
+
+            if job is _STOP:
+                if not is_last_stage:
+                    self._queues[index + 1].put(_STOP)
+                return
+
+            # Skip every job once a previous one failed, the pipeline cannot be used anymore
+            if self.error is None:
+                try:
+                    self.stages[index](job)
+
+                    if not is_last_stage:
+                        self._queues[index + 1].put(job)
+                        continue
+
+                    if self.on_complete:
+                        self.on_complete(job)
+
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    LOGGER.error('Flush pipeline stage %d failed: %s', index, exc)
+                    self.error = exc
+
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
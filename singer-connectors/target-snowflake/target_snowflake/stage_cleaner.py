@@ -0,0 +1,139 @@
+"""Background archiving and deletion of the loaded files of the stage"""
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from singer import get_logger
+
+LOGGER = get_logger('target_snowflake')
+
+DEFAULT_MAX_WORKERS = 8  # Max number of archive copies and delete batches running at the same time
+MAX_DELETE_BATCH_SIZE = 1000  # Max number of keys deleted by one request, the limit of S3 DeleteObjects
+DELETE_BATCH_MAX_WAIT_SECONDS = 60  # Delete the queued keys of a stream at least this often
+
+
+class StageCleaner:
+    """
+    Copies the loaded files to the archive and deletes them from the stage in the background,
+    so the S3 round-trips are not on the critical path of the flushes.
+
+    Archive copies run concurrently. Keys are deleted only after their archive copy finished and
+    they are deleted in batches of up to MAX_DELETE_BATCH_SIZE keys per stream. Keys of idle streams
+    are deleted by the next `submit` once they waited DELETE_BATCH_MAX_WAIT_SECONDS. Errors of the
+    finished work are re-raised by the next `submit` and by `drain`, which has to be called before
+    the last state is emitted.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage-cleaner')
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        # Keys waiting to be deleted and the time of the first queued key by stream
+        self._pending_deletes: Dict[str, Tuple[object, List[str], float]] = {}
+
+    def submit(self, db_sync, stream: str, s3_key: str, archive_key: str = None,
+               archive_metadata: Dict = None) -> None:
+        """
+        Queue a loaded file to be archived, if archive_key is defined, then deleted from the stage
+
+        Params:
+            db_sync: DbSync instance of the stream
+            stream: Name of the stream
+            s3_key: Key of the file in the stage
+            archive_key: Optional key of the file in the archive
+            archive_metadata: S3 metadata of the archived file
+        """
+        self._remove_done_futures()
+        self._queue_stale_deletes()
+
+        if archive_key:
+            self._add_future(self._executor.submit(self._archive_and_delete, db_sync, stream, s3_key,
+                                                   archive_key, archive_metadata))
+        else:
+            self._queue_delete(db_sync, stream, s3_key)
+
+    def drain(self) -> None:
+        """Wait for every queued archive copy and delete. Re-raise the first error if any of them failed"""
+        self._wait_for_futures()
+
+        with self._lock:
+            pending_deletes = list(self._pending_deletes.items())
+            self._pending_deletes.clear()
+
+        for stream, (db_sync, keys, _) in pending_deletes:
+            self._add_future(self._executor.submit(self._delete, db_sync, stream, keys))
+
+        self._wait_for_futures()
+
+    def close(self) -> None:
+        """Wait for the queued work then stop the worker threads"""
+        try:
+            self.drain()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _add_future(self, future: Future) -> None:
+        with self._lock:
+            self._futures.append(future)
+
+    def _remove_done_futures(self) -> None:
+        """Forget the finished work and re-raise the first error of it"""
+        done = []
+        with self._lock:
+            running = []
+            for future in self._futures:
+                (done if future.done() else running).append(future)
+            self._futures = running
+
+        for future in done:
+            future.result()
+
+    def _queue_stale_deletes(self) -> None:
+        """Delete the queued keys of every stream that waited for more keys too long"""
+        now = time.monotonic()
+        with self._lock:
+            stale_streams = [stream for stream, (_, _, queued_at) in self._pending_deletes.items()
+                             if now - queued_at >= DELETE_BATCH_MAX_WAIT_SECONDS]
+            stale_deletes = [(stream, *self._pending_deletes.pop(stream)[:2]) for stream in stale_streams]
+
+        for stream, db_sync, keys in stale_deletes:
+            self._add_future(self._executor.submit(self._delete, db_sync, stream, keys))
+
+    def _wait_for_futures(self) -> None:
+        # Archive copies can queue new deletes, wait until nothing is running
+        while True:
+            with self._lock:
+                futures = self._futures
+                self._futures = []
+
+            if not futures:
+                return
+
+            for future in futures:
+                future.result()
+
+    def _archive_and_delete(self, db_sync, stream: str, s3_key: str, archive_key: str,
+                            archive_metadata: Dict) -> None:
+        db_sync.copy_to_archive(s3_key, archive_key, archive_metadata)
+        self._queue_delete(db_sync, stream, s3_key)
+
+    def _queue_delete(self, db_sync, stream: str, s3_key: str) -> None:
+        batch = None
+
+        with self._lock:
+            _, keys, queued_at = self._pending_deletes.setdefault(stream, (db_sync, [], time.monotonic()))
+            keys.append(s3_key)
+
+            if len(keys) >= MAX_DELETE_BATCH_SIZE or time.monotonic() - queued_at >= DELETE_BATCH_MAX_WAIT_SECONDS:
+                batch = keys
+                del self._pending_deletes[stream]
+
+        if batch:
+            self._add_future(self._executor.submit(self._delete, db_sync, stream, batch))
+
+    @classmethod
+    def _delete(cls, db_sync, stream: str, keys: List[str]) -> None:
+        LOGGER.info('Deleting %d files of %s from stage', len(keys), stream)
+        db_sync.delete_batch_from_stage(stream, keys)
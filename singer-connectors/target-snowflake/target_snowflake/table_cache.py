@@ -0,0 +1,113 @@
+"""Indexed cache of the Snowflake table structures"""
+import re
+import sys
+from typing import Callable, Dict, Iterator, List, Set, Tuple
+
+import snowflake.connector
+
+
+class TableCache:
+    """
+    Columns of the Snowflake tables indexed by (schema_name, table_name).
+
+    The cache is created from the column rows returned by DbSync.get_table_columns and it's shared
+    by every DbSync instance of the process. Tables are looked up by key instead of filtering every
+    column of every table, and only the columns of the altered tables are replaced after DDL.
+    Iterating the cache yields every column row, the same way as iterating the list of rows.
+    """
+
+    def __init__(self, columns: List[Dict] = None):
+        self._tables: Dict[Tuple[str, str], List[Dict]] = {}
+        self._schemas: Set[str] = set()
+
+        for column in columns or []:
+            self._schemas.add(column['SCHEMA_NAME'].upper())
+            self._tables.setdefault(self._key(column['SCHEMA_NAME'], column['TABLE_NAME']), []).append(column)
+
+    def __bool__(self) -> bool:
+        return bool(self._schemas)
+
+    def __len__(self) -> int:
+        return sum(len(columns) for columns in self._tables.values())
+
+    def __iter__(self) -> Iterator[Dict]:
+        for columns in self._tables.values():
+            yield from columns
+
+    def has_schema(self, schema_name: str) -> bool:
+        """Check if the schema is known to exist"""
+        return schema_name.upper() in self._schemas
+
+    def add_schema(self, schema_name: str) -> None:
+        """Register a new schema without any table"""
+        self._schemas.add(schema_name.upper())
+
+    def get_table_columns(self, schema_name: str, table_name: str) -> List[Dict]:
+        """Get the column rows of a table. Empty list if the table is not in the cache"""
+        return self._tables.get(self._key(schema_name, table_name), [])
+
+    def set_table_columns(self, schema_name: str, table_name: str, columns: List[Dict]) -> None:
+        """Replace the column rows of one table"""
+        self._schemas.add(schema_name.upper())
+        self._tables[self._key(schema_name, table_name)] = list(columns)
+
+    @staticmethod
+    def _key(schema_name: str, table_name: str) -> Tuple[str, str]:
+        return schema_name.upper(), table_name.strip('"').upper()
+
+
+def new_table_metadata() -> Dict:
+    """Metadata of a table without iceberg flag, primary keys and not nullable columns"""
+    return {'is_iceberg': False, 'primary_keys': set(), 'not_null_columns': set()}
+
+
+def query_table_metadata(query_fn: Callable,
+                         database_name: str,
+                         table_schemas: List[str],
+                         table_columns: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+    """
+    Get the iceberg flag, the primary keys and the not nullable columns of every table of certain
+    schema(s) from snowflake metadata. Runs one SHOW query per schema and metadata type instead
+    of one per table.
+
+    Params:
+        query_fn: A callable function that can run SQL queries in an active Snowflake session
+        database_name: Name of the database of the schemas
+        table_schemas: List of schema names
+        table_columns: Columns of the tables in the schemas, as returned by DbSync.get_table_columns
+
+    Returns:
+        Dictionary of {'is_iceberg', 'primary_keys', 'not_null_columns'} dictionaries by
+        (schema_name, table_name) tuples, in upper case
+    """
+    table_metadata = {}
+    for column in table_columns:
+        metadata = table_metadata.setdefault((column['SCHEMA_NAME'], column['TABLE_NAME']), new_table_metadata())
+
+        # Nullability is unknown if not collected, PKs of these columns are altered to be nullable
+        if not column.get('NULLABLE', False):
+            metadata['not_null_columns'].add(column['COLUMN_NAME'])
+
+    for schema in table_schemas:
+        try:
+            iceberg_tables = query_fn(f"SHOW TERSE ICEBERG TABLES IN SCHEMA {database_name}.{schema}")
+            primary_keys = query_fn(f"SHOW PRIMARY KEYS IN SCHEMA {database_name}.{schema}")
+
+        # Catch exception when schema not exists and SHOW throws a ProgrammingError
+        # Do nothing if schema not exists
+        except snowflake.connector.errors.ProgrammingError as exc:
+            if not re.match(r'002043 \(02000\):.*\n.*does not exist.*', str(sys.exc_info()[1])):
+                raise exc
+            continue
+
+        for table in iceberg_tables:
+            metadata = table_metadata.get((table['schema_name'], table['name']))
+            if metadata:
+                metadata['is_iceberg'] = True
+
+        for primary_key in primary_keys:
+            metadata = table_metadata.get((primary_key['schema_name'], primary_key['table_name']))
+            if metadata:
+                metadata['primary_keys'].add(primary_key['column_name'])
+
+    return table_metadata
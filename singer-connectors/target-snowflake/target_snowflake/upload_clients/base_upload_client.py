@@ -1,7 +1,12 @@
 """
 Base class for upload clients
 """
+import datetime
+
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
 from singer import get_logger
 
 
@@ -14,10 +19,20 @@ class BaseUploadClient(ABC):
         self.logger = get_logger('target_snowflake')
 
     @abstractmethod
-    def upload_file(self, file: str, stream: str, temp_dir: str = None) -> None:
+    def upload_file(self, file: str, stream: str, temp_dir: str = None, key_prefix: str = None) -> str:
+        """
+        Upload file. The file is uploaded under key_prefix if defined
+        """
+
+    def upload_files(self, files: List[str], stream: str, temp_dir: str = None) -> List[str]:
         """
-        Upload file
+        Upload multiple files concurrently under the same generated key prefix
         """
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        key_prefix = f"pipelinewise_{stream}_{timestamp}"
+
+        with ThreadPoolExecutor(max_workers=len(files)) as executor:
+            return list(executor.map(lambda file: self.upload_file(file, stream, temp_dir, key_prefix), files))
 
     @abstractmethod
     def delete_object(self, stream: str, key: str) -> None:
@@ -25,6 +40,13 @@ class BaseUploadClient(ABC):
         Delete object
         """
 
+    def delete_objects(self, stream: str, keys: List[str]) -> None:
+        """
+        Delete multiple objects
+        """
+        for key in keys:
+            self.delete_object(stream, key)
+
     @abstractmethod
     def copy_object(self, copy_source: str, target_bucket: str, target_key: str, target_metadata: dict) -> None:
         """
@@ -5,11 +5,17 @@ import os
 import boto3
 import datetime
 
+from boto3.s3.transfer import TransferConfig
+
+from typing import List
+
 from snowflake.connector.encryption_util import SnowflakeEncryptionUtil
 from snowflake.connector.storage_client import SnowflakeFileEncryptionMaterial
 
 from .base_upload_client import BaseUploadClient
 
+S3_DELETE_OBJECTS_MAX_KEYS = 1000
+
 
 class S3UploadClient(BaseUploadClient):
     """S3 Upload Client class"""
@@ -17,6 +23,7 @@ class S3UploadClient(BaseUploadClient):
     def __init__(self, connection_config):
         super().__init__(connection_config)
         self.s3_client = self._create_s3_client()
+        self.transfer_config = self._create_transfer_config()
 
     def _create_s3_client(self, config=None):
         if not config:
@@ -44,7 +51,15 @@ class S3UploadClient(BaseUploadClient):
                                   region_name=config.get('s3_region_name'),
                                   endpoint_url=config.get('s3_endpoint_url'))
 
-    def upload_file(self, file, stream, temp_dir=None):
+    def _create_transfer_config(self):
+        """Multipart upload settings of boto3 from the optional s3_transfer_config dictionary"""
+        transfer_config = self.connection_config.get('s3_transfer_config')
+        if not transfer_config:
+            return None
+
+        return TransferConfig(**transfer_config)
+
+    def upload_file(self, file, stream, temp_dir=None, key_prefix=None):
         """Upload file to an external snowflake stage on s3"""
         # Generating key in S3 bucket
         bucket = self.connection_config['s3_bucket']
@@ -52,7 +67,10 @@ class S3UploadClient(BaseUploadClient):
         s3_key_prefix = self.connection_config.get('s3_key_prefix', '')
         timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
 
-        s3_key = f"{s3_key_prefix}pipelinewise_{stream}_{timestamp}_{os.path.basename(file)}"
+        if key_prefix:
+            s3_key = f"{s3_key_prefix}{key_prefix}/{os.path.basename(file)}"
+        else:
+            s3_key = f"{s3_key_prefix}pipelinewise_{stream}_{timestamp}_{os.path.basename(file)}"
         self.logger.info('Target S3 bucket: %s, local file: %s, S3 key: %s', bucket, file, s3_key)
 
         # Encrypt csv if client side encryption enabled
@@ -78,7 +96,8 @@ class S3UploadClient(BaseUploadClient):
                 'x-amz-key': encryption_metadata.key,
                 'x-amz-iv': encryption_metadata.iv
             }
-            self.s3_client.upload_file(encrypted_file, bucket, s3_key, ExtraArgs=extra_args)
+            self.s3_client.upload_file(encrypted_file, bucket, s3_key, ExtraArgs=extra_args,
+                                       Config=self.transfer_config)
 
             # Remove the uploaded encrypted file
             os.remove(encrypted_file)
@@ -86,7 +105,7 @@ class S3UploadClient(BaseUploadClient):
         # Upload to S3 without encrypting
         else:
             extra_args = {'ACL': s3_acl} if s3_acl else None
-            self.s3_client.upload_file(file, bucket, s3_key, ExtraArgs=extra_args)
+            self.s3_client.upload_file(file, bucket, s3_key, ExtraArgs=extra_args, Config=self.transfer_config)
 
         return s3_key
 
@@ -96,6 +115,21 @@ class S3UploadClient(BaseUploadClient):
         bucket = self.connection_config['s3_bucket']
         self.s3_client.delete_object(Bucket=bucket, Key=key)
 
+    def delete_objects(self, stream: str, keys: List[str]) -> None:
+        """Delete objects from an external snowflake stage on S3 in batches of 1000 keys"""
+        bucket = self.connection_config['s3_bucket']
+
+        for i in range(0, len(keys), S3_DELETE_OBJECTS_MAX_KEYS):
+            batch = keys[i:i + S3_DELETE_OBJECTS_MAX_KEYS]
+            self.logger.info('Deleting %d objects from external snowflake stage on S3', len(batch))
+            response = self.s3_client.delete_objects(Bucket=bucket,
+                                                     Delete={'Objects': [{'Key': key} for key in batch],
+                                                             'Quiet': True})
+
+            errors = response.get('Errors', [])
+            if errors:
+                raise Exception(f"Failed to delete {len(errors)} objects from S3, first error: {errors[0]}")
+
     def copy_object(self, copy_source: str, target_bucket: str, target_key: str, target_metadata: dict) -> None:
         """Copy object to another location on S3"""
         self.logger.info('Copying %s to %s/%s', copy_source, target_bucket, target_key)
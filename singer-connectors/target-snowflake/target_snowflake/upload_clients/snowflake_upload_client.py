@@ -3,6 +3,8 @@ Snowflake Upload Client
 """
 import os
 
+from typing import List
+
 from .base_upload_client import BaseUploadClient
 
 
@@ -13,7 +15,7 @@ class SnowflakeUploadClient(BaseUploadClient):
         super().__init__(connection_config)
         self.dblink = dblink
 
-    def upload_file(self, file, stream, temp_dir = None):
+    def upload_file(self, file, stream, temp_dir = None, key_prefix = None):
         """Upload file to an internal snowflake stage"""
         # Generating key in S3 bucket
         key = os.path.basename(file)
@@ -21,6 +23,9 @@ class SnowflakeUploadClient(BaseUploadClient):
 
         compression = '' if self.connection_config.get('no_compression', '') else "SOURCE_COMPRESSION=GZIP"
         stage = self.dblink.get_stage_name(stream)
+        if key_prefix:
+            key = f"{key_prefix}/{key}"
+            stage = f"{stage}/{key_prefix}"
 
         self.logger.info('Target internal stage: %s, local file: %s, key: %s', stage, normfile, key)
         cmd = f"PUT 'file://{normfile}' '@{stage}' {compression}"
@@ -39,6 +44,16 @@ class SnowflakeUploadClient(BaseUploadClient):
         with self.dblink.open_connection() as connection:
             connection.cursor().execute(f"REMOVE '@{stage}/{key}'")
 
+    def delete_objects(self, stream: str, keys: List[str]) -> None:
+        """Delete objects from internal snowflake stage using one connection"""
+        self.logger.info('Deleting %d objects from internal snowflake stage', len(keys))
+        stage = self.dblink.get_stage_name(stream)
+
+        with self.dblink.open_connection() as connection:
+            with connection.cursor() as cur:
+                for key in keys:
+                    cur.execute(f"REMOVE '@{stage}/{key}'")
+
     def copy_object(self, copy_source: str, target_bucket: str, target_key: str, target_metadata: dict) -> None:
         raise NotImplementedError(
             "Copying objects is not supported with a Snowflake upload client.")
@@ -0,0 +1,57 @@
+"""
+Benchmark of Parquet file generation: rows/sec of the columnar writer of records_to_file with
+every compression codec versus the CSV writer as reference.
+
+To run the benchmark:
+    python -m tests.benchmark.benchmark_parquet_writer [--rows 100000]
+"""
+import argparse
+import os
+import timeit
+
+from target_snowflake import flattening
+from target_snowflake.file_formats import csv
+from target_snowflake.file_formats import parquet
+from target_snowflake.file_formats import WriteOptions
+
+from tests.benchmark.benchmark_record_serializer import flat_case, nested_case
+
+
+def timed(writer, *args, **kwargs):
+    """Run one writer, delete the generated file and return the elapsed seconds"""
+    filenames = []
+    seconds = timeit.timeit(lambda: filenames.append(writer(*args, **kwargs)), number=1)
+    os.remove(filenames[0])
+    return seconds
+
+
+def run(name, stream_schema, record, max_level, rows):
+    """Print rows/sec of the writers for one schema"""
+    flatten_schema = flattening.flatten_schema(stream_schema, max_level=max_level)
+    key_paths = flattening.flatten_schema_key_paths(stream_schema, max_level=max_level)
+    parquet_serializer = parquet.create_record_serializer(flatten_schema, key_paths, max_level)
+    csv_serializer = csv.create_record_serializer(flatten_schema, key_paths, max_level)
+
+    records = {str(i): dict(record) for i in range(rows)}
+    csv_seconds = timed(csv.records_to_file, records, flatten_schema, compression=True,
+                        options=WriteOptions(max_level, csv_serializer))
+
+    print(f'{name:<8} {len(flatten_schema):>4} columns | csv gzip       : {rows / csv_seconds:>10,.0f} rows/sec')
+    for compression in ['gzip', 'snappy', 'zstd']:
+        seconds = timed(parquet.records_to_file, records, flatten_schema, compression=compression,
+                        options=WriteOptions(max_level, parquet_serializer))
+        print(f'{"":<8} {"":>12} | columnar {compression:<6}: {rows / seconds:>10,.0f} rows/sec | '
+              f'speedup: {csv_seconds / seconds:.1f}x')
+
+def main():
+    """Main function"""
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=100000, help='Number of records to write')
+    args = arg_parser.parse_args()
+
+    run('flat', *flat_case(), rows=args.rows)
+    run('nested', *nested_case(), rows=args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of CSV record serialization: rows/sec of the per-record record_to_csv_line versus the
+serializer compiled once per schema by create_record_serializer.
+
+To run the benchmark:
+    python -m tests.benchmark.benchmark_record_serializer [--rows 100000]
+"""
+import argparse
+import timeit
+
+from target_snowflake import flattening
+from target_snowflake.file_formats import csv
+
+
+def flat_case(n_columns=30):
+    """Flat schema with string, integer, number, boolean and date-time columns"""
+    properties = {}
+    record = {}
+    for i in range(n_columns):
+        kind = i % 5
+        if kind == 0:
+            properties[f'str_col_{i}'] = {'type': ['null', 'string']}
+            record[f'str_col_{i}'] = f'some "quoted" text value {i}'
+        elif kind == 1:
+            properties[f'int_col_{i}'] = {'type': ['null', 'integer']}
+            record[f'int_col_{i}'] = i * 1000
+        elif kind == 2:
+            properties[f'num_col_{i}'] = {'type': ['null', 'number']}
+            record[f'num_col_{i}'] = i * 1.25
+        elif kind == 3:
+            properties[f'bool_col_{i}'] = {'type': ['null', 'boolean']}
+            record[f'bool_col_{i}'] = i % 2 == 0
+        else:
+            properties[f'ts_col_{i}'] = {'type': ['null', 'string'], 'format': 'date-time'}
+            record[f'ts_col_{i}'] = '2021-04-06T00:00:00.000000+00:00'
+
+    return {'type': 'object', 'properties': properties}, record, 0
+
+
+def nested_case(n_objects=6):
+    """Schema with nested objects flattened into columns and a variant column"""
+    properties = {'id': {'type': ['null', 'integer']},
+                  'payload': {'type': ['null', 'object', 'array']}}
+    record = {'id': 1, 'payload': {'items': [1, 2, 3], 'name': 'foo'}}
+    for i in range(n_objects):
+        properties[f'obj_{i}'] = {
+            'type': ['null', 'object'],
+            'properties': {
+                'name': {'type': ['null', 'string']},
+                'amount': {'type': ['null', 'number']},
+                'address': {
+                    'type': ['null', 'object'],
+                    'properties': {
+                        'city': {'type': ['null', 'string']},
+                        'zip': {'type': ['null', 'string']}
+                    }
+                }
+            }
+        }
+        record[f'obj_{i}'] = {'name': f'name {i}', 'amount': i + 0.5,
+                              'address': {'city': 'London', 'zip': f'E{i} 6AN'}}
+
+    return {'type': 'object', 'properties': properties}, record, 2
+
+
+def run(name, stream_schema, record, max_level, rows):
+    """Print rows/sec of the two serializers for one schema"""
+    flatten_schema = flattening.flatten_schema(stream_schema, max_level=max_level)
+    key_paths = flattening.flatten_schema_key_paths(stream_schema, max_level=max_level)
+    serializer = csv.create_record_serializer(flatten_schema, key_paths, max_level)
+
+    assert serializer(record) == csv.record_to_csv_line(record, flatten_schema, max_level)
+
+    records = [dict(record) for _ in range(rows)]
+    legacy_seconds = timeit.timeit(
+        lambda: [csv.record_to_csv_line(r, flatten_schema, max_level) for r in records], number=1)
+    compiled_seconds = timeit.timeit(lambda: [serializer(r) for r in records], number=1)
+
+    print(f'{name:<8} {len(flatten_schema):>4} columns | '
+          f'record_to_csv_line: {rows / legacy_seconds:>10,.0f} rows/sec | '
+          f'compiled: {rows / compiled_seconds:>10,.0f} rows/sec | '
+          f'speedup: {legacy_seconds / compiled_seconds:.1f}x')
+
+
+def main():
+    """Main function"""
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=100000, help='Number of records to serialize')
+    args = arg_parser.parse_args()
+
+    run('flat', *flat_case(), rows=args.rows)
+    run('nested', *nested_case(), rows=args.rows)
+
+
+if __name__ == '__main__':
+    main()
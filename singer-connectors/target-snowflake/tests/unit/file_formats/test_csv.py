@@ -4,6 +4,9 @@ import gzip
 import tempfile
 
 import target_snowflake.file_formats.csv as csv
+import target_snowflake.flattening as flattening
+
+from target_snowflake.file_formats import LoadOptions, WriteOptions
 
 
 def _mock_record_to_csv_line(record, schema, data_flattening_max_level=0):
@@ -127,3 +130,133 @@ class TestCsv(unittest.TestCase):
                          "WHEN NOT MATCHED THEN "
                          "INSERT (COL_1, COL_2, COL_3) "
                          "VALUES (s.COL_1, s.COL_2, s.COL_3)")
+
+    def test_create_merge_sql_with_deduplication(self):
+        self.assertEqual(csv.create_merge_sql(table_name='foo_table',
+                                             stage_name='foo_stage',
+                                             s3_key='foo_s3_key.csv',
+                                             file_format_name='foo_file_format',
+                                             columns=[{'name': 'COL_1', 'trans': ''},
+                                                      {'name': 'COL_2', 'trans': ''}],
+                                             pk_merge_condition='s.COL_1 = t.COL_1',
+                                             options=LoadOptions(deduplicate_on=['COL_1'])),
+
+                         "MERGE INTO foo_table t USING ("
+                         "SELECT ($1) COL_1, ($2) COL_2 "
+                         "FROM '@foo_stage/foo_s3_key.csv' "
+                         "(FILE_FORMAT => 'foo_file_format') "
+                         "QUALIFY ROW_NUMBER() OVER (PARTITION BY COL_1 ORDER BY METADATA$FILE_ROW_NUMBER DESC) = 1) s "
+                         "ON s.COL_1 = t.COL_1 "
+                         "WHEN MATCHED THEN UPDATE SET COL_1=s.COL_1, COL_2=s.COL_2 "
+                         "WHEN NOT MATCHED THEN "
+                         "INSERT (COL_1, COL_2) "
+                         "VALUES (s.COL_1, s.COL_2)")
+
+    def test_create_copy_and_merge_sql_with_pattern(self):
+        self.assertEqual(csv.create_copy_sql(table_name='foo_table',
+                                             stage_name='foo_stage',
+                                             s3_key='foo_prefix/',
+                                             file_format_name='foo_file_format',
+                                             columns=[{'name': 'COL_1'}],
+                                             options=LoadOptions(pattern='.*/(part_1[.]csv|part_2[.]csv)')),
+
+                         "COPY INTO foo_table (COL_1) FROM "
+                         "'@foo_stage/foo_prefix/' "
+                         "FILE_FORMAT = (format_name='foo_file_format') "
+                         "PATTERN = '.*/(part_1[.]csv|part_2[.]csv)'")
+
+        self.assertEqual(csv.create_merge_sql(table_name='foo_table',
+                                             stage_name='foo_stage',
+                                             s3_key='foo_prefix/',
+                                             file_format_name='foo_file_format',
+                                             columns=[{'name': 'COL_1', 'trans': ''}],
+                                             pk_merge_condition='s.COL_1 = t.COL_1',
+                                             options=LoadOptions(pattern='.*/(part_1[.]csv|part_2[.]csv)')),
+
+                         "MERGE INTO foo_table t USING ("
+                         "SELECT ($1) COL_1 "
+                         "FROM '@foo_stage/foo_prefix/' "
+                         "(FILE_FORMAT => 'foo_file_format', PATTERN => '.*/(part_1[.]csv|part_2[.]csv)')) s "
+                         "ON s.COL_1 = t.COL_1 "
+                         "WHEN MATCHED THEN UPDATE SET COL_1=s.COL_1 "
+                         "WHEN NOT MATCHED THEN "
+                         "INSERT (COL_1) "
+                         "VALUES (s.COL_1)")
+
+    def test_records_file_writer(self):
+        for compression in [False, True]:
+            writer = csv.RecordsFileWriter(lambda record: f"{record['id']},\"{record['name']}\"",
+                                           compression=compression)
+            writer.write({'id': 1, 'name': 'foo'})
+            writer.write({'id': 1, 'name': 'bar'})
+            self.assertEqual(len(writer), 2)
+
+            filename = writer.close()
+            try:
+                open_file = gzip.open if compression else open
+                with open_file(filename, 'rt') as csv_file:
+                    self.assertEqual(csv_file.read(), '1,"foo"\n1,"bar"\n')
+            finally:
+                os.remove(filename)
+
+    def test_create_record_serializer(self):
+        stream_schema = {
+            'type': 'object',
+            'properties': {
+                'c_pk': {'type': ['null', 'integer']},
+                'c_str': {'type': ['null', 'string']},
+                'c_float': {'type': ['null', 'number']},
+                'c_bool': {'type': ['null', 'boolean']},
+                'c_variant': {'type': ['null', 'object', 'array']},
+                'c_obj': {
+                    'type': ['null', 'object'],
+                    'properties': {
+                        'nested_prop1': {'type': ['null', 'string']},
+                        'nested_prop2': {
+                            'type': ['null', 'object'],
+                            'properties': {
+                                'multi_nested_prop1': {'type': ['null', 'integer']}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        records = [
+            {'c_pk': 1, 'c_str': 'I\'m "good"', 'c_float': 1.5, 'c_bool': True, 'c_variant': {'a': [1, 2]},
+             'c_obj': {'nested_prop1': 'ő,ú', 'nested_prop2': {'multi_nested_prop1': 10}}},
+            {'c_pk': 0, 'c_str': '', 'c_float': 0.0, 'c_bool': False, 'c_variant': None,
+             'c_obj': {'nested_prop1': None, 'nested_prop2': None}},
+            {'c_pk': 3, 'c_str': 'line\nbreak', 'c_float': float('nan'), 'c_variant': 'plain string',
+             'c_obj': 'not an object', 'not_in_schema': 1},
+            {'c_pk': 4, 'c_variant': [], 'c_obj': {'nested_prop2': {'multi_nested_prop1': {'deep': 1}}}},
+            {'c_pk': 5, 'c_str': 12, 'c_float': 3, 'c_obj': None}
+        ]
+
+        for max_level in range(3):
+            flatten_schema = flattening.flatten_schema(stream_schema, max_level=max_level)
+            key_paths = flattening.flatten_schema_key_paths(stream_schema, max_level=max_level)
+            serializer = csv.create_record_serializer(flatten_schema, key_paths, max_level)
+
+            for record in records:
+                self.assertEqual(serializer(record),
+                                 csv.record_to_csv_line(record, flatten_schema, max_level))
+
+    def test_records_to_file_with_record_serializer(self):
+        records = {
+            '1': {'key1': 1, 'key2': 'foo'},
+            '2': {'key1': 2, 'key2': None}
+        }
+        schema = {
+            'key1': {'type': ['null', 'integer']},
+            'key2': {'type': ['null', 'string']}
+        }
+        serializer = csv.create_record_serializer(schema, {'key1': ('key1',), 'key2': ('key2',)})
+
+        csv_file = csv.records_to_file(records, schema, options=WriteOptions(record_serializer=serializer))
+
+        with open(csv_file, 'rt') as f:
+            self.assertEqual(f.readlines(), ['1,"foo"\n', '2,\n'])
+
+        os.remove(csv_file)
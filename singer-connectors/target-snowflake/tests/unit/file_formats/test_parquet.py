@@ -1,9 +1,14 @@
+import os
 import unittest
 
-from pandas._testing import assert_frame_equal
-from pandas import DataFrame
+import pyarrow
+import pyarrow.parquet
 
 import target_snowflake.file_formats.parquet as parquet
+import target_snowflake.flattening as flattening
+
+from target_snowflake.exceptions import UnexpectedValueTypeException
+from target_snowflake.file_formats import WriteOptions
 
 
 class TestParquet(unittest.TestCase):
@@ -12,7 +17,7 @@ class TestParquet(unittest.TestCase):
         self.maxDiff = None
         self.config = {}
 
-    def test_records_to_dataframe(self):
+    def test_records_to_record_batches(self):
         records = {
             '1': {
                 'key1': 1,
@@ -40,15 +45,25 @@ class TestParquet(unittest.TestCase):
             }
         }
 
-        schema = {}
-        assert_frame_equal(parquet.records_to_dataframe(records=records, schema=schema),
-                           DataFrame({
-                               'key1': [1, 2, 3],
-                               'key2': ['2031-01-22', '2032-01-22', '2033-01-22'],
-                               'key3': ['10000-01-22 12:04:22', '10000-01-22 12:04:22', '10000-01-22 12:04:22'],
-                               'key4': ['12:01:01', '13:01:01', '14:01:01'],
-                               'key5': ['I\'m good', 'I\'m good too', 'I want to be good'],
-                               'key6': [None, None, None]}))
+        schema = {
+            'key1': {'type': ['null', 'integer']},
+            'key2': {'type': ['null', 'string'], 'format': 'date'},
+            'key3': {'type': ['null', 'string'], 'format': 'date-time'},
+            'key4': {'type': ['null', 'string'], 'format': 'time'},
+            'key5': {'type': ['null', 'string']},
+            'key6': {'type': ['null', 'object']},
+        }
+        record_batches = list(parquet.records_to_record_batches(records=records, schema=schema, row_group_size=2))
+
+        self.assertEqual([record_batch.num_rows for record_batch in record_batches], [2, 1])
+        self.assertEqual(pyarrow.Table.from_batches(record_batches).to_pydict(),
+                         {
+                             'key1': [1, 2, 3],
+                             'key2': ['2031-01-22', '2032-01-22', '2033-01-22'],
+                             'key3': ['10000-01-22 12:04:22', '10000-01-22 12:04:22', '10000-01-22 12:04:22'],
+                             'key4': ['12:01:01', '13:01:01', '14:01:01'],
+                             'key5': ['I\'m good', 'I\'m good too', 'I want to be good'],
+                             'key6': [None, None, None]})
 
     def test_create_copy_sql(self):
         self.assertEqual(parquet.create_copy_sql(table_name='foo_table',
@@ -88,3 +103,96 @@ class TestParquet(unittest.TestCase):
                          "WHEN NOT MATCHED THEN "
                          "INSERT (COL_1, COL_2, COL_3) "
                          "VALUES (s.COL_1, s.COL_2, s.COL_3)")
+
+    def test_records_to_file(self):
+        stream_schema = {
+            'type': 'object',
+            'properties': {
+                'c_pk': {'type': ['null', 'integer']},
+                'c_str': {'type': ['null', 'string']},
+                'c_float': {'type': ['null', 'number']},
+                'c_bool': {'type': ['null', 'boolean']},
+                'c_time': {'type': ['null', 'string'], 'format': 'date-time'},
+                'c_variant': {'type': ['null', 'object', 'array']},
+                'c_obj': {
+                    'type': ['null', 'object'],
+                    'properties': {
+                        'c_nested': {'type': ['null', 'integer']}
+                    }
+                }
+            }
+        }
+        records = {
+            '1': {'c_pk': 1, 'c_str': 'foo', 'c_float': 1.5, 'c_bool': True, 'c_time': '2021-04-06T00:00:00Z',
+                  'c_variant': {'key': ['value']}, 'c_obj': {'c_nested': 10}},
+            '2': {'c_pk': 2, 'c_str': 5, 'c_float': 2, 'c_bool': False, 'c_variant': [1, 2]},
+            '3': {'c_pk': 3, 'c_str': None, 'c_variant': 'already encoded'}
+        }
+        flatten_schema = flattening.flatten_schema(stream_schema)
+        key_paths = flattening.flatten_schema_key_paths(stream_schema)
+        record_serializer = parquet.create_record_serializer(flatten_schema, key_paths)
+
+        for compression in [False, True, 'snappy', 'zstd']:
+            filename = parquet.records_to_file(records, flatten_schema, compression=compression,
+                                               options=WriteOptions(record_serializer=record_serializer,
+                                                                    row_group_size=2))
+            try:
+                parquet_file = pyarrow.parquet.ParquetFile(filename)
+                self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+                self.assertEqual(parquet_file.schema_arrow.field('c_pk').type, pyarrow.int64())
+                self.assertEqual(parquet_file.schema_arrow.field('c_float').type, pyarrow.float64())
+                self.assertEqual(parquet_file.schema_arrow.field('c_bool').type, pyarrow.bool_())
+                self.assertEqual(parquet_file.schema_arrow.field('c_variant').type, pyarrow.string())
+                self.assertEqual(parquet_file.read().to_pylist(), [
+                    {'c_pk': 1, 'c_str': 'foo', 'c_float': 1.5, 'c_bool': True, 'c_time': '2021-04-06T00:00:00Z',
+                     'c_variant': '{"key": ["value"]}', 'c_obj': '{"c_nested": 10}'},
+                    {'c_pk': 2, 'c_str': '5', 'c_float': 2.0, 'c_bool': False, 'c_time': None,
+                     'c_variant': '[1, 2]', 'c_obj': None},
+                    {'c_pk': 3, 'c_str': None, 'c_float': None, 'c_bool': None, 'c_time': None,
+                     'c_variant': '"already encoded"', 'c_obj': None}
+                ])
+            finally:
+                os.remove(filename)
+
+    def test_records_to_file_with_unexpected_value_type(self):
+        schema = {'c_pk': {'type': ['null', 'integer']}}
+
+        with self.assertRaises(UnexpectedValueTypeException):
+            filename = parquet.records_to_file({'1': {'c_pk': 'not an integer'}}, schema)
+            os.remove(filename)
+
+    def test_records_to_file_with_integral_floats(self):
+        schema = {'c_pk': {'type': ['null', 'integer']}}
+
+        filename = parquet.records_to_file({'1': {'c_pk': 1.0}, '2': {'c_pk': 2}, '3': {'c_pk': None}}, schema)
+        try:
+            self.assertEqual(pyarrow.parquet.read_table(filename).to_pylist(),
+                             [{'c_pk': 1}, {'c_pk': 2}, {'c_pk': None}])
+        finally:
+            os.remove(filename)
+
+        # Other floats are not truncated
+        with self.assertRaises(UnexpectedValueTypeException):
+            filename = parquet.records_to_file({'1': {'c_pk': 1.5}}, schema)
+            os.remove(filename)
+
+    def test_records_to_file_with_big_integers(self):
+        schema = {'c_int': {'type': ['null', 'integer']}, 'c_big': {'type': ['null', 'integer']}}
+        records = {'1': {'c_int': 1, 'c_big': 1}, '2': {'c_int': 2, 'c_big': 2 ** 70}, '3': {'c_int': 3, 'c_big': None}}
+
+        # The value out of the int64 range is in the second row group, after the first one is written
+        filename = parquet.records_to_file(records, schema, options=WriteOptions(row_group_size=1))
+        try:
+            table = pyarrow.parquet.read_table(filename)
+            self.assertEqual(table.schema.field('c_int').type, pyarrow.int64())
+            self.assertEqual(table.schema.field('c_big').type, pyarrow.decimal128(38, 0))
+            self.assertEqual(table.to_pylist(), [{'c_int': 1, 'c_big': 1},
+                                                 {'c_int': 2, 'c_big': 2 ** 70},
+                                                 {'c_int': 3, 'c_big': None}])
+        finally:
+            os.remove(filename)
+
+        # Values out of the NUMBER(38,0) range cannot be loaded
+        with self.assertRaises(UnexpectedValueTypeException):
+            filename = parquet.records_to_file({'1': {'c_int': 1, 'c_big': 10 ** 40}}, schema)
+            os.remove(filename)
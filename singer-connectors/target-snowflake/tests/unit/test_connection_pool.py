@@ -0,0 +1,119 @@
+import unittest
+
+from unittest.mock import MagicMock, patch, call
+
+import target_snowflake.connection_pool as connection_pool
+
+
+CONFIG = {
+    'account': 'dummy-account',
+    'dbname': 'dummy-db',
+    'user': 'dummy-user',
+    'private_key': 'dummy-key',
+    'warehouse': 'dummy-warehouse'
+}
+
+
+def _connection_mock(**kwargs):
+    connection = MagicMock()
+    connection.is_closed.return_value = False
+    return connection
+
+
+@patch('target_snowflake.connection_pool.pem2der', return_value=b'dummy-der')
+@patch('target_snowflake.connection_pool.snowflake.connector.connect')
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.maxDiff = None
+
+    def tearDown(self):
+        connection_pool.close_connection_pools()
+
+    def test_connection_is_reused(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with pool.connection(query_tag='tag') as first:
+            pass
+        with pool.connection(query_tag='tag') as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(connect_mock.call_count, 1)
+        self.assertEqual(connect_mock.call_args.kwargs['session_parameters']['QUERY_TAG'], 'tag')
+
+        # Query tag was set at connect time, no ALTER SESSION required
+        first.cursor.return_value.__enter__.return_value.execute.assert_not_called()
+
+    def test_query_tag_is_changed_on_checkout(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with pool.connection(query_tag='tag_1'):
+            pass
+        with pool.connection(query_tag='tag_2') as connection:
+            pass
+        with pool.connection(query_tag=None):
+            pass
+
+        self.assertEqual(connection.cursor.return_value.__enter__.return_value.execute.mock_calls, [
+            call('ALTER SESSION SET QUERY_TAG = %(query_tag)s', {'query_tag': 'tag_2'}),
+            call('ALTER SESSION UNSET QUERY_TAG')
+        ])
+
+    def test_new_connection_opened_when_every_connection_is_in_use(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG, size=1)
+
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+
+        # Only one connection is kept in the pool, the other one is closed
+        self.assertEqual(connect_mock.call_count, 2)
+        self.assertEqual(first.close.call_count + second.close.call_count, 1)
+
+    def test_idle_connection_is_evicted(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG, idle_timeout=0)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIsNot(first, second)
+        first.close.assert_called_once()
+
+    def test_closed_connection_is_replaced(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with pool.connection() as first:
+            first.is_closed.return_value = True
+        with pool.connection() as second:
+            pass
+
+        self.assertIsNot(first, second)
+
+    def test_failed_query_rolls_back(self, connect_mock, pem2der_mock):
+        connect_mock.side_effect = _connection_mock
+        pool = connection_pool.ConnectionPool(CONFIG)
+
+        with self.assertRaises(ValueError):
+            with pool.connection() as connection:
+                raise ValueError('Query failed')
+
+        connection.rollback.assert_called_once()
+
+        # Connection is still reusable
+        with pool.connection():
+            pass
+        self.assertEqual(connect_mock.call_count, 1)
+
+    def test_pool_is_shared_per_config(self, connect_mock, pem2der_mock):
+        self.assertIs(connection_pool.get_connection_pool(CONFIG),
+                      connection_pool.get_connection_pool(dict(CONFIG)))
+        self.assertIsNot(connection_pool.get_connection_pool(CONFIG),
+                         connection_pool.get_connection_pool({**CONFIG, 'role': 'other_role'}))
@@ -5,6 +5,7 @@ from unittest.mock import patch, call
 
 from target_snowflake import db_sync
 from target_snowflake.exceptions import PrimaryKeyNotFoundException
+from target_snowflake.table_cache import TableCache
 
 
 class TestDBSync(unittest.TestCase):
@@ -330,6 +331,36 @@ class TestDBSync(unittest.TestCase):
         dbsync = db_sync.DbSync(minimal_config, stream_schema_message)
         self.assertEqual(dbsync.record_primary_key_string({'id': 1, 'c_bool': False, 'c_str': 'xyz'}), '1,False')
 
+    @patch('target_snowflake.db_sync.flattening.flatten_record')
+    @patch('target_snowflake.db_sync.DbSync.query')
+    def test_record_primary_key_string_with_flattening(self, query_patch, flatten_record_patch):
+        query_patch.return_value = [{'type': 'CSV'}]
+        minimal_config = {
+            'account': "dummy-value",
+            'dbname': "dummy-value",
+            'user': "dummy-value",
+            'private_key': "dummy-key",
+            'warehouse': "dummy-value",
+            'default_target_schema': "dummy-value",
+            'file_format': "dummy-value",
+            'data_flattening_max_level': 1
+        }
+
+        stream_schema_message = {"stream": "public-table1",
+                                 "schema": {
+                                     "properties": {
+                                         "id": {"type": ["integer"]},
+                                         "c_obj": {"type": ["null", "object"],
+                                                   "properties": {"c_id": {"type": ["string"]}}}
+                                     }},
+                                 "key_properties": ["id", "c_obj__c_id"]}
+
+        dbsync = db_sync.DbSync(minimal_config, stream_schema_message)
+        self.assertEqual(dbsync.record_primary_key_string({'id': 123, 'c_obj': {'c_id': 'xyz'}}), '123,xyz')
+
+        # Primary key columns are read directly, records are not flattened
+        flatten_record_patch.assert_not_called()
+
     @patch('target_snowflake.db_sync.DbSync.query')
     @patch('target_snowflake.db_sync.DbSync._load_file_merge')
     def test_merge_failure_message(self, load_file_merge_patch, query_patch):
@@ -631,6 +662,134 @@ class TestDBSync(unittest.TestCase):
                   'alter table dummy-schema."TABLE1" alter column "ID" drop not null;'])
         ])
 
+    @patch('target_snowflake.db_sync.DbSync.query')
+    def test_get_table_metadata(self, query_patch):
+        minimal_config = {
+            'account': "dummy-account",
+            'dbname': "dummy-db",
+            'user': "dummy-user",
+            'private_key': "dummy-key",
+            'warehouse': "dummy-wh",
+            'default_target_schema': "dummy-schema",
+            'file_format': "dummy-file-format"
+        }
+        table_columns = [
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER',
+             'NULLABLE': False},
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'C_STR', 'DATA_TYPE': 'TEXT',
+             'NULLABLE': True},
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE2', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER',
+             'NULLABLE': True}
+        ]
+        query_patch.side_effect = [
+            [{'type': 'CSV'}],                                                       # SHOW FILE FORMATS
+            [{'schema_name': 'DUMMY-SCHEMA', 'name': 'TABLE2'}],                    # SHOW TERSE ICEBERG TABLES
+            [{'schema_name': 'DUMMY-SCHEMA', 'table_name': 'TABLE1', 'column_name': 'ID'}]  # SHOW PRIMARY KEYS
+        ]
+
+        dbsync = db_sync.DbSync(minimal_config)
+        table_metadata = dbsync.get_table_metadata(['dummy-schema'], table_columns)
+
+        query_patch.assert_has_calls([
+            call('SHOW TERSE ICEBERG TABLES IN SCHEMA dummy-db.dummy-schema'),
+            call('SHOW PRIMARY KEYS IN SCHEMA dummy-db.dummy-schema')
+        ])
+        self.assertEqual(table_metadata, {
+            ('DUMMY-SCHEMA', 'TABLE1'): {'is_iceberg': False, 'primary_keys': {'ID'}, 'not_null_columns': {'ID'}},
+            ('DUMMY-SCHEMA', 'TABLE2'): {'is_iceberg': True, 'primary_keys': set(), 'not_null_columns': set()}
+        })
+
+    @patch('target_snowflake.db_sync.DbSync.query')
+    def test_sync_table_with_cached_table_metadata(self, query_patch):
+        minimal_config = {
+            'account': "dummy-account",
+            'dbname': "dummy-db",
+            'user': "dummy-user",
+            'private_key': "dummy-key",
+            'warehouse': "dummy-wh",
+            'default_target_schema': "dummy-schema",
+            'file_format': "dummy-file-format"
+        }
+
+        stream_schema_message = {"stream": "public-table1",
+                                 "schema": {
+                                     "properties": {
+                                         "id": {"type": ["integer"]},
+                                         "c_str": {"type": ["null", "string"]}}},
+                                 "key_properties": ["id"]}
+
+        table_cache = [
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'},
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'C_STR', 'DATA_TYPE': 'TEXT'}
+        ]
+        table_metadata = {
+            ('DUMMY-SCHEMA', 'TABLE1'): {'is_iceberg': False, 'primary_keys': {'ID'}, 'not_null_columns': {'ID'}}
+        }
+        query_patch.side_effect = [
+            [{'type': 'CSV'}],           # SHOW FILE FORMATS
+            None,                         # ALTER TABLE
+            [{'type': 'CSV'}],           # SHOW FILE FORMATS
+        ]
+
+        # PK column is not nullable, only the not null constraint is dropped
+        dbsync = db_sync.DbSync(minimal_config, stream_schema_message, table_cache, None, table_metadata)
+        dbsync.sync_table()
+
+        self.assertEqual(query_patch.call_args_list, [
+            call('SHOW FILE FORMATS LIKE \'dummy-file-format\''),
+            call(['alter table dummy-schema."TABLE1" alter column "ID" drop not null;'])
+        ])
+        self.assertEqual(table_metadata[('DUMMY-SCHEMA', 'TABLE1')]['not_null_columns'], set())
+
+        # Same schema again, nothing to alter
+        query_patch.reset_mock()
+        dbsync = db_sync.DbSync(minimal_config, stream_schema_message, table_cache, None, table_metadata)
+        dbsync.sync_table()
+
+        self.assertEqual(query_patch.call_args_list, [
+            call('SHOW FILE FORMATS LIKE \'dummy-file-format\'')
+        ])
+
+    @patch('target_snowflake.db_sync.DbSync.grant_privilege')
+    @patch('target_snowflake.db_sync.DbSync.query')
+    def test_sync_table_refreshes_only_the_created_table_in_table_cache(self, query_patch, grant_patch):
+        minimal_config = {
+            'account': "dummy-account",
+            'dbname': "dummy-db",
+            'user': "dummy-user",
+            'private_key': "dummy-key",
+            'warehouse': "dummy-wh",
+            'default_target_schema': "dummy-schema",
+            'file_format': "dummy-file-format"
+        }
+        stream_schema_message = {"stream": "public-table2",
+                                 "schema": {"properties": {"id": {"type": ["integer"]}}},
+                                 "key_properties": []}
+
+        table_cache = TableCache([
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'}
+        ])
+        new_columns = [
+            {'SCHEMA_NAME': 'DUMMY-SCHEMA', 'TABLE_NAME': 'TABLE2', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'}
+        ]
+        query_patch.side_effect = [
+            [{'type': 'CSV'}],    # SHOW FILE FORMATS
+            [],                    # SHOW TERSE ICEBERG TABLES
+            None,                  # CREATE TABLE
+            new_columns,           # SHOW COLUMNS IN TABLE
+            [],                    # show primary keys
+            None                   # ALTER TABLE
+        ]
+
+        dbsync = db_sync.DbSync(minimal_config, stream_schema_message, table_cache)
+        dbsync.sync_table()
+
+        self.assertIs(dbsync.table_cache, table_cache)
+        self.assertEqual(query_patch.call_args_list[3][0][0][0],
+                         'SHOW COLUMNS IN TABLE dummy-db.dummy-schema."TABLE2"')
+        self.assertEqual(table_cache.get_table_columns('DUMMY-SCHEMA', 'TABLE2'), new_columns)
+        self.assertEqual(len(table_cache), 2)
+
     # -----------------------------------------------------------------------
     # Tests for WDL-155: Iceberg column type handling
     # -----------------------------------------------------------------------
@@ -361,3 +361,41 @@ class TestFlattening(unittest.TestCase):
         for idx, (should_use_flatten_schema, record, expected_output) in enumerate(test_cases):
             output = flatten_record(record, flatten_schema if should_use_flatten_schema else None)
             self.assertEqual(output, expected_output, f"Test {idx} failed. Testcase: {test_cases[idx]}")
+
+    def test_flatten_schema_key_paths(self):
+        """Test key paths of the flattened columns"""
+        schema = {
+            "type": "object",
+            "properties": {
+                "c_pk": {"type": ["null", "integer"]},
+                "c_obj": {
+                    "anyOf": [
+                        {
+                            "type": ["null", "object"],
+                            "properties": {
+                                "nested_prop1": {"type": ["null", "string"]},
+                                "nested_prop2": {
+                                    "type": ["null", "object"],
+                                    "properties": {
+                                        "multi_nested_prop1": {"type": ["null", "string"]}
+                                    }
+                                }
+                            }
+                        }
+                    ]
+                },
+                "c" * 300: {"type": ["null", "string"]}
+            }
+        }
+
+        # Key paths of every flattened column
+        for max_level in range(3):
+            self.assertEqual(list(flattening.flatten_schema_key_paths(schema, max_level=max_level)),
+                             list(flattening.flatten_schema(schema, max_level=max_level)))
+
+        self.assertEqual(flattening.flatten_schema_key_paths(schema, max_level=1), {
+            "c_pk": ("c_pk",),
+            "c_obj__nested_prop1": ("c_obj", "nested_prop1"),
+            "c_obj__nested_prop2": ("c_obj", "nested_prop2"),
+            flattening.flatten_key("c" * 300, [], "__"): ("c" * 300,)
+        })
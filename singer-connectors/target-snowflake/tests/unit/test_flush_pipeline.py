@@ -0,0 +1,69 @@
+import threading
+import unittest
+
+from target_snowflake.flush_pipeline import FlushPipeline
+
+
+class TestFlushPipeline(unittest.TestCase):
+
+    def test_jobs_go_through_every_stage_in_order(self):
+        completed = []
+        pipeline = FlushPipeline(stages=[lambda job: job.append('write'),
+                                         lambda job: job.append('upload'),
+                                         lambda job: job.append('load')],
+                                 queue_depth=2,
+                                 on_complete=completed.append)
+
+        jobs = [[i] for i in range(10)]
+        for job in jobs:
+            pipeline.submit(job)
+        pipeline.close()
+
+        self.assertEqual(completed, [[i, 'write', 'upload', 'load'] for i in range(10)])
+
+    def test_stages_process_different_jobs_at_the_same_time(self):
+        first_job_loading = threading.Event()
+        second_job_written = threading.Event()
+
+        def write(job):
+            if job == 2:
+                second_job_written.set()
+
+        def load(job):
+            if job == 1:
+                first_job_loading.set()
+                # Blocks forever if the second job cannot be written while the first one is loading
+                self.assertTrue(second_job_written.wait(timeout=5))
+
+        pipeline = FlushPipeline(stages=[write, load])
+        pipeline.submit(1)
+        pipeline.submit(2)
+        pipeline.close()
+
+        self.assertTrue(first_job_loading.is_set())
+
+    def test_failed_stage_drops_following_jobs(self):
+        completed = []
+
+        def load(job):
+            if job == 2:
+                raise ValueError('Load failed')
+
+        pipeline = FlushPipeline(stages=[lambda job: None, load], on_complete=completed.append)
+        pipeline.submit(1)
+        pipeline.submit(2)
+
+        with self.assertRaises(ValueError):
+            pipeline.drain()
+
+        with self.assertRaises(ValueError):
+            pipeline.submit(3)
+
+        with self.assertRaises(ValueError):
+            pipeline.close()
+
+        self.assertEqual(completed, [1])
+
+    def test_invalid_queue_depth(self):
+        with self.assertRaises(ValueError):
+            FlushPipeline(stages=[lambda job: None], queue_depth=0)
@@ -0,0 +1,78 @@
+import unittest
+
+from concurrent.futures import wait
+from unittest.mock import MagicMock, patch
+
+from target_snowflake import stage_cleaner
+from target_snowflake.stage_cleaner import StageCleaner
+
+
+class TestStageCleaner(unittest.TestCase):
+
+    def test_delete_in_batches(self):
+        db_sync = MagicMock()
+        cleaner = StageCleaner(max_workers=2)
+
+        for i in range(stage_cleaner.MAX_DELETE_BATCH_SIZE + 5):
+            cleaner.submit(db_sync, 'stream1', f'key_{i}')
+        cleaner.close()
+
+        batches = [call[0][1] for call in db_sync.delete_batch_from_stage.call_args_list]
+        self.assertEqual([len(keys) for keys in batches], [stage_cleaner.MAX_DELETE_BATCH_SIZE, 5])
+        self.assertEqual(sum(batches, []), [f'key_{i}' for i in range(stage_cleaner.MAX_DELETE_BATCH_SIZE + 5)])
+
+    def test_delete_after_archive(self):
+        calls = []
+        db_sync = MagicMock()
+        db_sync.copy_to_archive.side_effect = lambda s3_key, *args: calls.append(('archive', s3_key))
+        db_sync.delete_batch_from_stage.side_effect = lambda stream, keys: calls.append(('delete', keys))
+
+        cleaner = StageCleaner()
+        cleaner.submit(db_sync, 'stream1', 'key_1', 'archive/key_1', {'tap': 'tap1'})
+        cleaner.submit(db_sync, 'stream2', 'key_2')
+        cleaner.close()
+
+        db_sync.copy_to_archive.assert_called_once_with('key_1', 'archive/key_1', {'tap': 'tap1'})
+        self.assertLess(calls.index(('archive', 'key_1')), calls.index(('delete', ['key_1'])))
+        self.assertIn(('delete', ['key_2']), calls)
+
+    def test_drain_raises_error(self):
+        db_sync = MagicMock()
+        db_sync.copy_to_archive.side_effect = Exception('Access denied')
+
+        cleaner = StageCleaner()
+        cleaner.submit(db_sync, 'stream1', 'key_1', 'archive/key_1')
+
+        with self.assertRaises(Exception):
+            cleaner.close()
+        db_sync.delete_batch_from_stage.assert_not_called()
+
+    def test_submit_raises_error_of_finished_work(self):
+        db_sync = MagicMock()
+        db_sync.copy_to_archive.side_effect = Exception('Access denied')
+
+        cleaner = StageCleaner()
+        cleaner.submit(db_sync, 'stream1', 'key_1', 'archive/key_1')
+        wait(cleaner._futures)
+
+        with self.assertRaises(Exception):
+            cleaner.submit(db_sync, 'stream1', 'key_2', 'archive/key_2')
+        # Finished work is not kept until the end of the run
+        self.assertEqual(cleaner._futures, [])
+
+    @patch('target_snowflake.stage_cleaner.time.monotonic')
+    def test_delete_keys_of_idle_streams(self, monotonic):
+        db_sync = MagicMock()
+        cleaner = StageCleaner()
+
+        monotonic.return_value = 0
+        cleaner.submit(db_sync, 'stream1', 'key_1')
+
+        # Keys of stream1 are deleted by the next submit of another stream once they waited too long
+        monotonic.return_value = stage_cleaner.DELETE_BATCH_MAX_WAIT_SECONDS
+        cleaner.submit(db_sync, 'stream2', 'key_2')
+        wait(cleaner._futures)
+
+        db_sync.delete_batch_from_stage.assert_called_once_with('stream1', ['key_1'])
+        cleaner.close()
+        db_sync.delete_batch_from_stage.assert_called_with('stream2', ['key_2'])
@@ -0,0 +1,45 @@
+import unittest
+
+from target_snowflake.table_cache import TableCache
+
+
+class TestTableCache(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = [
+            {'SCHEMA_NAME': 'SCHEMA1', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'},
+            {'SCHEMA_NAME': 'SCHEMA1', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'C_STR', 'DATA_TYPE': 'TEXT'},
+            {'SCHEMA_NAME': 'SCHEMA2', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'}
+        ]
+
+    def test_get_table_columns(self):
+        table_cache = TableCache(self.columns)
+
+        self.assertEqual(table_cache.get_table_columns('schema1', '"TABLE1"'), self.columns[:2])
+        self.assertEqual(table_cache.get_table_columns('SCHEMA2', 'table1'), self.columns[2:])
+        self.assertEqual(table_cache.get_table_columns('SCHEMA1', 'TABLE2'), [])
+        self.assertEqual(list(table_cache), self.columns)
+        self.assertEqual(len(table_cache), 3)
+
+    def test_schemas(self):
+        table_cache = TableCache()
+        self.assertFalse(table_cache)
+        self.assertFalse(table_cache.has_schema('schema1'))
+
+        table_cache.add_schema('schema1')
+        self.assertTrue(table_cache)
+        self.assertTrue(table_cache.has_schema('SCHEMA1'))
+        self.assertEqual(table_cache.get_table_columns('SCHEMA1', 'TABLE1'), [])
+
+    def test_set_table_columns(self):
+        table_cache = TableCache(self.columns)
+        new_columns = [
+            {'SCHEMA_NAME': 'SCHEMA1', 'TABLE_NAME': 'TABLE1', 'COLUMN_NAME': 'ID', 'DATA_TYPE': 'NUMBER'}
+        ]
+
+        table_cache.set_table_columns('SCHEMA1', '"TABLE1"', new_columns)
+        table_cache.set_table_columns('SCHEMA3', '"TABLE1"', new_columns)
+
+        self.assertEqual(table_cache.get_table_columns('SCHEMA1', 'TABLE1'), new_columns)
+        self.assertEqual(table_cache.get_table_columns('SCHEMA2', 'TABLE1'), self.columns[2:])
+        self.assertTrue(table_cache.has_schema('SCHEMA3'))
@@ -1,3 +1,4 @@
+import gzip
 import io
 import json
 import unittest
@@ -9,6 +10,7 @@ from datetime import datetime, timedelta
 from unittest.mock import patch
 
 import target_snowflake
+from target_snowflake.file_formats import csv
 
 
 def _mock_record_to_csv_line(record):
@@ -174,3 +176,248 @@ class TestTargetSnowflake(unittest.TestCase):
             buf.getvalue().strip(),
             '{"bookmarks": {"tap_mysql_test-test_simple_table": {"replication_key": "id", '
             '"replication_key_value": 100, "version": 1}}}')
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_pipelined_flush(self, os_remove_mock, dbSync_mock):
+        """
+        Given pipelined flush enabled, every batch should be loaded and states emitted only after the load
+        """
+        self.config['batch_size_rows'] = 15
+        self.config['pipelined_flush'] = True
+
+        with open(f'{os.path.dirname(__file__)}/resources/logical-streams.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.create_schema_if_not_exists.return_value = None
+        instance.sync_table.return_value = None
+        instance.put_to_stage.return_value = 'some-s3-folder/some-name_date_batch_hash.csg.gz'
+        instance.record_primary_key_string.return_value = None
+
+        states_emitted_before_load = []
+        instance.load_file.side_effect = lambda *args: states_emitted_before_load.append(len(buf.getvalue().splitlines()))
+
+        # catch stdout
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            target_snowflake.persist_lines(self.config, lines)
+
+        # Two full batches of 15 records and a last one with the remaining 10 records
+        self.assertEqual(instance.load_file.call_count, 3)
+        self.assertEqual(instance.put_to_stage.call_count, 3)
+        self.assertEqual(instance.delete_from_stage.call_count, 3)
+
+        # Nothing emitted before the first load and one state emitted after every loaded batch
+        self.assertEqual(states_emitted_before_load, [0, 1, 2])
+
+        states = [json.loads(line) for line in buf.getvalue().splitlines()]
+        self.assertEqual(states[-1], json.loads(lines[-1])['value'])
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_pipelined_flush_failing_load(self, os_remove_mock, dbSync_mock):
+        """
+        Given pipelined flush enabled and a failing load, no state should be emitted
+        """
+        self.config['batch_size_rows'] = 15
+        self.config['pipelined_flush'] = True
+
+        with open(f'{os.path.dirname(__file__)}/resources/logical-streams.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.create_schema_if_not_exists.return_value = None
+        instance.sync_table.return_value = None
+        instance.load_file.side_effect = Exception('MERGE failed')
+
+        # catch stdout
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            with self.assertRaises(Exception) as context:
+                target_snowflake.persist_lines(self.config, lines)
+
+        self.assertEqual(str(context.exception), 'MERGE failed')
+        self.assertEqual(buf.getvalue(), '')
+
+    @patch('target_snowflake.flush_streams')
+    @patch('target_snowflake.DbSync')
+    def test_persist_lines_with_batch_size_bytes(self, dbSync_mock, flush_streams_mock):
+        """
+        Given batch_size_bytes, the buffered streams should be flushed every time the budget is reached
+        """
+        with open(f'{os.path.dirname(__file__)}/resources/logical-streams.json', 'r') as f:
+            lines = f.readlines()
+
+        record_sizes = [len(line) for line in lines if json.loads(line)['type'] == 'RECORD']
+        self.config['batch_size_bytes'] = sum(record_sizes[:10])
+
+        instance = dbSync_mock.return_value
+        instance.create_schema_if_not_exists.return_value = None
+        instance.sync_table.return_value = None
+        instance.record_primary_key_string.side_effect = lambda record: str(record['cid'])
+
+        def flush_streams(streams, row_count, *args, filter_streams=None, **kwargs):
+            for stream in filter_streams or list(streams):
+                streams[stream] = {}
+                row_count[stream] = 0
+
+        flush_streams_mock.side_effect = flush_streams
+
+        target_snowflake.persist_lines(self.config, lines)
+
+        # Flushed every time the budget is reached and once more at the end of the input
+        expected_flushes, buffered_bytes = 0, 0
+        for record_size in record_sizes:
+            buffered_bytes += record_size
+            if buffered_bytes >= self.config['batch_size_bytes']:
+                expected_flushes, buffered_bytes = expected_flushes + 1, 0
+        if buffered_bytes > 0:
+            expected_flushes += 1
+
+        self.assertGreater(expected_flushes, 1)
+        self.assertEqual(flush_streams_mock.call_count, expected_flushes)
+        for call in flush_streams_mock.call_args_list[:-1]:
+            self.assertEqual(call.kwargs['filter_streams'], ['logical1-logical1_table2'])
+
+    def test_select_largest_streams(self):
+        """
+        The largest streams should be selected until the remaining streams use less than half of the budget
+        """
+        self.assertEqual(target_snowflake.select_largest_streams({'a': 20, 'b': 50, 'c': 30}, 100), ['b', 'c'])
+        self.assertEqual(target_snowflake.select_largest_streams({'a': 20, 'b': 90}, 100), ['b'])
+        self.assertEqual(target_snowflake.select_largest_streams({}, 100), [])
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_spill_records_to_disk(self, os_remove_mock, dbSync_mock):
+        """
+        Given spill_records_to_disk enabled, every record should be appended to the file of the batch
+        """
+        self.config['batch_size_rows'] = 15
+        self.config['spill_records_to_disk'] = True
+
+        with open(f'{os.path.dirname(__file__)}/resources/logical-streams.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.create_schema_if_not_exists.return_value = None
+        instance.sync_table.return_value = None
+        instance.record_serializer = lambda record: str(record['cid'])
+
+        uploaded_files = []
+
+        def put_to_stage(file, *args, **kwargs):
+            with gzip.open(file, 'rt') as uploaded_file:
+                uploaded_files.append(uploaded_file.read().splitlines())
+            os.unlink(file)
+            return 'some-s3-folder/some-name_date_batch_hash.csg.gz'
+
+        instance.put_to_stage.side_effect = put_to_stage
+
+        with redirect_stdout(io.StringIO()):
+            target_snowflake.persist_lines(self.config, lines)
+
+        records = [json.loads(line)['record'] for line in lines if json.loads(line)['type'] == 'RECORD']
+        self.assertEqual([len(uploaded_file) for uploaded_file in uploaded_files], [15, 15, 10])
+        self.assertListEqual(list(itertools.chain(*uploaded_files)), [str(record['cid']) for record in records])
+        instance.record_primary_key_string.assert_called()
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_background_stage_cleanup(self, os_remove_mock, dbSync_mock):
+        self.config['tap_id'] = 'test_tap_id'
+        self.config['archive_load_files'] = True
+        self.config['s3_bucket'] = 'dummy_bucket'
+        self.config['background_stage_cleanup'] = True
+
+        with open(f'{os.path.dirname(__file__)}/resources/messages-simple-table.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.put_to_stage.return_value = 'some-s3-folder/some-name_date_batch_hash.csg.gz'
+
+        target_snowflake.persist_lines(self.config, lines)
+
+        instance.copy_to_archive.assert_called_once()
+        instance.delete_from_stage.assert_not_called()
+        instance.delete_batch_from_stage.assert_called_once_with(
+            'tap_mysql_test-test_simple_table', ['some-s3-folder/some-name_date_batch_hash.csg.gz'])
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_split_files(self, os_remove_mock, dbSync_mock):
+        self.config['split_file_max_parts'] = 2
+        self.config['split_file_min_rows_per_part'] = 2
+
+        with open(f'{os.path.dirname(__file__)}/resources/messages-simple-table.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.record_primary_key_string.return_value = None
+        instance.data_flattening_max_level = 0
+        instance.flatten_schema = {'id': {'type': ['integer']}}
+        instance.record_serializer = lambda record, *args: str(record['id'])
+        instance.file_format.formatter = csv
+        instance.put_files_to_stage.side_effect = lambda files, *args, **kwargs: \
+            [f'some-s3-folder/pipelinewise_stream/{os.path.basename(file)}' for file in files]
+
+        target_snowflake.persist_lines(self.config, lines)
+
+        files = instance.put_files_to_stage.call_args[0][0]
+        self.assertEqual(len(files), 2)
+        for file in files:
+            os.unlink(file)
+
+        s3_key, row_count, _, pattern = instance.load_file.call_args[0]
+        self.assertEqual(s3_key, 'some-s3-folder/pipelinewise_stream/')
+        self.assertEqual(row_count, 5)
+        self.assertEqual(pattern, '.*/({})([.]gz)?'.format('|'.join(os.path.basename(file).replace('.', '[.]')
+                                                                    for file in files)))
+        instance.put_to_stage.assert_not_called()
+        instance.delete_batch_from_stage.assert_called_once_with(
+            'tap_mysql_test-test_simple_table',
+            [f'some-s3-folder/pipelinewise_stream/{os.path.basename(file)}' for file in files])
+
+    @patch('target_snowflake.DbSync')
+    @patch('target_snowflake.os.remove')
+    def test_persist_lines_with_split_files_to_table_stage(self, os_remove_mock, dbSync_mock):
+        self.config['split_file_max_parts'] = 2
+        self.config['split_file_min_rows_per_part'] = 2
+        self.config['no_compression'] = True
+
+        with open(f'{os.path.dirname(__file__)}/resources/messages-simple-table.json', 'r') as f:
+            lines = f.readlines()
+
+        instance = dbSync_mock.return_value
+        instance.record_primary_key_string.return_value = None
+        instance.data_flattening_max_level = 0
+        instance.flatten_schema = {'id': {'type': ['integer']}}
+        instance.record_serializer = lambda record, *args: str(record['id'])
+        instance.file_format.formatter = csv
+        instance.put_files_to_stage.side_effect = lambda files, *args, **kwargs: \
+            [f'pipelinewise_stream/{os.path.basename(file)}' for file in files]
+
+        target_snowflake.persist_lines(self.config, lines)
+
+        files = instance.put_files_to_stage.call_args[0][0]
+        for file in files:
+            os.unlink(file)
+
+        # Not compressed files are compressed by PUT and stored with .gz extension in the table stage
+        s3_key, _, _, pattern = instance.load_file.call_args[0]
+        self.assertEqual(s3_key, 'pipelinewise_stream/')
+        for file in files:
+            self.assertTrue(file.endswith('.csv'))
+            self.assertRegex(f'pipelinewise_stream/{os.path.basename(file)}.gz', f'^{pattern}$')
+            self.assertRegex(f'pipelinewise_stream/{os.path.basename(file)}', f'^{pattern}$')
+        self.assertNotRegex('pipelinewise_stream/other_batch.csv.gz', f'^{pattern}$')
+
+    def test_split_records(self):
+        records = {str(i): {'id': i} for i in range(5)}
+
+        self.assertEqual(target_snowflake.split_records(records, 2),
+                         [{str(i): {'id': i} for i in range(3)}, {str(i): {'id': i} for i in range(3, 5)}])
+        self.assertEqual(target_snowflake.split_file_parts(5, {}), 1)
+        self.assertEqual(target_snowflake.split_file_parts(200000, {'split_file_max_parts': 8}), 4)
+        self.assertEqual(target_snowflake.split_file_parts(200000, {'split_file_max_parts': 2}), 2)
@@ -24,6 +24,7 @@ setup(name='pipelinewise-transform-field',
       install_requires=[
           'pipelinewise-singer-python==3.0.2',
           'dpath==2.0.*',
+          'orjson==3.6.1',
       ],
       extras_require={
           'test': [
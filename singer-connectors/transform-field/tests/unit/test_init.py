@@ -1,3 +1,6 @@
+import hashlib
+import io
+import json
 import unittest
 from unittest.mock import patch
 
@@ -6,6 +9,7 @@ from transform_field.errors import CatalogRequiredException, StreamNotFoundExcep
     UnsupportedTransformationTypeException, InvalidTransformationException
 
 from transform_field import TransformField, TransMeta
+from transform_field.writer import MessageWriter
 
 
 class TestTransformField(unittest.TestCase):
@@ -38,7 +42,7 @@ class TestTransformField(unittest.TestCase):
     def test_init(self):
         instance = TransformField(self.config)
 
-        self.assertListEqual(instance.messages, [])
+        self.assertDictEqual(instance.stream_buffers, {})
         self.assertEqual(instance.buffer_size_bytes, 0)
         self.assertIsNone(instance.state)
         self.assertIsNotNone(instance.time_last_batch_sent)
@@ -938,3 +942,102 @@ class TestTransformField(unittest.TestCase):
             }})
         }
         TransformField(config).validate(catalog)
+
+    def test_handle_line_passthrough_streams_without_transformations(self):
+        output = io.BytesIO()
+        instance = TransformField(self.config)
+        instance.writer = MessageWriter(output=output)
+
+        schema = {'properties': {'column_1': {'type': ['null', 'string']}, 'column_2': {'type': ['null', 'string']}}}
+        lines = [
+            '{"type": "SCHEMA", "stream": "stream_1", "schema": %s, "key_properties": []}' % json.dumps(schema),
+            '{"type":"RECORD","stream":"stream_3","record":{"column_1":"a",  "column_2":1.10}}\n',
+            '{"type": "RECORD", "stream": "stream_1", "record": {"column_1": "a", "column_2": "b"}}\n',
+            '{"type": "STATE", "value": {"bookmarks": {}}}\n',
+            '{"type": "RECORD", "stream": "stream_3", "record": {"column_1": "b"}}\n',
+        ]
+        for line in lines:
+            instance.handle_line(line)
+        instance.flush()
+
+        output_lines = output.getvalue().splitlines(keepends=True)
+        self.assertEqual(5, len(output_lines))
+
+        # Records of streams without transformations are written byte-for-byte
+        self.assertEqual(lines[1].encode('utf-8'), output_lines[1])
+        self.assertEqual(lines[4].encode('utf-8'), output_lines[2])
+
+        # Records of streams with transformations are transformed at flush
+        self.assertDictEqual({'column_1': None, 'column_2': hashlib.sha256(b'b').hexdigest()},
+                             json.loads(output_lines[3])['record'])
+
+        # State is written after every record received before it
+        self.assertEqual('STATE', json.loads(output_lines[4])['type'])
+
+    @patch('transform_field.VALIDATE_RECORDS', True)
+    @patch('transform_field.Draft7Validator')
+    def test_handle_line_buffers_interleaved_streams(self, draft7_validator):
+        output = io.BytesIO()
+        instance = TransformField(self.config)
+        instance.writer = MessageWriter(output=output)
+
+        schemas = {
+            'stream_1': {'properties': {'column_1': {'type': ['null', 'string']},
+                                        'column_2': {'type': ['null', 'string']}}},
+            'stream_2': {'properties': {'column_1': {'type': ['null', 'string'], 'format': 'date'}}},
+        }
+        for stream, schema in schemas.items():
+            instance.handle_line('{"type": "SCHEMA", "stream": "%s", "schema": %s, "key_properties": []}'
+                                 % (stream, json.dumps(schema)))
+
+        with patch.object(instance, 'flush', wraps=instance.flush) as flush:
+            for i in range(10):
+                instance.handle_line('{"type": "RECORD", "stream": "stream_%d", "record": {"column_1": "2021-01-0%d"}}'
+                                     % (i % 2 + 1, i % 2 + 1))
+            instance.handle_line('{"type": "STATE", "value": {"bookmarks": {}}}')
+
+            # Switching between streams doesn't flush
+            flush.assert_not_called()
+            self.assertEqual(5, len(instance.stream_buffers['stream_1']))
+            self.assertEqual(5, len(instance.stream_buffers['stream_2']))
+
+            instance.flush()
+
+        # One validator per stream, not per batch
+        self.assertEqual(2, draft7_validator.call_count)
+
+        output_messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertListEqual(['SCHEMA'] * 2 + ['RECORD'] * 10 + ['STATE'], [m['type'] for m in output_messages])
+        self.assertListEqual(['stream_1'] * 5 + ['stream_2'] * 5, [m['stream'] for m in output_messages[2:12]])
+
+    @patch('transform_field.VALIDATE_RECORDS', True)
+    def test_handle_line_no_passthrough_when_validating(self):
+        instance = TransformField(self.config)
+        line = b'{"type": "RECORD", "stream": "stream_3", "record": {"column_1": "b"}}\n'
+
+        with patch.object(instance, 'flush'):
+            instance.handle_line(line)
+
+        self.assertEqual(1, len(instance.stream_buffers['stream_3']))
+
+    def test_consume_with_parallel_workers(self):
+        schema = {'properties': {'column_1': {'type': ['null', 'string']}, 'column_2': {'type': ['null', 'string']}}}
+        lines = ['{"type": "SCHEMA", "stream": "stream_1", "schema": %s, "key_properties": []}' % json.dumps(schema)]
+        lines += ['{"type": "RECORD", "stream": "stream_1", "record": {"column_1": "a", "column_2": "%d"}}' % i
+                  for i in range(2500)]
+
+        outputs = []
+        for parallelism in [0, 3]:
+            output = io.BytesIO()
+            instance = TransformField({**self.config, 'parallelism': parallelism})
+            instance.writer = MessageWriter(output=output)
+            instance.consume(lines)
+            outputs.append(output.getvalue())
+
+            self.assertIsNone(instance.executor)
+
+        # Records are transformed in chunks by the worker processes and written in the original order
+        self.assertEqual(outputs[0], outputs[1])
+        records = [json.loads(line)['record'] for line in outputs[1].splitlines()[1:]]
+        self.assertListEqual([hashlib.sha256(str(i).encode('utf-8')).hexdigest() for i in range(2500)],
+                             [record['column_2'] for record in records])
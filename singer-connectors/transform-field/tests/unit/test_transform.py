@@ -353,3 +353,51 @@ class TestTransform(unittest.TestCase):
             )
         )
 
+    def test_compile_transform(self):
+        """Test compiled transformation is reusable for many records"""
+        hash_skip_first = transform.compile_transform(
+            "col_1", "HASH-SKIP-FIRST-2", [{'column': 'col_2', 'regex_match': '^pass'}])
+
+        self.assertEqual(
+            'Jo' + hashlib.sha256('hn'.encode('utf-8')).hexdigest(),
+            hash_skip_first({"col_1": "John", "col_2": "password"})
+        )
+        self.assertEqual('Paul', hash_skip_first({"col_1": "Paul", "col_2": "username"}))
+
+        # Return the original value if cannot transform
+        self.assertEqual(123, hash_skip_first({"col_1": 123, "col_2": "password"}))
+
+    def test_compile_value_transform_with_invalid_skip_count(self):
+        """Test transformation types with not numeric skip count return the original value"""
+        self.assertEqual('John', transform.compile_value_transform('HASH-SKIP-FIRST-X')('John'))
+        self.assertEqual('John', transform.compile_value_transform('MASK-STRING-SKIP-ENDS-')('John'))
+
+    def test_compile_condition_without_equals_or_regex(self):
+        """Test conditions without equals and regex_match don't make the transformation required"""
+        self.assertFalse(transform.compile_condition([{'column': 'col_1'}])({'col_1': 'a'}))
+        self.assertTrue(transform.compile_condition([{'column': 'col_1', 'equals': 'a'},
+                                                     {'column': 'col_2'}])({'col_1': 'a'}))
+
+    def test_hash_values(self):
+        """Test hashing a column of values at once"""
+        self.assertListEqual(
+            [hashlib.sha256('John'.encode('utf-8')).hexdigest(), None, 123],
+            transform.hash_values(['John', None, 123])
+        )
+        self.assertListEqual(
+            ['Pe' + hashlib.sha256('ter'.encode('utf-8')).hexdigest()],
+            transform.hash_values(['Peter'], skip_first_n=2)
+        )
+
+    def test_compile_batch_transform(self):
+        """Test batch transformations give the same result as transforming record by record"""
+        for trans_type, when in [('HASH', None), ('HASH-SKIP-FIRST-2', None), ('MASK-HIDDEN', None),
+                                 ('HASH', [{'column': 'col_2', 'equals': 'yes'}])]:
+            records = [{'col_1': 'John', 'col_2': 'yes'}, {'col_2': 'no'}, {'col_1': 'Peter', 'col_2': 'no'}]
+            expected = [{**record, 'col_1': transform.do_transform(record, 'col_1', trans_type, when)}
+                        if 'col_1' in record else dict(record)
+                        for record in records]
+
+            transform.compile_batch_transform('col_1', trans_type, when)(records)
+
+            self.assertListEqual(expected, records)
@@ -1,9 +1,12 @@
-import io
+import math
+import re
 import sys
 import time
 import singer
 
-from typing import Union, Dict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from typing import Union, Dict, List
 from enum import Enum, unique
 from collections import namedtuple
 from decimal import Decimal
@@ -12,7 +15,9 @@ from singer import Catalog, Schema
 
 from transform_field import transform
 from transform_field import utils
+from transform_field import workers
 from transform_field.timings import Timings
+from transform_field.writer import MessageWriter
 
 from transform_field.errors import CatalogRequiredException, StreamNotFoundException, InvalidTransformationException, \
     UnsupportedTransformationTypeException, NoStreamSchemaException
@@ -24,10 +29,16 @@ DEFAULT_MAX_BATCH_BYTES = 4000000
 DEFAULT_MAX_BATCH_RECORDS = 20000
 DEFAULT_BATCH_DELAY_SECONDS = 300.0
 VALIDATE_RECORDS = False
+MIN_PARALLEL_CHUNK_SIZE = 1000  # Min number of records sent to one worker process in parallel mode
 
 StreamMeta = namedtuple('StreamMeta', ['schema', 'key_properties', 'bookmark_properties'])
 TransMeta = namedtuple('TransMeta', ['field_id', 'type', 'when', 'field_paths'])
 
+# RECORD lines in the singer key order. Lines of streams without transformations
+# are written as they are, the stream name is read from the beginning of the line without parsing the JSON
+PASSTHROUGH_LINE_PATTERN = re.compile(
+    rb'^\s*\{\s*"type"\s*:\s*"RECORD"\s*,\s*"stream"\s*:\s*"([^"\\]*)"')
+
 REQUIRED_CONFIG_KEYS = [
     "transformations"
 ]
@@ -63,6 +74,8 @@ class TransformFieldException(Exception):
     """A known exception for which we don't need to bring a stack trace"""
 
 
+# Buffers, validators and the compiled transformations are kept per stream
+# pylint: disable-next=too-many-instance-attributes
 class TransformField:
     """
     Main Transformer class
@@ -70,9 +83,16 @@ class TransformField:
 
     def __init__(self, trans_config):
         self.trans_config = trans_config
-        self.messages = []
         self.buffer_size_bytes = 0
+        self.buffer_num_messages = 0
         self.state = None
+        self.writer = MessageWriter()
+
+        # Mapping from stream name to the list of buffered messages of the stream
+        self.stream_buffers = {}
+
+        # Mapping from stream name to the validator of the current schema of the stream
+        self.validators = {}
 
         # Time that the last batch was sent
         self.time_last_batch_sent = time.time()
@@ -98,76 +118,133 @@ class TransformField:
                 trans.get('field_paths')
             ))
 
-    # pylint: disable=too-many-nested-blocks,too-many-branches
-    # todo: simplify this method
+        # Mapping from transformation stream to the list of compiled functions that transform a batch of records
+        # Conditions and transformation types are parsed once instead of once per record
+        self.trans_plans = {
+            stream: transform.compile_stream_transforms(trans_meta)
+            for stream, trans_meta in self.trans_meta.items()
+        }
+
+        # Number of worker processes to transform big batches in parallel. In-process if not greater than 1
+        self.parallelism = trans_config.get('parallelism') or 0
+        self.executor = None
+
     def flush(self):
         """Give batch to handlers to process"""
+        for stream in list(self.stream_buffers):
+            self.__flush_stream(stream)
 
-        if self.messages:
-            stream = self.messages[0].stream
-            stream_meta = self.stream_meta[stream]
-
-            # Transform columns
-            messages = self.messages
-            schema = float_to_decimal(stream_meta.schema)
-            key_properties = stream_meta.key_properties
-            validator = Draft7Validator(schema, format_checker=FormatChecker())
-            trans_meta = []
-            if stream in self.trans_meta:
-                trans_meta = self.trans_meta[stream]
-
-            for i, message in enumerate(messages):
-                if isinstance(message, singer.RecordMessage):
-
-                    # Do transformation on every column where it is required
-                    for trans in trans_meta:
-
-                        if trans.field_id in message.record:
-                            transformed = transform.do_transform(
-                                message.record, trans.field_id, trans.type, trans.when, trans.field_paths
-                            )
-                            message.record[trans.field_id] = transformed
-
-                    if VALIDATE_RECORDS:
-                        # Validate the transformed columns
-                        data = float_to_decimal(message.record)
-                        try:
-                            validator.validate(data)
-                            if key_properties:
-                                for k in key_properties:
-                                    if k not in data:
-                                        raise TransformFieldException(
-                                            f'Message {i} is missing key property {k}')
-
-                        except Exception as exc:
-                            if type(exc).__name__ == "InvalidOperation":
-                                raise TransformFieldException(
-                                    f"Record does not pass schema validation. RECORD: {message.record}"
-                                    "\n'multipleOf' validations that allows long precisions are not "
-                                    "supported (i.e. with 15 digits or more). "
-                                    f"Try removing 'multipleOf' methods from JSON schema.\n{exc}") from exc
-
-                            raise TransformFieldException(
-                                f"Record does not pass schema validation. RECORD: {message.record}\n{exc}") from exc
-
-                    # Write the transformed message
-                    singer.write_message(message)
-
-            LOGGER.debug("Batch is valid with %s messages", len(messages))
-
-            # Update stats
-            self.time_last_batch_sent = time.time()
-            self.messages = []
-            self.buffer_size_bytes = 0
+        # Update stats
+        self.time_last_batch_sent = time.time()
+        self.buffer_size_bytes = 0
+        self.buffer_num_messages = 0
 
+        # State is written after every record received before it
         if self.state:
-            singer.write_message(singer.StateMessage(self.state))
+            self.writer.write_message(singer.StateMessage(self.state))
             self.state = None
 
+        # Write the batch to stdout at once
+        self.writer.flush()
+
         TIMINGS.log_timings()
 
+    def __flush_stream(self, stream: str):
+        """Transform, validate and write the buffered messages of one stream"""
+        messages = self.stream_buffers.pop(stream, None)
+        if not messages:
+            return
+
+        key_properties = self.stream_meta[stream].key_properties
+        validator = self.__get_validator(stream) if VALIDATE_RECORDS else None
+
+        # Do transformation on every column where it is required
+        if stream in self.trans_plans:
+            self.__transform_records(stream, [message for message in messages
+                                              if isinstance(message, singer.RecordMessage)])
+
+        for i, message in enumerate(messages):
+            if isinstance(message, singer.RecordMessage):
+                if validator:
+                    self.__validate_record(validator, key_properties, i, message)
+
+                # Write the transformed message
+                self.writer.write_message(message)
+
+        LOGGER.debug("Batch of stream %s is valid with %s messages", stream, len(messages))
+
+    @staticmethod
+    def __validate_record(validator: Draft7Validator, key_properties: List, i: int, message: singer.RecordMessage):
+        """Validate the transformed columns of a record against the schema of its stream"""
+        data = float_to_decimal(message.record)
+        try:
+            validator.validate(data)
+            for k in key_properties or []:
+                if k not in data:
+                    raise TransformFieldException(f'Message {i} is missing key property {k}')
+
+        except Exception as exc:
+            if type(exc).__name__ == "InvalidOperation":
+                raise TransformFieldException(
+                    f"Record does not pass schema validation. RECORD: {message.record}"
+                    "\n'multipleOf' validations that allows long precisions are not "
+                    "supported (i.e. with 15 digits or more). "
+                    f"Try removing 'multipleOf' methods from JSON schema.\n{exc}") from exc
+
+            raise TransformFieldException(
+                f"Record does not pass schema validation. RECORD: {message.record}\n{exc}") from exc
+
+    def __transform_records(self, stream: str, messages: List[singer.RecordMessage]):
+        """
+        Transform the records of a stream in place. Big batches are split into chunks that are
+        transformed by the worker processes in parallel, the order of the records is kept.
+        """
+        records = [message.record for message in messages]
+
+        if self.parallelism > 1 and len(records) >= 2 * MIN_PARALLEL_CHUNK_SIZE:
+            chunk_size = max(MIN_PARALLEL_CHUNK_SIZE, math.ceil(len(records) / self.parallelism))
+            chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+
+            transformed_chunks = self.__get_executor().map(workers.transform_records, repeat(stream), chunks)
+            for message, record in zip(messages, chain.from_iterable(transformed_chunks)):
+                message.record = record
+        else:
+            for transform_batch in self.trans_plans[stream]:
+                transform_batch(records)
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        """Pool of worker processes, started at the first parallel batch"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.parallelism,
+                                                initializer=workers.init_worker,
+                                                initargs=(self.trans_meta,))
+        return self.executor
+
+    def close(self):
+        """Stop the worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __get_validator(self, stream: str) -> Draft7Validator:
+        """Validator of the current schema of a stream, created once per SCHEMA message"""
+        if stream not in self.validators:
+            schema = float_to_decimal(self.stream_meta[stream].schema)
+            self.validators[stream] = Draft7Validator(schema, format_checker=FormatChecker())
+
+        return self.validators[stream]
+
     def handle_line(self, line):
         """Takes a raw line from stdin and transforms it"""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+
+        # Fast path, write the messages of streams without transformations as they are
+        if self.__is_passthrough_line(line):
+            self.writer.write_line(line)
+            self.__count_and_flush(len(line))
+            return
+
         try:
             message = singer.parse_message(line)
 
@@ -186,41 +263,55 @@ class TransformField:
                 message.schema,
                 message.key_properties,
                 message.bookmark_properties)
+            self.validators.pop(message.stream, None)
 
             # if schema message, do validation of transformations using the schema to detect any
             # incompatibilities between the transformation and column types
             self.__validate_stream_trans(message.stream, message.schema)
 
             # Write the transformed message
-            singer.write_message(message)
+            self.writer.write_message(message)
 
         elif isinstance(message, (singer.RecordMessage, singer.ActivateVersionMessage)):
-            if self.messages and (
-                    message.stream != self.messages[0].stream or
-                    message.version != self.messages[0].version):
-                self.flush()
-            self.messages.append(message)
-            self.buffer_size_bytes += len(line)
-
-            num_bytes = self.buffer_size_bytes
-            num_messages = len(self.messages)
-            num_seconds = time.time() - self.time_last_batch_sent
-
-            enough_bytes = num_bytes >= DEFAULT_MAX_BATCH_BYTES
-            enough_messages = num_messages >= DEFAULT_MAX_BATCH_RECORDS
-            enough_time = num_seconds >= DEFAULT_BATCH_DELAY_SECONDS
-            if enough_bytes or enough_messages or enough_time:
-                LOGGER.debug('Flushing %d bytes, %d messages, after %.2f seconds', num_bytes, num_messages, num_seconds)
-                self.flush()
+            # Messages of every stream are buffered separately, interleaved streams don't cause flushes
+            self.stream_buffers.setdefault(message.stream, []).append(message)
+            self.__count_and_flush(len(line))
 
         elif isinstance(message, singer.StateMessage):
             self.state = message.value
 
+    def __is_passthrough_line(self, line: bytes) -> bool:
+        """Check if the line is a RECORD of a stream that can be written without transforming it"""
+        if VALIDATE_RECORDS:
+            return False
+
+        match = PASSTHROUGH_LINE_PATTERN.match(line)
+        return bool(match) and match.group(1).decode('utf-8') not in self.trans_meta
+
+    def __count_and_flush(self, line_size: int):
+        """Add a buffered line to the batch and flush every stream if the batch is big or old enough"""
+        self.buffer_size_bytes += line_size
+        self.buffer_num_messages += 1
+
+        num_bytes = self.buffer_size_bytes
+        num_messages = self.buffer_num_messages
+        num_seconds = time.time() - self.time_last_batch_sent
+
+        enough_bytes = num_bytes >= DEFAULT_MAX_BATCH_BYTES
+        enough_messages = num_messages >= DEFAULT_MAX_BATCH_RECORDS
+        enough_time = num_seconds >= DEFAULT_BATCH_DELAY_SECONDS
+        if enough_bytes or enough_messages or enough_time:
+            LOGGER.debug('Flushing %d bytes, %d messages, after %.2f seconds', num_bytes, num_messages, num_seconds)
+            self.flush()
+
     def consume(self, reader):
         """Consume all the lines from the queue, flushing when done."""
-        for line in reader:
-            self.handle_line(line)
-        self.flush()
+        try:
+            for line in reader:
+                self.handle_line(line)
+            self.flush()
+        finally:
+            self.close()
 
     def validate(self, catalog: Catalog):
         """
@@ -238,6 +329,7 @@ class TransformField:
         for stream_id in self.trans_meta:
             self.__validate_stream_trans(stream_id, schemas.get(stream_id))
 
+    # pylint: disable-next=too-many-branches
     def __validate_stream_trans(self, stream_id: str, stream_schema: Union[Schema, Dict]):
         """
         Validation of each stream's transformations
@@ -307,15 +399,16 @@ def main_impl():
     Main implementation
     """
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
-    trans_config = {'transformations': args.config['transformations']}
+    trans_config = {'transformations': args.config['transformations'],
+                    'parallelism': args.config.get('parallelism')}
 
     instance = TransformField(trans_config)
 
     if args.validate:
         instance.validate(args.catalog)
     else:
-        reader = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-        instance.consume(reader)
+        # Lines are read as bytes, lines of streams without transformations are written without decoding them
+        instance.consume(sys.stdin.buffer)
 
     LOGGER.info("Exiting normally")
 
@@ -1,7 +1,8 @@
+import functools
 import hashlib
 import re
 
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from dpath.util import get as get_xpath, set as set_xpath
 from singer import get_logger
 from dateutil import parser
@@ -15,70 +16,64 @@ def is_transform_required(record: Dict, when: Optional[List[Dict]]) -> bool:
         the defined conditions and the actual values in a record.
         All conditions in when need to be met for the transformation to be required.
     """
+    return compile_condition(when)(record)
+
+
+def compile_condition(when: Optional[List[Dict]]) -> Callable[[Dict], bool]:
+    """
+    Compiles the 'when' conditions of a transformation into a function that takes a record
+    and returns True if the transformation is required. Regex patterns are compiled once.
+    All conditions in when need to be met for the transformation to be required.
+    """
     if not when:
         # Transformation is always required if 'when' condition not defined
-        LOGGER.debug('No conditions, transformations is required')
-        return True
-
-    transform_required = False
+        return lambda record: True
 
-    # Check if conditional transformation matches criteria
-    # Evaluate every condition
+    conditions = []
     for condition in when:
-        column_to_match = condition['column']
-        column_value = record.get(column_to_match, "")
-
-        field_path_to_match = condition.get('field_path')
-
-        # check if given field exists in the column value
-        if field_path_to_match:
-            try:
-                field_value = get_xpath(column_value, field_path_to_match)
-                LOGGER.debug('field "%s" exists in the value of column "%s"', field_path_to_match, column_to_match)
-
-            except KeyError:
-                # KeyError exception means the field doesn't exist, hence we cannot proceed with the
-                # equals/regex match condition, thus the condition isn't met and don't need to do
-                # transformation so breaking prematurely
-                transform_required = False
-
-                LOGGER.debug('field "%s" doesn\'t exists in the value of column "%s", '
-                             'so transformation is not required.', field_path_to_match, column_to_match)
-                break
-
         cond_equals = condition.get('equals')
         cond_pattern = condition.get('regex_match')
 
         # Exact condition
         if cond_equals:
-            LOGGER.debug('Equals condition found, value is: %s', cond_equals)
-            if field_path_to_match:
-                transform_required = __is_condition_met('equal', cond_equals, field_value)
-            else:
-                transform_required = __is_condition_met('equal', cond_equals, column_value)
-
-            # Condition isn't met, exit the loop
-            if not transform_required:
-                LOGGER.debug('Equals condition didn\'t match, so transformation is not required.')
-                break
+            matcher = functools.partial(__is_condition_met, 'equal', cond_equals)
 
         # Regex based condition
         elif cond_pattern:
-            LOGGER.debug('Regex condition found, pattern is: %s', cond_pattern)
+            matcher = functools.partial(__is_condition_met, 'regex', re.compile(cond_pattern))
+
+        # Conditions without equals or regex_match don't change the result
+        else:
+            matcher = None
 
+        conditions.append((condition['column'], condition.get('field_path'), matcher))
+
+    def is_required(record: Dict) -> bool:
+        transform_required = False
+
+        # Evaluate every condition
+        for column_to_match, field_path_to_match, matcher in conditions:
+            value = record.get(column_to_match, "")
+
+            # check if given field exists in the column value
             if field_path_to_match:
-                transform_required = __is_condition_met('regex', cond_pattern, field_value)
-            else:
-                transform_required = __is_condition_met('regex', cond_pattern, column_value)
+                try:
+                    value = get_xpath(value, field_path_to_match)
+                except KeyError:
+                    # KeyError exception means the field doesn't exist, hence we cannot proceed with the
+                    # equals/regex match condition, thus the condition isn't met
+                    return False
+
+            if matcher is not None:
+                transform_required = matcher(value)
 
-            # Condition isn't met, exit the loop
-            if not transform_required:
-                LOGGER.debug('Regex pattern didn\'t match, so transformation is not required.')
-                break
+                # Condition isn't met, no need to check the rest
+                if not transform_required:
+                    return False
 
-    LOGGER.debug('Transformation required? %s', transform_required)
+        return transform_required
 
-    return transform_required
+    return is_required
 
 
 def __is_condition_met(condition_type: str, condition_value: Any, value: Any) -> bool:
@@ -86,7 +81,7 @@ def __is_condition_met(condition_type: str, condition_value: Any, value: Any) ->
     Checks if given value meets the given condition
     Args:
         condition_type: condition type, could be "equal" or "regex"
-        condition_value: the value of the condition, in case of regex it's the pattern, and
+        condition_value: the value of the condition, in case of regex it's the compiled pattern, and
                          a value to compare to in case of equal
         value: the target value to run the condition against
 
@@ -97,8 +92,7 @@ def __is_condition_met(condition_type: str, condition_value: Any, value: Any) ->
         return value == condition_value
 
     if condition_type == 'regex':
-        matcher = re.compile(condition_value)
-        return bool(matcher.search(value))
+        return bool(condition_value.search(value))
 
     raise NotImplementedError(f'__is_condition_met is not implemented for condition type "{condition_type}"', )
 
@@ -113,35 +107,104 @@ def do_transform(record: Dict,
     Optionally can set conditional criteria based on other
     values of the record"""
 
-    return_value = value = record.get(field)
+    return compile_transform(field, trans_type, when, field_paths)(record)
 
-    try:
-        # Do transformation only if required
-        if is_transform_required(record, when):
+
+def compile_transform(field: str,
+                      trans_type: str,
+                      when: Optional[List[Dict]] = None,
+                      field_paths: Optional[List[str]] = None
+                      ) -> Callable[[Dict], Any]:
+    """
+    Compiles a transformation into a function that takes a record and returns the transformed
+    value of the field, the same way as do_transform. The conditions, the transformation type
+    and its parameters are parsed once instead of once per record.
+    """
+    is_required = compile_condition(when)
+    transform_value = compile_value_transform(trans_type)
+
+    def transform(record: Dict) -> Any:
+        return_value = value = record.get(field)
+
+        try:
+            # Return the original value if transformation is not required
+            if not is_required(record):
+                return value
 
             # transforming fields nested in value dictionary
             if isinstance(value, dict) and field_paths:
                 for field_path in field_paths:
                     try:
                         field_val = get_xpath(value, field_path)
-                        set_xpath(value, field_path, _transform_value(field_val, trans_type))
+                        set_xpath(value, field_path, transform_value(field_val))
                     except KeyError:
                         LOGGER.error('Field path %s does not exist', field_path)
 
-                return_value = value
+                return value
 
-            else:
-                return_value = _transform_value(value, trans_type)
+            return transform_value(value)
 
-        # Return the original value if transformation is not required
-        else:
-            return_value = value
+        # Return the original value if cannot transform
+        except Exception:
+            return return_value
+
+    return transform
+
+
+def compile_batch_transform(field: str,
+                            trans_type: str,
+                            when: Optional[List[Dict]] = None,
+                            field_paths: Optional[List[str]] = None
+                            ) -> Callable[[List[Dict]], None]:
+    """
+    Compiles a transformation into a function that transforms the field of a list of records in place.
+    Unconditional HASH and HASH-SKIP-FIRST-n transformations hash the whole column at once,
+    every other transformation is applied record by record the same way as compile_transform.
+    """
+    skip_first_n = None
+    if not when and not field_paths:
+        if trans_type == 'HASH':
+            skip_first_n = 0
+        elif 'HASH-SKIP-FIRST' in trans_type and trans_type[-1].isdigit():
+            skip_first_n = int(trans_type[-1])
+
+    if skip_first_n is not None:
+        def transform_column(records: List[Dict]):
+            records_with_field = [record for record in records if field in record]
+            values = hash_values([record[field] for record in records_with_field], skip_first_n)
+            for record, value in zip(records_with_field, values):
+                record[field] = value
+
+        return transform_column
+
+    transform = compile_transform(field, trans_type, when, field_paths)
+
+    def transform_records(records: List[Dict]):
+        for record in records:
+            if field in record:
+                record[field] = transform(record)
+
+    return transform_records
 
-        return return_value
 
-    # Return the original value if cannot transform
-    except Exception:
-        return return_value
+def compile_stream_transforms(trans_meta: List) -> List[Callable[[List[Dict]], None]]:
+    """Compiles the transformations of a stream, in the order of the config, into batch transform functions"""
+    return [compile_batch_transform(trans.field_id, trans.type, trans.when, trans.field_paths) for trans in trans_meta]
+
+
+def hash_values(values: List[Any], skip_first_n: int = 0) -> List[Any]:
+    """
+    Hashes a column of values at once with sha256, keeping the first skip_first_n characters
+    as they are, like HASH and HASH-SKIP-FIRST-n. Values that are not strings cannot be hashed
+    and are returned as they are.
+    """
+    sha256 = hashlib.sha256
+    if skip_first_n:
+        return [value[:skip_first_n] + sha256(value.encode('utf-8')[skip_first_n:]).hexdigest()
+                if isinstance(value, str) else value
+                for value in values]
+
+    return [sha256(value.encode('utf-8')).hexdigest() if isinstance(value, str) else value for value in values]
 
 
 def _transform_value(value: Any, trans_type: str) -> Any:
@@ -154,43 +217,83 @@ def _transform_value(value: Any, trans_type: str) -> Any:
     Returns:
         transformed value
     """
-    # Transforms any input to NULL
-    if trans_type == "SET-NULL":
-        return_value = None
+    return compile_value_transform(trans_type)(value)
 
-    # Transforms string input to hash
-    elif trans_type == "HASH":
-        return_value = hashlib.sha256(value.encode('utf-8')).hexdigest()
 
-    # Transforms string input to hash skipping first n characters, e.g. HASH-SKIP-FIRST-2
-    elif 'HASH-SKIP-FIRST' in trans_type:
-        return_value = value[:int(trans_type[-1])] + \
-                       hashlib.sha256(value.encode('utf-8')[int(trans_type[-1]):]).hexdigest()
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
 
-    # Transforms any date to stg
-    elif trans_type == "MASK-DATE":
-        return_value = parser.parse(value).replace(month=1, day=1).isoformat()
 
-    # Transforms any number to zero
-    elif trans_type == "MASK-NUMBER":
-        return_value = 0
+def _hash_skip_first(skip_first_n: int, value: str) -> str:
+    return value[:skip_first_n] + hashlib.sha256(value.encode('utf-8')[skip_first_n:]).hexdigest()
+
+
+def _mask_date(value: str) -> str:
+    return parser.parse(value).replace(month=1, day=1).isoformat()
+
+
+def _mask_string_skip_ends(skip_ends_n: int, value: str) -> str:
+    value_len = len(value)
+    return '*' * value_len if value_len <= (2 * skip_ends_n) \
+        else f'{value[:skip_ends_n]}{"*" * (value_len - (2 * skip_ends_n))}{value[-skip_ends_n:]}'
+
+
+def _keep_value(value: Any) -> Any:
+    return value
+
 
+def _set_null(_value: Any) -> None:
+    return None
+
+
+def _mask_number(_value: Any) -> int:
+    return 0
+
+
+def _mask_hidden(_value: Any) -> str:
+    return 'hidden'
+
+
+# Functions of the transformation types without parameters
+VALUE_TRANSFORMS = {
+    # Transforms any input to NULL
+    'SET-NULL': _set_null,
+    # Transforms string input to hash
+    'HASH': _hash,
+    # Transforms any date to stg
+    'MASK-DATE': _mask_date,
+    # Transforms any number to zero
+    'MASK-NUMBER': _mask_number,
     # Transforms any value to "hidden"
-    elif trans_type == "MASK-HIDDEN":
-        return_value = 'hidden'
+    'MASK-HIDDEN': _mask_hidden,
+}
+
+
+def compile_value_transform(trans_type: str) -> Callable[[Any], Any]:
+    """
+    Returns the function that applies the given transformation type to a value.
+    Parameters of the transformation type, like the n of HASH-SKIP-FIRST-n, are parsed once.
+    """
+    if trans_type in VALUE_TRANSFORMS:
+        return VALUE_TRANSFORMS[trans_type]
+
+    # Transforms string input to hash skipping first n characters, e.g. HASH-SKIP-FIRST-2
+    if 'HASH-SKIP-FIRST' in trans_type:
+        transform = _hash_skip_first
 
     # Transforms string input to masked version skipping first and last n characters
     # e.g. MASK-STRING-SKIP-ENDS-3
     elif 'MASK-STRING-SKIP-ENDS' in trans_type:
-        skip_ends_n = int(trans_type[-1])
-        value_len = len(value)
-        return_value = '*' * value_len if value_len <= (2 * skip_ends_n) \
-            else f'{value[:skip_ends_n]}{"*" * (value_len - (2 * skip_ends_n))}{value[-skip_ends_n:]}'
+        transform = _mask_string_skip_ends
 
-    # Return the original value if cannot find transformation type
-    # todo: is this the right behavior?
     else:
+        # Return the original value if cannot find transformation type
+        # todo: is this the right behavior?
         LOGGER.warning('Cannot find transformation type %s, returning same value', trans_type)
-        return_value = value
+        return _keep_value
 
-    return return_value
+    try:
+        return functools.partial(transform, int(trans_type[-1]))
+    except ValueError:
+        # Return the original value if cannot parse the transformation type
+        return _keep_value
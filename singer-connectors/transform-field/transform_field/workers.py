@@ -0,0 +1,24 @@
+"""Worker processes of the parallel transformation mode"""
+from typing import Dict, List
+
+from transform_field import transform
+
+# Mapping from stream name to the compiled batch transform functions of the worker process
+_STREAM_TRANSFORMS = {}
+
+
+def init_worker(trans_meta: Dict[str, List]):
+    """Compile the transformations once when a worker process starts"""
+    _STREAM_TRANSFORMS.clear()
+    _STREAM_TRANSFORMS.update({
+        stream: transform.compile_stream_transforms(stream_trans_meta)
+        for stream, stream_trans_meta in trans_meta.items()
+    })
+
+
+def transform_records(stream: str, records: List[Dict]) -> List[Dict]:
+    """Transform a chunk of records of a stream and return them in the same order"""
+    for transform_batch in _STREAM_TRANSFORMS.get(stream, []):
+        transform_batch(records)
+
+    return records
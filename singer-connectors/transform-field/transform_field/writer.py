@@ -0,0 +1,35 @@
+import sys
+import orjson
+
+from singer.messages import format_message
+
+
+class MessageWriter:
+    """
+    Buffered writer of singer messages to stdout.
+
+    Messages are serialized by orjson, the same way as singer.write_message, but they are
+    collected in memory and written to stdout with one write and flush per flush call.
+    Lines received from the tap can be written as they are, without parsing and serializing them again.
+    """
+
+    def __init__(self, output=None):
+        self._output = output
+        self._buffer = []
+
+    def write_message(self, message):
+        """Serialize and buffer one singer message"""
+        self._buffer.append(format_message(message, option=orjson.OPT_APPEND_NEWLINE))
+
+    def write_line(self, line: bytes):
+        """Buffer one raw singer message line"""
+        self._buffer.append(line if line.endswith(b'\n') else line + b'\n')
+
+    def flush(self):
+        """Write every buffered message to the output"""
+        if self._buffer:
+            # stdout is looked up at flush time, it can be replaced after the writer is created
+            output = self._output or sys.stdout.buffer
+            output.write(b''.join(self._buffer))
+            output.flush()
+            self._buffer = []
@@ -390,3 +390,95 @@ class TestFastSyncTapPostgres(TestCase):
                 'replication_key_value': 4.222222222,
                 'version': 1,
             }, state)
+
+    def test_get_table_slices_by_primary_key(self):
+        """
+        test get_table_slices on a table with integer primary key, it should split the primary key range
+        """
+        with patch.object(self.postgres, 'query') as query_mock:
+            query_mock.side_effect = [[['id', 'bigint']], [[1, 100]]]
+
+            slices = self.postgres.get_table_slices('schema.table1', 4)
+
+            self.assertListEqual([
+                '"id" < 26',
+                '"id" >= 26 AND "id" < 51',
+                '"id" >= 51 AND "id" < 76',
+                '"id" >= 76',
+            ], slices)
+
+    def test_get_table_slices_by_ctid(self):
+        """
+        test get_table_slices on a table without integer primary key, it should split the blocks of the table
+        """
+        with patch.object(self.postgres, 'query') as query_mock:
+            query_mock.side_effect = [[['id', 'uuid']], [[140000]], [[9]]]
+
+            slices = self.postgres.get_table_slices('schema.table1', 2)
+
+            self.assertListEqual([
+                "ctid < '(5,0)'::tid",
+                "ctid >= '(5,0)'::tid",
+            ], slices)
+
+    def test_get_table_slices_by_ctid_before_postgres_14(self):
+        """
+        test get_table_slices on a table without integer primary key before PostgreSQL 14, it should not
+        split the table because every slice would read the whole table
+        """
+        with patch.object(self.postgres, 'query') as query_mock:
+            query_mock.side_effect = [[['id', 'uuid']], [[130010]]]
+
+            self.assertListEqual([''], self.postgres.get_table_slices('schema.table1', 2))
+            self.assertEqual(2, query_mock.call_count)
+
+    def test_get_table_slices_of_small_table(self):
+        """
+        test get_table_slices on tables with less rows than slices, it should return less slices
+        """
+        with patch.object(self.postgres, 'query') as query_mock:
+            query_mock.side_effect = [[['id', 'integer']], [[1, 2]]]
+            self.assertListEqual(['"id" < 2', '"id" >= 2'], self.postgres.get_table_slices('schema.table1', 4))
+
+            query_mock.side_effect = [[['id', 'integer']], [[None, None]]]
+            self.assertListEqual([''], self.postgres.get_table_slices('schema.table1', 4))
+
+            query_mock.side_effect = [[], [[140000]], [[0]]]
+            self.assertListEqual([''], self.postgres.get_table_slices('schema.table1', 4))
+
+    @patch('pipelinewise.fastsync.commons.tap_postgres.split_gzip.open')
+    @patch('pipelinewise.fastsync.commons.tap_postgres.psycopg2.connect')
+    def test_copy_table_in_slices(self, connect_mock, split_gzip_open_mock):
+        """
+        test copy_table with slices, it should export every slice on its own connection in the exported snapshot
+        """
+        self.postgres.connection_config.update(
+            {'host': 'my_host', 'port': 'my_port', 'user': 'my_user', 'password': 'my_password'}
+        )
+        cursor_mock = connect_mock.return_value.cursor.return_value.__enter__.return_value
+        cursor_mock.fetchone.return_value = ['00000003-0000001B-1']
+
+        with patch.object(self.postgres, 'get_table_columns') as get_table_columns_mock, \
+                patch.object(self.postgres, 'get_table_slices') as get_table_slices_mock:
+            get_table_columns_mock.return_value = [{'safe_sql_value': '"id"'}]
+            get_table_slices_mock.return_value = ['"id" < 26', '"id" >= 26']
+
+            self.postgres.copy_table('schema.table1', '/tmp/table1.csv.gz', slices=2)
+
+        # One connection to export the snapshot and one per slice
+        self.assertEqual(3, connect_mock.call_count)
+        self.assertEqual(3, connect_mock.return_value.close.call_count)
+        cursor_mock.execute.assert_any_call('SELECT pg_export_snapshot()')
+        cursor_mock.execute.assert_any_call('SET TRANSACTION SNAPSHOT %s', ('00000003-0000001B-1',))
+
+        self.assertListEqual(
+            ['/tmp/table1.csv.gz.slice00001', '/tmp/table1.csv.gz.slice00002'],
+            sorted(call.args[0] for call in split_gzip_open_mock.call_args_list),
+        )
+        self.assertListEqual(
+            ['FROM schema."table1" WHERE "id" < 26) TO STDOUT', 'FROM schema."table1" WHERE "id" >= 26) TO STDOUT'],
+            sorted(
+                call.args[0].split('\n')[1].strip().split(' with CSV')[0]
+                for call in cursor_mock.copy_expert.call_args_list
+            ),
+        )
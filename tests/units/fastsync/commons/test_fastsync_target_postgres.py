@@ -410,22 +410,27 @@ class TestFastSyncTargetPostgres(TestCase):
         self.assertListEqual(
             self.postgres.executed_queries,
             [
-                'UPDATE "my_schema"."my_table_temp" SET "col_2" = \'hidden\' WHERE ("col_4" IS NULL);',
                 'UPDATE "my_schema"."my_table_temp" SET '
-                '"col_3" = MAKE_TIMESTAMP(DATE_PART(\'year\', "col_3")::int, 1, 1, DATE_PART(\'hour\', "col_3")::int, '
+                '"col_2" = CASE WHEN ("col_4" IS NULL) THEN \'hidden\' ELSE "col_2" END, '
+                '"col_3" = CASE WHEN ("col_5" = \'some_value\') THEN '
+                'MAKE_TIMESTAMP(DATE_PART(\'year\', "col_3")::int, 1, 1, DATE_PART(\'hour\', "col_3")::int, '
                 'DATE_PART(\'minute\', "col_3")::int, DATE_PART(\'second\', "col_3")::double precision) '
-                'WHERE ("col_5" = \'some_value\');',
-                'UPDATE "my_schema"."my_table_temp" SET '
-                '"col_6" = CONCAT(SUBSTRING("col_6", 1, 5), '
-                'ENCODE(DIGEST(SUBSTRING("col_6", 5 + 1), \'sha256\'), \'hex\')) WHERE ("col_1" = 30) AND '
-                '("col_2" ~ \'[0-9]{3}\.[0-9]{3}\');',  # pylint: disable=W1401  # noqa: W605
-                'UPDATE "my_schema"."my_table_temp" SET '
-                '"col_7" = CASE WHEN LENGTH("col_7") > 2 * 3 THEN '
+                'ELSE "col_3" END, '
+                '"col_6" = CASE WHEN ("col_1" = 30) '
+                'AND ((CASE WHEN ("col_4" IS NULL) THEN \'hidden\' ELSE "col_2" END) '
+                '~ \'[0-9]{3}\.[0-9]{3}\') THEN '  # pylint: disable=W1401  # noqa: W605
+                'CONCAT(SUBSTRING("col_6", 1, 5), '
+                'ENCODE(DIGEST(SUBSTRING("col_6", 5 + 1), \'sha256\'), \'hex\')) '
+                'ELSE "col_6" END, '
+                '"col_7" = CASE WHEN ("col_1" = 30) '
+                'AND ((CASE WHEN ("col_4" IS NULL) THEN \'hidden\' ELSE "col_2" END) '
+                '~ \'[0-9]{3}\.[0-9]{3}\') AND ("col_4" IS NULL) '  # pylint: disable=W1401  # noqa: W605
+                'THEN CASE WHEN LENGTH("col_7") > 2 * 3 THEN '
                 'CONCAT(SUBSTRING("col_7", 1, 3), REPEAT(\'*\', LENGTH("col_7")-(2 * 3)), '
                 'SUBSTRING("col_7", LENGTH("col_7")-3+1, 3)) '
-                'ELSE REPEAT(\'*\', LENGTH("col_7")) END WHERE ("col_1" = 30) AND '
-                '("col_2" ~ \'[0-9]{3}\.[0-9]{3}\') AND ("col_4" IS NULL);',  # pylint: disable=W1401  # noqa: W605
-                'UPDATE "my_schema"."my_table_temp" SET "col_1" = NULL, '
+                'ELSE REPEAT(\'*\', LENGTH("col_7")) END '
+                'ELSE "col_7" END, '
+                '"col_1" = NULL, '
                 '"col_4" = 0, "col_5" = ENCODE(DIGEST("col_5", \'sha256\'), \'hex\');',
             ],
         )
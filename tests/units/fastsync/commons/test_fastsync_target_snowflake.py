@@ -266,6 +266,66 @@ class TestFastSyncTargetSnowflake(TestCase):
             ' compression=GZIP binary_format=HEX)'
         ]
 
+    def test_copy_to_table_with_transformations(self):
+        """Validate if transformations are applied by the COPY command of temp tables"""
+        self.snowflake.transformation_config = {
+            'transformations': [
+                {
+                    'field_id': 'col_1',
+                    'tap_stream_name': 'public-my_table',
+                    'type': 'HASH',
+                },
+                {
+                    'field_id': 'col_2',
+                    'tap_stream_name': 'public-my_table',
+                    'type': 'MASK-HIDDEN',
+                    'when': [{'column': 'col_3', 'equals': 'some "COL_1" value'}],
+                },
+                {
+                    'field_id': 'col_5',
+                    'tap_stream_name': 'public-my_table',
+                    'type': 'SET-NULL',
+                    'when': [{'column': 'col_4', 'equals': 30}],
+                },
+            ]
+        }
+        self.snowflake.query = MagicMock(
+            side_effect=lambda query, **kwargs: self.snowflake.executed_queries.append(query)
+            or (
+                [
+                    {'name': 'COL_1', 'type': 'VARCHAR(16777216)'},
+                    {'name': 'COL_2', 'type': 'VARCHAR(16777216)'},
+                    {'name': 'COL_3', 'type': 'VARCHAR(100)'},
+                    {'name': 'COL_4', 'type': 'NUMBER(38,0)'},
+                    {'name': 'COL_5', 'type': 'VARIANT'},
+                ]
+                if query.startswith('DESC')
+                else []
+            )
+        )
+
+        self.snowflake.copy_to_table(
+            s3_key='s3_key',
+            target_schema='test_schema',
+            table_name='public.my_table',
+            size_bytes=1000,
+            is_temporary=True,
+            skip_csv_header=False,
+        )
+        self.snowflake.obfuscate_columns('test_schema', 'public.my_table')
+
+        assert self.snowflake.executed_queries == [
+            'DESC TABLE test_schema."MY_TABLE_TEMP"',
+            'COPY INTO test_schema."MY_TABLE_TEMP" FROM (SELECT SHA2(t.$1::VARCHAR(16777216), 256), '
+            'CASE WHEN (t.$3::VARCHAR(100) = \'some "COL_1" value\') THEN \'hidden\' '
+            'ELSE t.$2::VARCHAR(16777216) END, t.$3, t.$4, '
+            'CASE WHEN (t.$4::NUMBER(38,0) = 30) THEN NULL ELSE PARSE_JSON(t.$5)::VARIANT END '
+            'FROM \'@dummy_stage/s3_key\' t)'
+            ' FILE_FORMAT = (type=CSV escape=NONE escape_unenclosed_field=\'\\x1e\''
+            ' field_optionally_enclosed_by=\'\"\' skip_header=0'
+            ' compression=GZIP binary_format=HEX)'
+        ]
+
     def test_grant_select_on_table(self):
         """Validate if GRANT command generated correctly"""
         # GRANT table with standard table and column names
@@ -626,20 +686,22 @@ class TestFastSyncTargetSnowflake(TestCase):
         self.assertListEqual(
             self.snowflake.executed_queries,
             [
-                'UPDATE "MY_SCHEMA"."MY_TABLE_TEMP" SET "COL_2" = \'hidden\' WHERE ("COL_4" IS NULL);',
-                'UPDATE "MY_SCHEMA"."MY_TABLE_TEMP" SET "COL_3" = TIMESTAMP_NTZ_FROM_PARTS('
-                'DATE_FROM_PARTS(YEAR("COL_3"), 1, 1),TO_TIME("COL_3")) WHERE ("COL_5" = \'some_value\');',
                 'UPDATE "MY_SCHEMA"."MY_TABLE_TEMP" SET '
-                '"COL_6" = CONCAT(SUBSTRING("COL_6", 1, 5), SHA2(SUBSTRING("COL_6", 5 + 1), 256)) '
-                'WHERE ("COL_1" = 30) AND ("COL_2" '
-                'REGEXP \'[0-9]{3}\.[0-9]{3}\');',  # pylint: disable=W1401  # noqa: W605
-                'UPDATE "MY_SCHEMA"."MY_TABLE_TEMP" SET '
-                '"COL_7" = CASE WHEN LENGTH("COL_7") > 2 * 3 THEN '
+                '"COL_2" = CASE WHEN ("COL_4" IS NULL) THEN \'hidden\' ELSE "COL_2" END, '
+                '"COL_3" = CASE WHEN ("COL_5" = \'some_value\') THEN TIMESTAMP_NTZ_FROM_PARTS('
+                'DATE_FROM_PARTS(YEAR("COL_3"), 1, 1),TO_TIME("COL_3")) ELSE "COL_3" END, '
+                '"COL_6" = CASE WHEN ("COL_1" = 30) '
+                'AND ((CASE WHEN ("COL_4" IS NULL) THEN \'hidden\' ELSE "COL_2" END) '
+                'REGEXP \'[0-9]{3}\.[0-9]{3}\') THEN '  # pylint: disable=W1401  # noqa: W605
+                'CONCAT(SUBSTRING("COL_6", 1, 5), SHA2(SUBSTRING("COL_6", 5 + 1), 256)) ELSE "COL_6" END, '
+                '"COL_7" = CASE WHEN ("COL_1" = 30) '
+                'AND ((CASE WHEN ("COL_4" IS NULL) THEN \'hidden\' ELSE "COL_2" END) '
+                'REGEXP \'[0-9]{3}\.[0-9]{3}\') '  # pylint: disable=W1401  # noqa: W605
+                'AND ("COL_4" IS NULL) THEN CASE WHEN LENGTH("COL_7") > 2 * 3 THEN '
                 'CONCAT(SUBSTRING("COL_7", 1, 3), REPEAT(\'*\', LENGTH("COL_7")-(2 * 3)), '
                 'SUBSTRING("COL_7", LENGTH("COL_7")-3+1, 3)) '
-                'ELSE REPEAT(\'*\', LENGTH("COL_7")) END WHERE ("COL_1" = 30) AND ("COL_2" '
-                'REGEXP \'[0-9]{3}\.[0-9]{3}\') AND ("COL_4" IS NULL);',  # pylint: disable=W1401  # noqa: W605
-                'UPDATE "MY_SCHEMA"."MY_TABLE_TEMP" SET "COL_1" = NULL, "COL_4" = 0, "COL_5" = SHA2("COL_5", 256);',
+                'ELSE REPEAT(\'*\', LENGTH("COL_7")) END ELSE "COL_7" END, '
+                '"COL_1" = NULL, "COL_4" = 0, "COL_5" = SHA2("COL_5", 256);',
             ],
         )
 
@@ -445,3 +445,90 @@ class TestTransformHelper(unittest.TestCase):
                 },
             ],
         )
+
+    def test_get_column_trans_in_sql(self):
+        """
+        Test merging the transformations into one sql expression per column
+        Test should pass
+        """
+        table_name = 'public-my_table'
+
+        transformations = [
+            {
+                'field_id': 'col_1',
+                'tap_stream_name': 'public-my_table',
+                'type': 'HASH',
+            },
+            {
+                'field_id': 'col_1',
+                'tap_stream_name': 'public-my_table',
+                'type': 'MASK-HIDDEN',
+                'when': [{'column': 'col_2', 'equals': 'some_value'}],
+            },
+            {
+                'field_id': 'col_2',
+                'tap_stream_name': 'public-my_table',
+                'type': 'SET-NULL',
+            },
+            {
+                'field_id': 'col_3',
+                'tap_stream_name': 'public-my_other_table',
+                'type': 'HASH',
+            },
+        ]
+
+        trans = TransformationHelper.get_column_trans_in_sql_flavor(
+            table_name, transformations, SQLFlavor('postgres')
+        )
+
+        self.assertDictEqual(
+            trans,
+            {
+                '"col_1"': 'ENCODE(DIGEST((CASE WHEN ("col_2" = \'some_value\') THEN \'hidden\' ELSE "col_1" END), '
+                '\'sha256\'), \'hex\')',
+                '"col_2"': 'NULL',
+            },
+        )
+
+    def test_get_column_trans_in_sql_with_conditions_on_transformed_columns(self):
+        """
+        Test that conditions see the result of the conditional transformations before them,
+        like the separate UPDATE statements did, and not the result of the unconditional ones
+        Test should pass
+        """
+        table_name = 'public-my_table'
+
+        transformations = [
+            {
+                'field_id': 'col_1',
+                'tap_stream_name': 'public-my_table',
+                'type': 'SET-NULL',
+            },
+            {
+                'field_id': 'col_2',
+                'tap_stream_name': 'public-my_table',
+                'type': 'MASK-HIDDEN',
+                'when': [{'column': 'col_3', 'equals': None}],
+            },
+            {
+                'field_id': 'col_3',
+                'tap_stream_name': 'public-my_table',
+                'type': 'MASK-NUMBER',
+                'when': [{'column': 'col_1', 'equals': 30}, {'column': 'col_2', 'regex_match': 'secret'}],
+            },
+        ]
+
+        trans = TransformationHelper.get_column_trans_in_sql_flavor(
+            table_name, transformations, SQLFlavor('snowflake')
+        )
+
+        self.assertDictEqual(
+            trans,
+            {
+                '"COL_1"': 'NULL',
+                '"COL_2"': 'CASE WHEN ("COL_3" IS NULL) THEN \'hidden\' ELSE "COL_2" END',
+                '"COL_3"': 'CASE WHEN ("COL_1" = 30) '
+                'AND ((CASE WHEN ("COL_3" IS NULL) THEN \'hidden\' ELSE "COL_2" END) REGEXP \'secret\') '
+                'THEN 0 ELSE "COL_3" END',
+            },
+        )